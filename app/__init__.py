@@ -1,11 +1,12 @@
-import os, psycopg2
-from flask import Flask, Blueprint, render_template
+import os
+import logging
+from flask import Flask, render_template
 from flask_bcrypt import Bcrypt
 from dotenv import load_dotenv
-from app.db.db import get_db_connection, release_db_connection
+from app.db.db import init_db_pool, get_db_connection, release_db_connection
 from flask_login import LoginManager, UserMixin
-from bson.objectid import ObjectId
-from collections import namedtuple
+
+logger = logging.getLogger(__name__)
 
 # Loading Environment variables
 load_dotenv()
@@ -40,9 +41,63 @@ def create_app():
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024
 
+    # Structured logs from a background thread, tagged with a request id
+    from .services.logs import init_logging
+    init_logging(app)
+
+    # PostgreSQL pool for this process
+    init_db_pool()
+
+    # @read_only views on streaming replicas (POSTGRES_REPLICA_URLS)
+    from .db.db import init_replica_routing
+    init_replica_routing(app)
+
+    # Per-request query count/time, Server-Timing and N+1 warnings
+    from .db.instrumentation import init_sql_instrumentation
+    app.config['SQL_DEBUG_PANEL'] = os.getenv("SQL_DEBUG_PANEL", "0") == "1"
+    app.config['SQL_STRICT_BUDGET'] = os.getenv("SQL_STRICT_BUDGET", "0") == "1"
+    init_sql_instrumentation(app)
+
+    # Behind a transaction-mode pooler (POSTGRES_POOL_MODE), no statement may leave session state
+    from .db.pooler import init_pooler_guard
+    init_pooler_guard(app)
+
+    # Hot statements PREPAREd once per connection (not behind a transaction-mode pooler)
+    from .db.prepared import init_prepared_statements
+    init_prepared_statements(app)
+
+    from .db.slow_queries import init_slow_query_log
+    init_slow_query_log(app)
+
+    # Occupancy materialized views, refreshed in the background after writes
+    from .db.matviews import init_matviews
+    init_matviews(app)
+
+    # Admin dashboard/bookings counters pushed over /admin/events, fed by LISTEN/NOTIFY
+    from .services.live_stats import init_live_stats
+    init_live_stats(app)
+
+    # Per-student badge counters, cached and dropped by the same listener
+    from .services.student_counters import init_student_counters
+    init_student_counters(app)
+
+    # Content-addressed upload storage
+    app.config.setdefault('UPLOAD_STORAGE_BACKEND', os.getenv("UPLOAD_STORAGE_BACKEND", "local"))
+    app.config.setdefault('UPLOAD_S3_BUCKET', os.getenv("UPLOAD_S3_BUCKET"))
+    app.config.setdefault('UPLOAD_S3_ENDPOINT', os.getenv("UPLOAD_S3_ENDPOINT"))
+    app.config.setdefault('UPLOAD_S3_PUBLIC_URL', os.getenv("UPLOAD_S3_PUBLIC_URL"))
+    app.config.setdefault('UPLOAD_S3_ACCESS_KEY', os.getenv("UPLOAD_S3_ACCESS_KEY"))
+    app.config.setdefault('UPLOAD_S3_SECRET_KEY', os.getenv("UPLOAD_S3_SECRET_KEY"))
+
+    from .services.storage import init_storage, upload_url
+    from .services.uploads import thumbnail_key_for
+    init_storage(app)
+    app.add_template_filter(upload_url, 'upload_url')
+    app.add_template_filter(thumbnail_key_for, 'receipt_thumbnail')
+
 
     # Register blueprints
-    from .routes.auth import auth
+    from .routes.auth import auth, USER_ROLE_NAMES
     from .routes.shared import shared
     from .routes.admin import admin
     from .routes.student import student
@@ -54,6 +109,34 @@ def create_app():
 
     bcrypt.init_app(app)
 
+    # Jinja bytecode cache and {% cache %} fragments
+    from .services.fragment_cache import init_template_cache
+    init_template_cache(app)
+
+    # Fingerprinted, precompressed css/js
+    from .services.assets import init_assets
+    init_assets(app)
+
+    # Width-bucketed WebP/AVIF renditions of photos
+    from .services.images import init_images
+    init_images(app)
+
+    # Prometheus /metrics, aggregated across workers
+    from .services.metrics import init_metrics
+    init_metrics(app)
+
+    # Opt-in sampling profiler, flamegraphs via `flask profile flamegraph`
+    from .services.profiler import init_profiler
+    init_profiler(app)
+
+    # Brotli/gzip and conditional GET for html/json responses
+    from .services.compression import init_compression
+    init_compression(app)
+
+    # Command line tools
+    from .cli import register_cli
+    register_cli(app)
+
     # Seting up Flask-Login
     login_manager = LoginManager()
     login_manager.login_view = "auth.login"
@@ -63,7 +146,7 @@ def create_app():
     def load_user(user_id):
         conn = get_db_connection()
         if not conn:
-            print("Database connection failed!")
+            logger.error("Database connection failed!")
             return None
 
         try:
@@ -81,11 +164,7 @@ def create_app():
                 return None
 
             # Get user roles
-            cur.execute('''
-                SELECT r.role_name FROM user_roles ur
-                JOIN roles r ON ur.user_role_role_id = r.role_id
-                WHERE ur.user_role_user_id = %s;
-            ''', (user_id,))
+            USER_ROLE_NAMES.execute(cur, (user_id,))
             roles = [row[0] for row in cur.fetchall()]
 
             return User(*user_data, roles=roles)
@@ -97,6 +176,8 @@ def create_app():
     @app.errorhandler(Exception)
     def handle_all_errors(e):
         code = getattr(e, 'code', 500)
+        if code >= 500:
+            logger.exception("Unhandled error: %s", e)
 
         error_titles = {
             400: "Oops — That request was bad",
@@ -0,0 +1,254 @@
+"""ASGI entry point: the JSON endpoints that mostly wait on Postgres run as coroutines on
+asyncpg (app/routes/async_api.py), everything else goes to the Flask app in a thread pool.
+
+A request waiting on the database then costs a coroutine instead of a worker thread, so one
+process can keep thousands of them pending during a booking rush. The Flask views for the same
+URLs stay in place and serve them whenever the app runs as plain WSGI (`gunicorn` without
+WEB_ASGI, `python run.py`), and also take over here when the async path can't: no signed-in
+session, a user without the role the view needs, and so on.
+"""
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import parse_qs
+from werkzeug.http import parse_cookie
+from werkzeug.routing import Map, Rule
+from werkzeug.exceptions import HTTPException
+from app.db.aio import connection, init_async_pool, close_async_pool, AsyncPoolUnavailable
+from app.db.db import REPLICA_URLS, STICKY_SESSION_KEY, REPLICA_STICKY_SECONDS
+from app.services.logs import access_logger, async_request_context, request_id_from, REQUEST_ID_HEADER
+from app.services.metrics import REQUEST_LATENCY, flush
+from app.services.compression import CompressionMiddleware
+
+logger = logging.getLogger(__name__)
+
+_url_map = Map()
+_routes = {}
+
+
+class AsyncRoute:
+    def __init__(self, handler, admin, error, error_status):
+        self.handler = handler
+        self.endpoint = f"async.{handler.__name__}"
+        self.admin = admin
+        self.error = error
+        self.error_status = error_status
+
+
+def async_route(rule, methods=('GET',), admin=False, error=None, error_status=500):
+    """Serve `rule` (Flask syntax) with `async def handler(request, **values) -> (payload, status)`,
+    or -> EventStream(...) for a response that stays open.
+
+    Signed-in users only, and admins only with admin=True; anyone else is handed to the Flask
+    view. An exception in the handler is logged and answered with {'success': False, 'message':
+    error} (the exception text when error is None)."""
+    def decorator(handler):
+        route = AsyncRoute(handler, admin, error, error_status)
+        _routes[route.endpoint] = route
+        _url_map.add(Rule(rule, methods=list(methods), endpoint=route.endpoint))
+        return handler
+    return decorator
+
+
+class EventStream:
+    """A text/event-stream response: `chunks` (an async iterator of str) are sent as they come,
+    until it ends or the client goes away"""
+
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+
+
+class AsyncRequest:
+    """What an async handler gets to see of the request"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self._receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        self.cookies = parse_cookie(self.headers.get('cookie', ''))
+        self.id = request_id_from(self.headers.get(REQUEST_ID_HEADER.lower()))
+        self.session = None
+        self.user_id = None
+        self.roles = []
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self._receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def get_json(self):
+        body = await self.body()
+        return json.loads(body) if body else None
+
+
+async def user_roles(user_id):
+    async with connection() as conn:
+        rows = await conn.fetch("""
+            SELECT r.role_name
+            FROM user_roles ur
+            JOIN roles r ON ur.user_role_role_id = r.role_id
+            WHERE ur.user_role_user_id = $1
+        """, user_id)
+    return [row['role_name'] for row in rows]
+
+
+class AsyncApp:
+    def __init__(self, flask_app, wsgi_threads):
+        from a2wsgi import WSGIMiddleware
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=wsgi_threads)
+        self.compression = None
+        if flask_app.config.get('COMPRESSION_ENABLED'):
+            self.compression = CompressionMiddleware(None, min_size=flask_app.config['COMPRESSION_MIN_SIZE'],
+                                                     etags=flask_app.config['COMPRESSION_ETAGS'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            try:
+                endpoint, values = _url_map.bind('localhost', path_info=scope['path']).match(method=scope['method'])
+            except HTTPException:
+                # Not ours (or a redirect/405 Flask answers better)
+                endpoint = None
+            if endpoint and await self._serve(_routes[endpoint], values, scope, receive, send):
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await init_async_pool()
+                except Exception as e:
+                    # Like the sync pool: keep serving, and retry on the first request that needs it
+                    logger.error("Error creating async PostgreSQL pool: %s", e)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_async_pool()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _serve(self, route, values, scope, receive, send):
+        """Run an async handler; False hands the request (body still unread) to Flask"""
+        request = AsyncRequest(scope, receive)
+        session = self.flask_app.session_interface.open_session(self.flask_app, request)
+        user_id = session.get('_user_id') if session is not None else None
+        if not user_id or not str(user_id).isdigit():
+            return False
+
+        started = time.perf_counter()
+        token = async_request_context.set({'request_id': request.id, 'endpoint': route.endpoint,
+                                           'method': request.method, 'path': request.path, 'user_id': user_id})
+        try:
+            try:
+                request.roles = await user_roles(int(user_id))
+                if not request.roles or (route.admin and 'admin' not in request.roles):
+                    return False
+                request.session, request.user_id = session, int(user_id)
+                result = await route.handler(request, **values)
+            except AsyncPoolUnavailable as e:
+                logger.warning("%s %s: %s", request.method, request.path, e)
+                result = {'success': False, 'message': 'Server busy, please try again'}, 503
+            except Exception as e:
+                logger.exception("Error in %s: %s", route.endpoint, e)
+                result = {'success': False, 'message': route.error or str(e)}, route.error_status
+
+            if isinstance(result, EventStream):
+                await self._stream(request, result, send)
+                self._log(request, route, 200, started)
+                return True
+            payload, status = result
+            response = self.flask_app.json.response(payload)
+            response.status_code = status
+            response.headers[REQUEST_ID_HEADER] = request.id
+            if REPLICA_URLS and request.method not in ('GET', 'HEAD', 'OPTIONS') and status < 400:
+                # Same read-your-writes stickiness as init_replica_routing() gives the Flask views
+                session[STICKY_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+                self.flask_app.session_interface.save_session(self.flask_app, session, response)
+            await self._send(request, response, send)
+            self._log(request, route, status, started)
+            return True
+        finally:
+            async_request_context.reset(token)
+
+    def _log(self, request, route, status, started):
+        duration = time.perf_counter() - started
+        access_logger.log(logging.WARNING if status >= 500 else logging.INFO,
+                          f"{request.method} {request.path} {status}",
+                          extra={'status': status, 'duration_ms': round(duration * 1000, 2)})
+        REQUEST_LATENCY.observe(duration, blueprint='async', endpoint=route.endpoint,
+                                method=request.method, status=status)
+        flush()
+
+    async def _stream(self, request, stream, send):
+        headers = {'Content-Type': 'text/event-stream; charset=utf-8', **stream.headers,
+                   REQUEST_ID_HEADER: request.id}
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()],
+        })
+
+        async def disconnected():
+            while (await request._receive())['type'] != 'http.disconnect':
+                pass
+        gone = asyncio.ensure_future(disconnected())
+        chunks = stream.chunks.__aiter__()
+        try:
+            while True:
+                chunk = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait((chunk, gone), return_when=asyncio.FIRST_COMPLETED)
+                if gone.done():
+                    chunk.cancel()
+                    await asyncio.gather(chunk, return_exceptions=True)
+                    break
+                try:
+                    body = chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+            if not gone.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            gone.cancel()
+            await chunks.aclose()
+
+    async def _send(self, request, response, send):
+        status, headers, body = response.status, response.headers.to_wsgi_list(), response.get_data()
+        if self.compression:
+            # Same Brotli/gzip and ETag handling the Flask responses get
+            environ = {'REQUEST_METHOD': request.method,
+                       'HTTP_ACCEPT_ENCODING': request.headers.get('accept-encoding', ''),
+                       'HTTP_IF_NONE_MATCH': request.headers.get('if-none-match', '')}
+            if self.compression._should_buffer(environ, headers):
+                started = {}
+
+                def start_response(status, headers):
+                    started.update(status=status, headers=headers)
+                body = b''.join(self.compression._finish(environ, start_response, status, headers, body))
+                status, headers = started['status'], started['headers']
+
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(flask_app, wsgi_threads=10):
+    """Wrap the Flask app; `wsgi_threads` is how many Flask requests run at once"""
+    from app.routes import async_api  # noqa: F401  (registers the async routes)
+    # Pages that hold an event stream open only do so when it costs a coroutine, not a thread
+    flask_app.config['ASGI'] = True
+    return AsyncApp(flask_app, wsgi_threads)
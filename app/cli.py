@@ -0,0 +1,241 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app.db.db import get_db_connection, release_db_connection
+
+uploads_cli = AppGroup('uploads', help='Manage stored uploads.')
+assets_cli = AppGroup('assets', help='Build static assets.')
+images_cli = AppGroup('images', help='Manage responsive image variants.')
+db_cli = AppGroup('db', help='Database diagnostics and maintenance.')
+profile_cli = AppGroup('profile', help='Sampled request profiles.')
+
+
+@uploads_cli.command('gc')
+@click.option('--grace', default='1 hour', help='Keep unreferenced blobs younger than this.')
+def uploads_gc(grace):
+    """Delete blobs that no payment references any more"""
+    from app.services.storage import collect_garbage
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        removed = collect_garbage(cur, grace)
+        click.echo(f"Removed {removed} unreferenced blob(s)")
+    finally:
+        release_db_connection(conn)
+
+
+@uploads_cli.command('import-legacy')
+def uploads_import_legacy():
+    """Move old flat receipt files into the content-addressed store"""
+    from app.services.storage import import_legacy_uploads
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        imported = import_legacy_uploads(cur, current_app.config['UPLOAD_FOLDER'])
+        conn.commit()
+        click.echo(f"Imported {imported} receipt(s)")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+
+@assets_cli.command('build')
+def assets_build():
+    """Fingerprint css/js and write their .br/.gz variants"""
+    from app.services.assets import build_assets
+
+    manifest = build_assets(current_app.static_folder)
+    for source, hashed in manifest.items():
+        click.echo(f"{source} -> {hashed}")
+
+
+@images_cli.command('build')
+def images_build():
+    """Pre-render every width bucket for the photos under static/images"""
+    from app.services.images import build_variants, variant_cache_dir
+
+    built = build_variants(current_app.static_folder, variant_cache_dir())
+    click.echo(f"{built} variant(s) ready")
+
+
+@db_cli.command('slow-queries')
+@click.option('--limit', default=20, help='How many statements to show.')
+@click.option('--order', 'order_by', default='total_ms',
+              type=click.Choice(['total_ms', 'count', 'p95_ms', 'max_ms']))
+@click.option('--plans', is_flag=True, help='Print the captured EXPLAIN plan of each statement.')
+@click.option('--reset', is_flag=True, help='Clear the recorded statistics instead.')
+def db_slow_queries(limit, order_by, plans, reset):
+    """Top slow statements recorded by every worker"""
+    import json
+    from app.db.slow_queries import top_offenders, reset_snapshots, slow_query_dir
+
+    snapshot_dir = slow_query_dir(current_app)
+    if reset:
+        reset_snapshots(snapshot_dir)
+        click.echo("Slow query statistics cleared")
+        return
+
+    offenders = top_offenders(snapshot_dir, limit=limit, order_by=order_by)
+    if not offenders:
+        click.echo(f"No statements slower than {current_app.config['SLOW_QUERY_MS']} ms recorded")
+        return
+
+    click.echo(f"{'count':>7} {'total ms':>10} {'p50':>8} {'p95':>8} {'max':>8}  query")
+    for row in offenders:
+        click.echo(f"{row['count']:>7} {row['total_ms']:>10.1f} {row['p50_ms']:>8.1f} "
+                   f"{row['p95_ms']:>8.1f} {row['max_ms']:>8.1f}  {row['query'][:160]}")
+        if plans and row['plan']:
+            click.echo(json.dumps(row['plan'], indent=2))
+
+
+@db_cli.command('migrate')
+@click.option('--target', type=int, default=None, help='Stop after this migration version.')
+@click.option('--dry-run', is_flag=True, help='List what would be applied without running it.')
+def db_migrate(target, dry_run):
+    """Apply pending migrations from app/db/migrations in order"""
+    from app.db.migrate import connect, migrate, MigrationError
+
+    conn = connect()
+    try:
+        applied = migrate(conn, target=target, dry_run=dry_run)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+
+    if not applied:
+        click.echo("Database is up to date")
+    for migration, duration_ms in applied:
+        suffix = '' if dry_run else f" ({duration_ms} ms)"
+        click.echo(f"{'Would apply' if dry_run else 'Applied'} {migration.version:04d}_{migration.name}{suffix}")
+
+
+@db_cli.command('migrations')
+def db_migrations():
+    """Show which migrations have been applied"""
+    from app.db.migrate import connect, migration_status
+
+    conn = connect()
+    try:
+        status = migration_status(conn)
+    finally:
+        conn.close()
+
+    for migration, row in status:
+        if row is None:
+            state = 'pending'
+        elif row[2] != migration.checksum:
+            state = 'CHANGED since applied'
+        else:
+            state = f"applied {row[3]:%Y-%m-%d %H:%M} in {row[4]} ms"
+        click.echo(f"{migration.version:04d}_{migration.name:<40} {state}")
+
+
+@db_cli.command('refresh-views')
+def db_refresh_views():
+    """Refresh the occupancy materialized views now"""
+    from app.db.migrate import connect
+    from app.db.matviews import refresh_views, MATERIALIZED_VIEWS
+
+    conn = connect()
+    try:
+        refresh_views(conn)
+    finally:
+        conn.close()
+    click.echo(f"Refreshed {', '.join(MATERIALIZED_VIEWS)}")
+
+
+@db_cli.command('partitions')
+@click.option('--months-ahead', default=3, help='Also create partitions for this many future months.')
+def db_partitions(months_ahead):
+    """Create upcoming monthly partitions and list the existing ones"""
+    from app.db.migrate import connect
+    from app.db.partitions import ensure_partitions, list_partitions
+
+    conn = connect()
+    try:
+        created = ensure_partitions(conn, months_ahead=months_ahead)
+        partitions = list_partitions(conn)
+    finally:
+        conn.close()
+
+    for name in created:
+        click.echo(f"Created {name}")
+    for partition in partitions:
+        click.echo(f"{partition.name:<28} ~{partition.rows:>10} rows {partition.size_bytes / 1024 / 1024:>9.1f} MB")
+
+
+@db_cli.command('archive')
+@click.option('--retention-semesters', default=6, help='Past semesters to keep in the live tables.')
+@click.option('--to', 'to', default='table', type=click.Choice(['table', 'parquet']),
+              help='archive.<table>_<year>_s<n> tables, or zstd Parquet files (needs pyarrow).')
+@click.option('--out', 'out_dir', default='archive', help='Directory for Parquet files.')
+@click.option('--dry-run', is_flag=True, help='Show what would be archived without changing anything.')
+def db_archive(retention_semesters, to, out_dir, dry_run):
+    """Move semesters older than the retention window out of bookings and payments"""
+    from app.db.migrate import connect
+    from app.db.partitions import archive_semesters, ArchiveError
+
+    conn = connect()
+    try:
+        archived = archive_semesters(conn, retention_semesters, to=to, out_dir=out_dir, dry_run=dry_run)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+
+    if not archived:
+        click.echo("Nothing older than the retention window")
+    for semester in archived:
+        click.echo(f"{'Would archive' if dry_run else 'Archived'} {semester.table} {semester.year} "
+                   f"semester {semester.semester}: {semester.rows} rows from {len(semester.partitions)} "
+                   f"partitions -> {semester.destination}")
+
+
+@profile_cli.command('flamegraph')
+@click.option('--out', 'out_dir', default='flamegraphs', help='Directory to write the SVGs to.')
+@click.option('--endpoint', default=None, help='Only this endpoint, e.g. admin.dashboard.')
+@click.option('--folded', is_flag=True, help='Also write the merged collapsed stacks next to each SVG.')
+def profile_flamegraph(out_dir, endpoint, folded):
+    """Merge the recorded samples into one flamegraph per endpoint"""
+    import os
+    from app.services.profiler import load_samples, render_flamegraph, profile_dir
+
+    samples = load_samples(profile_dir(current_app))
+    if endpoint:
+        samples = {endpoint: samples[endpoint]} if endpoint in samples else {}
+    if not samples:
+        click.echo("No profiles recorded")
+        return
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, counts in sorted(samples.items()):
+        total = sum(counts.values())
+        path = os.path.join(out_dir, f"{name}.svg")
+        with open(path, 'w') as f:
+            f.write(render_flamegraph(counts, f"{name} ({total} samples)"))
+        if folded:
+            with open(os.path.join(out_dir, f"{name}.folded"), 'w') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in counts.most_common())
+        click.echo(f"{path}: {total} samples")
+
+
+@profile_cli.command('reset')
+def profile_reset():
+    """Delete every recorded profile"""
+    from app.services.profiler import reset_samples, profile_dir
+
+    reset_samples(profile_dir(current_app))
+    click.echo("Profiles cleared")
+
+
+def register_cli(app):
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(profile_cli)
@@ -0,0 +1,89 @@
+import os
+import logging
+from contextlib import asynccontextmanager
+from .db import POSTGRES_CONFIG, POOL_MODE, POOL_MIN_CONNECTIONS
+from .instrumentation import notify_query_listeners
+
+logger = logging.getLogger(__name__)
+
+# One asyncpg pool per worker process, shared by every request coroutine in it. Thousands of
+# requests can wait on it at once; only this many hold a Postgres connection at a time.
+ASYNC_POOL_MAX_CONNECTIONS = int(os.getenv("POSTGRES_ASYNC_POOL_MAX", 20))
+# How long a request waits for a free connection before it gets a 503
+ASYNC_ACQUIRE_TIMEOUT = float(os.getenv("POSTGRES_ASYNC_ACQUIRE_TIMEOUT", 10))
+
+_pool = None
+
+
+class AsyncPoolUnavailable(Exception):
+    """No connection could be had within ASYNC_ACQUIRE_TIMEOUT"""
+
+
+def _connect_kwargs():
+    config = {
+        'database': POSTGRES_CONFIG.get('dbname'),
+        'user': POSTGRES_CONFIG.get('user'),
+        'password': POSTGRES_CONFIG.get('password'),
+        'host': POSTGRES_CONFIG.get('host'),
+        'port': POSTGRES_CONFIG.get('port'),
+    }
+    config = {key: value for key, value in config.items() if value}
+    if POOL_MODE == 'transaction':
+        # asyncpg caches server-side prepared statements per connection, which a
+        # transaction-mode pooler can't follow (see app/db/pooler.py)
+        config['statement_cache_size'] = 0
+    return config
+
+
+def _log_query(record):
+    notify_query_listeners(None, record.query, record.elapsed)
+
+
+async def _setup_connection(conn):
+    conn.add_query_logger(_log_query)
+
+
+async def init_async_pool(minconn=POOL_MIN_CONNECTIONS, maxconn=ASYNC_POOL_MAX_CONNECTIONS):
+    """Open the pool on the running event loop (ASGI lifespan startup)"""
+    global _pool
+    import asyncpg
+
+    if _pool is None:
+        _pool = await asyncpg.create_pool(min_size=minconn, max_size=maxconn, init=_setup_connection,
+                                          **_connect_kwargs())
+        logger.info("Async PostgreSQL pool created successfully!")
+    return _pool
+
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+    _pool = None
+
+
+@asynccontextmanager
+async def connection():
+    """A pooled asyncpg connection, released on exit. Statements use $1, $2... placeholders.
+
+        async with connection() as conn:
+            rows = await conn.fetch("SELECT ... WHERE room_hostel_id = $1", hostel_id)
+    """
+    pool = _pool or await init_async_pool()
+    try:
+        conn = await pool.acquire(timeout=ASYNC_ACQUIRE_TIMEOUT)
+    except TimeoutError:
+        raise AsyncPoolUnavailable(f"No database connection free after {ASYNC_ACQUIRE_TIMEOUT} s")
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+@asynccontextmanager
+async def transaction():
+    """connection() inside a transaction: committed on exit, rolled back if the block raises"""
+    async with connection() as conn:
+        async with conn.transaction():
+            yield conn
+
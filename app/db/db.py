@@ -1,8 +1,18 @@
 import os
+import re
+import time
+import threading
+import logging
+from functools import wraps
+from contextlib import contextmanager
 import psycopg2
 from psycopg2 import pool
-from flask_pymongo import PyMongo
+from psycopg2.extensions import parse_dsn
 from dotenv import load_dotenv
+from flask import g, session, request, has_request_context
+from .instrumentation import InstrumentedConnection
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -15,24 +25,281 @@ POSTGRES_CONFIG = {
     "host": os.getenv("POSTGRES_HOST"),
     "port": os.getenv("POSTGRES_PORT"),
 }
+# "transaction" when POSTGRES_HOST/PORT point at a transaction-mode pooler such as PgBouncer:
+# nothing may rely on session state then (see app/db/pooler.py)
+POOL_MODE = os.getenv("POSTGRES_POOL_MODE", "session")
+# Migrations, advisory locks and LISTEN need a real session; behind a pooler, set this to Postgres itself
+POSTGRES_DIRECT_CONFIG = {**POSTGRES_CONFIG, **parse_dsn(os.getenv("POSTGRES_DIRECT_URL") or "")}
+POOL_MIN_CONNECTIONS = int(os.getenv("POSTGRES_POOL_MIN", 1))
+POOL_MAX_CONNECTIONS = int(os.getenv("POSTGRES_POOL_MAX", 10))
+
+# Streaming replicas for @read_only views, as postgresql:// URLs separated by commas.
+# Anything a URL leaves out (user, password, dbname) comes from POSTGRES_CONFIG.
+REPLICA_URLS = [url for url in re.split(r'[\s,]+', os.getenv("POSTGRES_REPLICA_URLS", "")) if url]
+# Replicas further behind than this are skipped, and reads go to the primary
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("POSTGRES_REPLICA_MAX_LAG", 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv("POSTGRES_REPLICA_CHECK_INTERVAL", 2))
+# After a write, the session reads from the primary until any replica still in use must have replayed it
+REPLICA_STICKY_SECONDS = REPLICA_MAX_LAG_SECONDS + REPLICA_CHECK_INTERVAL
+STICKY_SESSION_KEY = '_db_primary_until'
+
+# PostgreSQL Connection Pool, opened by init_db_pool() rather than at import
+postgres_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Connections of postgres_pool handed out and not yet released (the /metrics pool gauge)
+_checked_out = 0
+_checked_out_lock = threading.Lock()
+
+
+def init_db_pool(minconn=POOL_MIN_CONNECTIONS, maxconn=POOL_MAX_CONNECTIONS):
+    """Open the pool for this process. Safe to call again, e.g. after a fork."""
+    global postgres_pool, _pool_pid, _checked_out
+    with _pool_lock:
+        if postgres_pool and _pool_pid == os.getpid():
+            return postgres_pool
+
+        try:
+            # Threaded: the dev server and gthread workers hand out connections from several threads
+            postgres_pool = pool.ThreadedConnectionPool(minconn, maxconn, connection_factory=InstrumentedConnection,
+                                                        **POSTGRES_CONFIG)
+            _pool_pid = os.getpid()
+            _checked_out = 0
+            logger.info("PostgreSQL connection pool created successfully!")
+        except Exception as e:
+            logger.error("Error creating PostgreSQL connection pool: %s", e)
+            postgres_pool = None
+        return postgres_pool
 
-# PostgreSQL Connection Pool
-try:
-    postgres_pool = pool.SimpleConnectionPool(1, 10, **POSTGRES_CONFIG)
-    print("PostgreSQL connection pool created successfully!")
-except Exception as e:
-    print(f"Error creating PostgreSQL connection pool: {e}")
+
+def close_db_pool():
+    global postgres_pool, _pool_pid, _checked_out
+    if postgres_pool and _pool_pid == os.getpid():
+        postgres_pool.closeall()
     postgres_pool = None
+    _pool_pid = None
+    _checked_out = 0
+
+
+def pool_usage():
+    """(connections in use, most the pool will open) for this process, or None without a pool"""
+    if not postgres_pool:
+        return None
+    return _checked_out, postgres_pool.maxconn
+
+
+def warm_db_pool(count=POOL_MIN_CONNECTIONS):
+    """Open and check `count` connections up front so the first requests don't pay for it"""
+    conns = []
+    try:
+        for _ in range(count):
+            conn = get_db_connection()
+            if not conn:
+                break
+            conns.append(conn)
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+    except Exception as e:
+        logger.error("Error warming PostgreSQL connection pool: %s", e)
+        return 0
+    finally:
+        for conn in conns:
+            release_db_connection(conn)
+    return len(conns)
+
 
 # Getting PostgreSQL connection
 def get_db_connection():
+    global _checked_out
+    # Inside a @read_only view: a replica when one is keeping up
+    if has_request_context() and g.get('_db_read_only'):
+        conn = get_replica_connection()
+        if conn:
+            return conn
+    # A pool inherited across fork() shares sockets with the parent; open our own
+    if not postgres_pool or _pool_pid != os.getpid():
+        init_db_pool()
     if postgres_pool:
-        return postgres_pool.getconn()
+        try:
+            conn = postgres_pool.getconn()
+        except pool.PoolError:
+            from app.services.metrics import DB_POOL_EXHAUSTED
+            DB_POOL_EXHAUSTED.inc()
+            raise
+        with _checked_out_lock:
+            _checked_out += 1
+        return conn
     else:
-        print("No database connection available!")
+        logger.error("No database connection available!")
         return None
 
 # Releasing PostgreSQL connection
 def release_db_connection(conn):
-    if conn and postgres_pool:
+    global _checked_out
+    replica = getattr(conn, 'replica', None)
+    if replica:
+        replica.putconn(conn)
+    elif conn and postgres_pool:
         postgres_pool.putconn(conn)
+        with _checked_out_lock:
+            _checked_out = max(_checked_out - 1, 0)
+
+
+####################### READ REPLICAS ###########################
+# Replica lag: zero while the replica has replayed everything it received (an idle primary
+# sends nothing, and the last replay timestamp would otherwise keep growing)
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END;
+"""
+
+_replicas = []
+_replicas_pid = None
+_replicas_lock = threading.Lock()
+_next_replica = 0
+
+
+class Replica:
+    """One streaming replica: its own pool, opened on first use, and a cached lag measurement"""
+
+    def __init__(self, url):
+        self.config = {**POSTGRES_CONFIG, **parse_dsn(url)}
+        self.name = f"{self.config.get('host')}:{self.config.get('port') or 5432}"
+        self.pool = None
+        self.lag = None
+        self.checked_at = 0.0
+        self.usable = True
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        """A pooled connection, or None while the replica is unreachable or too far behind"""
+        now = time.monotonic()
+        if not self.usable and now - self.checked_at < REPLICA_CHECK_INTERVAL:
+            return None
+        try:
+            with self._lock:
+                if self.pool is None:
+                    self.pool = pool.ThreadedConnectionPool(0, POOL_MAX_CONNECTIONS,
+                                                            connection_factory=InstrumentedConnection,
+                                                            **self.config)
+            conn = self.pool.getconn()
+        except (psycopg2.Error, pool.PoolError) as e:
+            self._mark(False, None, "unavailable: %s", e)
+            return None
+
+        if now - self.checked_at >= REPLICA_CHECK_INTERVAL:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(REPLICA_LAG_QUERY)
+                    lag = float(cur.fetchone()[0])
+                conn.rollback()
+            except psycopg2.Error as e:
+                # A broken connection: drop it rather than hand it out again
+                self.pool.putconn(conn, close=True)
+                self._mark(False, None, "unavailable: %s", e)
+                return None
+            self._mark(lag <= REPLICA_MAX_LAG_SECONDS, lag, "%.1f s behind", lag)
+        if not self.usable:
+            self.pool.putconn(conn)
+            return None
+
+        conn.replica = self
+        if not conn.readonly:
+            # Catches a write that slipped into a @read_only view, even when the URL points at a primary
+            conn.readonly = True
+        return conn
+
+    def putconn(self, conn):
+        if self.pool:
+            self.pool.putconn(conn)
+
+    def _mark(self, usable, lag, reason, *args):
+        if usable != self.usable:
+            log = logger.info if usable else logger.warning
+            log("Replica %s %s: " + reason, self.name, 'back in use' if usable else 'skipped', *args)
+        self.usable, self.lag, self.checked_at = usable, lag, time.monotonic()
+
+    def close(self):
+        if self.pool:
+            self.pool.closeall()
+        self.pool = None
+
+
+def get_replicas():
+    """This process's replicas; like the primary pool, rebuilt after a fork"""
+    global _replicas, _replicas_pid
+    with _replicas_lock:
+        if _replicas_pid != os.getpid():
+            _replicas = [Replica(url) for url in REPLICA_URLS]
+            _replicas_pid = os.getpid()
+        return _replicas
+
+
+def close_replica_pools():
+    for replica in (_replicas if _replicas_pid == os.getpid() else []):
+        replica.close()
+
+
+def sticky_to_primary():
+    """True for a short while after this session wrote something (read-your-writes)"""
+    return has_request_context() and session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+def stick_to_primary():
+    """Send this session's reads to the primary until replicas have caught up with its write"""
+    if has_request_context() and REPLICA_URLS:
+        session[STICKY_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+
+
+def get_replica_connection():
+    """A connection to a replica that is keeping up, round robin; None means use the primary"""
+    global _next_replica
+    replicas = get_replicas()
+    if not replicas or sticky_to_primary():
+        return None
+    start = _next_replica
+    _next_replica += 1
+    for offset in range(len(replicas)):
+        conn = replicas[(start + offset) % len(replicas)].getconn()
+        if conn:
+            return conn
+    return None
+
+
+@contextmanager
+def reader():
+    """Connection for reads that can be a few seconds stale: a replica when one is keeping up,
+    otherwise the primary. Released on exit.
+
+        with reader() as conn:
+            ...
+    """
+    conn = get_replica_connection() or get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
+
+def read_only(view_func):
+    """Route every get_db_connection() in this view to a replica (see reader())"""
+    @wraps(view_func)
+    def decorated_view(*args, **kwargs):
+        g._db_read_only = True
+        return view_func(*args, **kwargs)
+    return decorated_view
+
+
+def init_replica_routing(app):
+    """Any successful write request (POST/PUT/PATCH/DELETE) makes the session stick to the primary"""
+    if not REPLICA_URLS:
+        return
+
+    @app.after_request
+    def stick_after_write(response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            stick_to_primary()
+        return response
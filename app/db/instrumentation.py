@@ -0,0 +1,237 @@
+import re
+import time
+import logging
+from functools import wraps
+from psycopg2 import extensions, sql
+from flask import g, request, has_request_context
+from markupsafe import escape
+
+# Same statement this many times in one request smells like N+1
+N_PLUS_ONE_THRESHOLD = 5
+SLOWEST_KEPT = 5
+
+logger = logging.getLogger('nyumbani.sql')
+
+_WHITESPACE = re.compile(r'\s+')
+_query_listeners = []
+_statement_guards = []
+_instrumented_cursors = {}
+_settings = {'comments': False}
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a view runs more statements than it is allowed"""
+
+
+def add_query_listener(listener):
+    """Call listener(cursor, statement, duration) after every statement"""
+    if listener not in _query_listeners:
+        _query_listeners.append(listener)
+
+
+def add_statement_guard(guard):
+    """Call guard(cursor, statement) before every statement; it may raise to stop the statement"""
+    if guard not in _statement_guards:
+        _statement_guards.append(guard)
+
+
+def notify_query_listeners(cursor, statement, duration):
+    """Report a finished statement; cursor is None for statements run outside psycopg2 (app/db/aio.py)"""
+    for listener in _query_listeners:
+        try:
+            listener(cursor, statement, duration)
+        except Exception:
+            logger.exception("Error in query listener %r", listener)
+
+
+def statement_text(cursor, query):
+    if isinstance(query, sql.Composable):
+        return query.as_string(cursor)
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    return query
+
+
+def fingerprint(statement):
+    """Whitespace-insensitive key; our statements are parameterised so this groups repeats"""
+    return _WHITESPACE.sub(' ', statement).strip().rstrip(';')
+
+
+def tag_query(query):
+    """Prefix the statement with the request that ran it, so pg_stat_activity and the
+    Postgres logs can be matched against the application logs"""
+    if not _settings['comments'] or not has_request_context():
+        return query
+    request_id = g.get('request_id')
+    if not request_id:
+        return query
+    # request ids are validated to [A-Za-z0-9._-], so nothing here can close the comment or look like a placeholder
+    comment = f"/* request_id={request_id}, endpoint={request.endpoint} */ "
+    if isinstance(query, sql.Composable):
+        return sql.Composed([sql.SQL(comment), query])
+    if isinstance(query, bytes):
+        return comment.encode() + query
+    return comment + query
+
+
+####################### PER-REQUEST STATS ###########################
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []
+        self.repeats = {}
+
+    def record(self, statement, duration):
+        key = fingerprint(statement)
+        self.count += 1
+        self.total += duration
+        self.repeats[key] = self.repeats.get(key, 0) + 1
+        self.slowest.append((duration, key))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[SLOWEST_KEPT:]
+
+    def n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        return {key: count for key, count in self.repeats.items() if count >= threshold}
+
+    def summary(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.total * 1000, 2),
+            'slowest': [{'ms': round(d * 1000, 2), 'sql': s[:300]} for d, s in self.slowest],
+            'n_plus_one': [{'count': c, 'sql': s[:300]} for s, c in self.n_plus_one().items()],
+        }
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('_query_stats')
+    return None
+
+
+def _record_request_stats(cursor, statement, duration):
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+add_query_listener(_record_request_stats)
+
+
+####################### CONNECTION / CURSOR FACTORY ###########################
+class InstrumentedCursorMixin:
+    def execute(self, query, vars=None):
+        if _statement_guards:
+            self._guard(query)
+        started = time.perf_counter()
+        try:
+            return super().execute(tag_query(query), vars)
+        finally:
+            self._notify(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        if _statement_guards:
+            self._guard(query)
+        started = time.perf_counter()
+        try:
+            return super().executemany(tag_query(query), vars_list)
+        finally:
+            self._notify(query, time.perf_counter() - started)
+
+    def _guard(self, query):
+        statement = statement_text(self, query)
+        for guard in _statement_guards:
+            guard(self, statement)
+
+    def _notify(self, query, duration):
+        notify_query_listeners(self, statement_text(self, query), duration)
+
+
+def instrumented_cursor_class(cursor_class):
+    """Subclass of any cursor_factory (plain, RealDictCursor, ...) that reports its statements"""
+    if issubclass(cursor_class, InstrumentedCursorMixin):
+        return cursor_class
+    if cursor_class not in _instrumented_cursors:
+        _instrumented_cursors[cursor_class] = type(
+            f"Instrumented{cursor_class.__name__}", (InstrumentedCursorMixin, cursor_class), {})
+    return _instrumented_cursors[cursor_class]
+
+
+class InstrumentedConnection(extensions.connection):
+    """connection_factory for the pool; every cursor it hands out is instrumented"""
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = instrumented_cursor_class(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+
+####################### FLASK INTEGRATION ###########################
+def query_budget(max_queries):
+    """Allow a view at most `max_queries` statements (enforced when SQL_STRICT_BUDGET is on)"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def decorated_view(*args, **kwargs):
+            g._query_budget = max_queries
+            return view_func(*args, **kwargs)
+        return decorated_view
+    return decorator
+
+
+def _debug_panel(summary):
+    rows = ''.join(
+        f"<li>{item['ms']} ms &mdash; <code>{escape(item['sql'])}</code></li>" for item in summary['slowest'])
+    repeats = ''.join(
+        f"<li><strong>{item['count']}&times;</strong> <code>{escape(item['sql'])}</code></li>"
+        for item in summary['n_plus_one'])
+    return (
+        '<details id="sql-debug-panel" style="position:fixed;bottom:8px;right:8px;z-index:9999;'
+        'max-width:40rem;max-height:60vh;overflow:auto;background:#111;color:#eee;font:12px monospace;'
+        'padding:6px 10px;border-radius:6px;opacity:.92">'
+        f"<summary>SQL: {summary['queries']} queries, {summary['db_ms']} ms</summary>"
+        f"<p>Slowest</p><ol>{rows}</ol>"
+        + (f"<p style=\"color:#f88\">Possible N+1</p><ul>{repeats}</ul>" if repeats else '')
+        + '</details>'
+    )
+
+
+def init_sql_instrumentation(app):
+    app.config.setdefault('SQL_DEBUG_PANEL', False)
+    app.config.setdefault('SQL_STRICT_BUDGET', False)
+    app.config.setdefault('SQL_QUERY_BUDGET', None)
+    app.config.setdefault('SQL_LOG_REQUESTS', True)
+    app.config.setdefault('SQL_COMMENTS', True)
+    _settings['comments'] = app.config['SQL_COMMENTS']
+
+    @app.before_request
+    def start_query_stats():
+        g._query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('_query_stats', None)
+        if stats is None:
+            return response
+        summary = stats.summary()
+
+        timing = f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries"'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+
+        if app.config['SQL_LOG_REQUESTS'] and stats.count:
+            logger.info("%s queries in %s ms", summary['queries'], summary['db_ms'],
+                        extra={'status': response.status_code, **summary})
+        for statement, count in stats.n_plus_one().items():
+            logger.warning("Possible N+1 in %s: %sx %s", request.endpoint, count, statement[:200])
+
+        if (app.config['SQL_DEBUG_PANEL'] or app.debug) and response.mimetype == 'text/html' \
+                and not response.direct_passthrough:
+            body = response.get_data(as_text=True)
+            if '</body>' in body:
+                response.set_data(body.replace('</body>', _debug_panel(summary) + '</body>', 1))
+
+        budget = g.get('_query_budget', app.config['SQL_QUERY_BUDGET'])
+        if app.config['SQL_STRICT_BUDGET'] and budget is not None and stats.count > budget:
+            raise QueryBudgetExceeded(
+                f"{request.endpoint} ran {stats.count} queries, budget is {budget}")
+        return response
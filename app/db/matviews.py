@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import threading
+from psycopg2 import sql
+from .db import get_db_connection, release_db_connection
+
+# Refresh order: hostel_occupancy is built on room_occupancy
+MATERIALIZED_VIEWS = ('room_occupancy', 'hostel_occupancy')
+# Wait for writes to go quiet this long before refreshing...
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+# ...but never hold a refresh back longer than this while they keep coming
+DEFAULT_MAX_DELAY_SECONDS = 15.0
+
+logger = logging.getLogger(__name__)
+
+_refresher = None
+
+
+def refresh_views(conn, views=MATERIALIZED_VIEWS):
+    """REFRESH ... CONCURRENTLY each view in order: readers keep the old rows until the new ones commit"""
+    cur = conn.cursor()
+    try:
+        for view in views:
+            started = time.perf_counter()
+            cur.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {};").format(sql.Identifier(view)))
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            cur.execute("""
+                INSERT INTO materialized_view_refreshes (view_name, view_refreshed_at, view_refresh_ms)
+                VALUES (%s, NOW(), %s)
+                ON CONFLICT (view_name) DO UPDATE
+                SET view_refreshed_at = EXCLUDED.view_refreshed_at, view_refresh_ms = EXCLUDED.view_refresh_ms;
+            """, (view, duration_ms))
+            conn.commit()
+            logger.debug("Refreshed %s in %s ms", view, duration_ms)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def view_freshness(cur, view):
+    """Freshness metadata for a JSON response that serves `view`; needs a RealDictCursor"""
+    cur.execute("""
+        SELECT view_refreshed_at FROM materialized_view_refreshes WHERE view_name = %s;
+    """, (view,))
+    return freshness(view, cur.fetchone())
+
+
+def freshness(view, row):
+    """view_freshness() from an already fetched view_refreshed_at row, e.g. from asyncpg.
+    Only the refresh time: it changes with the rows, so the body (and its ETag) stays the same
+    between refreshes. Clients work out the age from it."""
+    return {
+        'source': view,
+        'refreshed_at': row['view_refreshed_at'].isoformat() if row else None,
+    }
+
+
+class Refresher:
+    """Debounced background refresh of the materialized views, one thread per process.
+
+    A burst of bookings during registration becomes one refresh once writes pause for
+    `debounce` seconds, or after `max_delay` seconds at the latest. The thread starts with
+    the first write, so nothing is running in the gunicorn master before the fork."""
+
+    def __init__(self, debounce, max_delay):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._first_request = None
+        self._last_request = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def request(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='matview-refresher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _due_in(self):
+        with self._lock:
+            if self._first_request is None:
+                return None
+            now = time.monotonic()
+            return max(0.0, min(self._last_request + self.debounce, self._first_request + self.max_delay) - now)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            due_in = self._due_in()
+            while due_in:
+                # A new write while waiting pushes the refresh back (up to max_delay)
+                self._wake.wait(due_in)
+                self._wake.clear()
+                due_in = self._due_in()
+            if due_in is None:
+                continue
+
+            with self._lock:
+                # Writes from here on need another refresh; they may miss this one's snapshot
+                self._first_request = self._last_request = None
+            conn = None
+            try:
+                conn = get_db_connection()
+                refresh_views(conn)
+            except Exception as e:
+                logger.exception("Materialized view refresh failed: %s", e)
+            finally:
+                if conn:
+                    release_db_connection(conn)
+
+
+def schedule_refresh():
+    """Call after committing a change to bookings, rooms, room_images or hostels"""
+    if _refresher is not None:
+        _refresher.request()
+
+
+def init_matviews(app):
+    global _refresher
+    app.config.setdefault('MATVIEW_REFRESH_DEBOUNCE', float(os.getenv("MATVIEW_REFRESH_DEBOUNCE", DEFAULT_DEBOUNCE_SECONDS)))
+    app.config.setdefault('MATVIEW_REFRESH_MAX_DELAY', float(os.getenv("MATVIEW_REFRESH_MAX_DELAY", DEFAULT_MAX_DELAY_SECONDS)))
+    _refresher = Refresher(app.config['MATVIEW_REFRESH_DEBOUNCE'], app.config['MATVIEW_REFRESH_MAX_DELAY'])
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import hashlib
+import logging
+from collections import namedtuple
+import psycopg2
+from .db import POSTGRES_DIRECT_CONFIG
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Any constant works; it only has to be the same for every runner
+ADVISORY_LOCK_KEY = 0x6E79756D
+# Put this line in a migration that can't run inside a transaction (VACUUM, ALTER TYPE ... ADD VALUE);
+# files using CONCURRENTLY are detected on their own
+NO_TRANSACTION = '-- migrate:no-transaction'
+
+logger = logging.getLogger(__name__)
+
+_FILENAME = re.compile(r'^(\d{4})_([a-z0-9_]+)\.sql$')
+_STATEMENT_END = re.compile(r';\s*$', re.MULTILINE)
+_CONCURRENTLY = re.compile(r'\bCONCURRENTLY\b', re.IGNORECASE)
+
+Migration = namedtuple('Migration', 'version name path sql checksum transactional')
+
+
+class MigrationError(Exception):
+    pass
+
+
+####################### DISCOVERY ###########################
+def discover(directory=MIGRATIONS_DIR):
+    """Migration files in version order; NNNN_name.sql"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        path = os.path.join(directory, filename)
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        migrations.append(Migration(
+            version=int(match.group(1)), name=match.group(2), path=path, sql=text,
+            checksum=hashlib.sha256(text.encode()).hexdigest(),
+            transactional=NO_TRANSACTION not in text and not _CONCURRENTLY.search(text),
+        ))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def split_statements(text):
+    """One statement per chunk for no-transaction migrations, which psycopg2 would otherwise
+    send as a single implicit transaction. Statements must end with `;` at the end of a line."""
+    statements = []
+    for chunk in _STATEMENT_END.split(text):
+        lines = [line for line in chunk.splitlines() if not line.strip().startswith('--')]
+        statement = '\n'.join(lines).strip()
+        if statement:
+            statements.append(statement)
+    return statements
+
+
+####################### STATE ###########################
+def ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            migration_version INTEGER PRIMARY KEY,
+            migration_name TEXT NOT NULL,
+            migration_checksum CHAR(64) NOT NULL,
+            migration_applied_at TIMESTAMP DEFAULT NOW() NOT NULL,
+            migration_duration_ms NUMERIC(10,1)
+        );
+    """)
+
+
+def applied_migrations(cur):
+    cur.execute("""
+        SELECT migration_version, migration_name, migration_checksum, migration_applied_at, migration_duration_ms
+        FROM schema_migrations ORDER BY migration_version;
+    """)
+    return {row[0]: row for row in cur.fetchall()}
+
+
+def check_checksums(migrations, applied):
+    """Applied migrations are history: editing one afterwards is an error, not a silent no-op"""
+    for migration in migrations:
+        row = applied.get(migration.version)
+        if row and row[2] != migration.checksum:
+            raise MigrationError(
+                f"Migration {migration.version:04d}_{migration.name} was changed after it was applied; "
+                f"add a new migration instead")
+
+
+def invalid_indexes(cur):
+    """Leftovers of a failed CREATE INDEX CONCURRENTLY; they must be dropped before retrying"""
+    cur.execute("""
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid;
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+
+####################### RUNNING ###########################
+def apply_migration(conn, migration):
+    started = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        if migration.transactional:
+            cur.execute(migration.sql)
+        else:
+            # IF NOT EXISTS counts an invalid index as existing, so a retry would "succeed" without one
+            leftovers = invalid_indexes(cur)
+            if leftovers:
+                raise MigrationError(
+                    f"{migration.version:04d}_{migration.name} not applied: drop the invalid index(es) "
+                    f"{', '.join(leftovers)} left by a failed CREATE INDEX CONCURRENTLY first")
+            conn.commit()
+            conn.autocommit = True
+            try:
+                for statement in split_statements(migration.sql):
+                    cur.execute(statement)
+            except psycopg2.Error as e:
+                leftovers = invalid_indexes(cur)
+                hint = f" Drop the invalid index(es) {', '.join(leftovers)} before retrying." if leftovers else ''
+                raise MigrationError(f"{migration.version:04d}_{migration.name} failed: {e}{hint}") from e
+            finally:
+                conn.autocommit = False
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        cur.execute("""
+            INSERT INTO schema_migrations (migration_version, migration_name, migration_checksum, migration_duration_ms)
+            VALUES (%s, %s, %s, %s);
+        """, (migration.version, migration.name, migration.checksum, duration_ms))
+        conn.commit()
+        logger.info("Applied migration %04d_%s in %s ms", migration.version, migration.name, duration_ms)
+        return duration_ms
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def migrate(conn, target=None, dry_run=False, directory=MIGRATIONS_DIR):
+    """Apply pending migrations up to `target` in order; returns [(migration, duration_ms)]"""
+    migrations = discover(directory)
+    cur = conn.cursor()
+    # Two deploys migrating at once would race; the second waits here and then finds nothing to do
+    cur.execute("SELECT pg_advisory_lock(%s);", (ADVISORY_LOCK_KEY,))
+    try:
+        ensure_table(cur)
+        conn.commit()
+        applied = applied_migrations(cur)
+        check_checksums(migrations, applied)
+
+        pending = [m for m in migrations if m.version not in applied and (target is None or m.version <= target)]
+        if dry_run:
+            return [(migration, None) for migration in pending]
+        return [(migration, apply_migration(conn, migration)) for migration in pending]
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_KEY,))
+        conn.commit()
+        cur.close()
+
+
+def migration_status(conn, directory=MIGRATIONS_DIR):
+    """[(migration, applied row or None)] for every migration file"""
+    cur = conn.cursor()
+    try:
+        ensure_table(cur)
+        conn.commit()
+        applied = applied_migrations(cur)
+    finally:
+        cur.close()
+    return [(migration, applied.get(migration.version)) for migration in discover(directory)]
+
+
+def connect():
+    """A connection of its own: migrations toggle autocommit and hold session-level locks, so they stay
+    out of the pool and go straight to Postgres even when the app runs behind a pooler"""
+    return psycopg2.connect(**POSTGRES_DIRECT_CONFIG)
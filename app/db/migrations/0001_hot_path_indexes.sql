@@ -0,0 +1,26 @@
+-- Secondary indexes for the predicates every page filters on; until now each of these was a seq scan.
+-- Built CONCURRENTLY so bookings and payments stay writable while they build.
+
+-- Active bookings of a student (dashboard, create_booking, my bookings)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_user_status_idx
+    ON bookings (booking_user_id, booking_status);
+
+-- Spots left per room (available rooms, room details, the FOR UPDATE check in create_booking)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bookings_room_status_idx
+    ON bookings (booking_room_id, booking_status);
+
+-- Revenue and pending-payment figures on the admin dashboard and reports
+CREATE INDEX CONCURRENTLY IF NOT EXISTS payments_status_date_idx
+    ON payments (payment_status, payment_date);
+
+-- Photos of a room
+CREATE INDEX CONCURRENTLY IF NOT EXISTS room_images_room_idx
+    ON room_images (image_room_id);
+
+-- Room listing filtered by hostel and price
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rooms_hostel_price_idx
+    ON rooms (room_hostel_id, room_price_per_sem);
+
+-- Allocation of a payment; also keeps ON DELETE of payments from scanning allocations
+CREATE INDEX CONCURRENTLY IF NOT EXISTS allocations_payment_idx
+    ON allocations (allocation_payment_id);
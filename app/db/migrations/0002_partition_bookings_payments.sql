@@ -0,0 +1,173 @@
+-- Range-partition bookings and payments by month so "this month" / "last 6 months" queries
+-- only touch the partitions they need, and old semesters can be detached (flask db archive).
+-- This rewrites both tables under an exclusive lock: run it in a maintenance window.
+--
+-- Postgres wants the partition key in every primary key and unique constraint, so:
+--   * primary keys become (id, date) and reference numbers are unique per date;
+--   * UNIQUE (booking_user_id, booking_room_id) goes; create_booking already refuses a second
+--     active booking, and bookings_user_status_idx serves the lookups it used to;
+--   * booking and payment dates become NOT NULL (existing NULLs are filled with today);
+--   * the foreign keys pointing at bookings and payments become triggers with the same effect.
+
+
+-- Creates <parent>_pYYYY_MM for the month containing month_start, moving any rows
+-- that already landed in <parent>_default for that month. Safe to run from several sessions at once.
+CREATE OR REPLACE FUNCTION ensure_month_partition(parent TEXT, month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    partition TEXT := parent || '_p' || TO_CHAR(month_start, 'YYYY_MM');
+    lower_bound DATE := DATE_TRUNC('month', month_start)::date;
+    upper_bound DATE := (DATE_TRUNC('month', month_start) + INTERVAL '1 month')::date;
+    key_column TEXT;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(partition));
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    SELECT a.attname INTO key_column
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent::regclass;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition, parent);
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                   parent || '_default', key_column, lower_bound, key_column, upper_bound, partition);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition, lower_bound, upper_bound);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Move the old tables (and their index names) out of the way; keep the id sequences
+ALTER SEQUENCE bookings_booking_id_seq OWNED BY NONE;
+ALTER SEQUENCE payments_payment_id_seq OWNED BY NONE;
+ALTER TABLE bookings RENAME TO bookings_unpartitioned;
+ALTER TABLE payments RENAME TO payments_unpartitioned;
+
+DO $$
+DECLARE
+    idx RECORD;
+BEGIN
+    FOR idx IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid IN ('bookings_unpartitioned'::regclass, 'payments_unpartitioned'::regclass)
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.relname, LEFT(idx.relname, 50) || '_unpartitioned');
+    END LOOP;
+END;
+$$;
+
+
+-- Same columns, defaults and checks as before
+CREATE TABLE bookings (
+    LIKE bookings_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+    PRIMARY KEY (booking_id, booking_date),
+    UNIQUE (booking_reference_number, booking_date),
+    FOREIGN KEY (booking_user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (booking_room_id) REFERENCES rooms(room_id) ON DELETE CASCADE
+) PARTITION BY RANGE (booking_date);
+CREATE TABLE bookings_default PARTITION OF bookings DEFAULT;
+ALTER SEQUENCE bookings_booking_id_seq OWNED BY bookings.booking_id;
+
+CREATE TABLE payments (
+    LIKE payments_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+    PRIMARY KEY (payment_id, payment_date),
+    UNIQUE (payment_reference_number, payment_date)
+) PARTITION BY RANGE (payment_date);
+CREATE TABLE payments_default PARTITION OF payments DEFAULT;
+ALTER SEQUENCE payments_payment_id_seq OWNED BY payments.payment_id;
+
+-- The (reference, date) unique constraints already cover lookups by reference number
+CREATE INDEX bookings_user_status_idx ON bookings (booking_user_id, booking_status);
+CREATE INDEX bookings_room_status_idx ON bookings (booking_room_id, booking_status);
+CREATE INDEX payments_status_date_idx ON payments (payment_status, payment_date);
+
+
+-- One partition per month of existing data, plus three months ahead
+SELECT ensure_month_partition('bookings', month::date)
+FROM generate_series(
+    DATE_TRUNC('month', COALESCE((SELECT MIN(booking_date) FROM bookings_unpartitioned), CURRENT_DATE)),
+    DATE_TRUNC('month', GREATEST((SELECT MAX(booking_date) FROM bookings_unpartitioned), CURRENT_DATE + 90)),
+    INTERVAL '1 month') AS month;
+
+SELECT ensure_month_partition('payments', month::date)
+FROM generate_series(
+    DATE_TRUNC('month', COALESCE((SELECT MIN(payment_date) FROM payments_unpartitioned), CURRENT_DATE)),
+    DATE_TRUNC('month', GREATEST((SELECT MAX(payment_date) FROM payments_unpartitioned), CURRENT_DATE + 90)),
+    INTERVAL '1 month') AS month;
+
+INSERT INTO bookings (booking_id, booking_reference_number, booking_user_id, booking_room_id, booking_date, booking_status)
+SELECT booking_id, booking_reference_number, booking_user_id, booking_room_id,
+       COALESCE(booking_date, CURRENT_DATE), booking_status
+FROM bookings_unpartitioned;
+
+INSERT INTO payments (payment_id, payment_reference_number, payment_amount, payment_method, payment_date,
+                      payment_status, payment_receipt)
+SELECT payment_id, payment_reference_number, payment_amount, payment_method,
+       COALESCE(payment_date, CURRENT_DATE), payment_status, payment_receipt
+FROM payments_unpartitioned;
+
+-- Also drops the foreign keys from allocations and payment_receipts
+DROP TABLE bookings_unpartitioned, payments_unpartitioned CASCADE;
+
+
+-- What those foreign keys did, as triggers
+CREATE OR REPLACE FUNCTION check_booking_payment_refs() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'allocations' THEN
+        IF NOT EXISTS (SELECT 1 FROM bookings WHERE booking_id = NEW.allocation_booking_id) THEN
+            RAISE foreign_key_violation USING MESSAGE = format('booking %s does not exist', NEW.allocation_booking_id);
+        END IF;
+        IF NEW.allocation_payment_id IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM payments WHERE payment_id = NEW.allocation_payment_id) THEN
+            RAISE foreign_key_violation USING MESSAGE = format('payment %s does not exist', NEW.allocation_payment_id);
+        END IF;
+    ELSIF NOT EXISTS (SELECT 1 FROM payments WHERE payment_id = NEW.receipt_payment_id) THEN
+        RAISE foreign_key_violation USING MESSAGE = format('payment %s does not exist', NEW.receipt_payment_id);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER allocations_refs_exist
+BEFORE INSERT OR UPDATE OF allocation_booking_id, allocation_payment_id ON allocations
+FOR EACH ROW EXECUTE FUNCTION check_booking_payment_refs();
+
+CREATE TRIGGER payment_receipts_refs_exist
+BEFORE INSERT OR UPDATE OF receipt_payment_id ON payment_receipts
+FOR EACH ROW EXECUTE FUNCTION check_booking_payment_refs();
+
+CREATE OR REPLACE FUNCTION delete_booking_dependents() RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM allocations WHERE allocation_booking_id = OLD.booking_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bookings_delete_dependents
+AFTER DELETE ON bookings
+FOR EACH ROW EXECUTE FUNCTION delete_booking_dependents();
+
+CREATE OR REPLACE FUNCTION delete_payment_dependents() RETURNS TRIGGER AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM allocations WHERE allocation_payment_id = OLD.payment_id) THEN
+        RAISE foreign_key_violation USING MESSAGE = format('payment %s is still referenced from allocations', OLD.payment_id);
+    END IF;
+    DELETE FROM payment_receipts WHERE receipt_payment_id = OLD.payment_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER payments_delete_dependents
+AFTER DELETE ON payments
+FOR EACH ROW EXECUTE FUNCTION delete_payment_dependents();
+
+
+-- Reports over every semester, including archived ones. flask db archive redefines these
+-- as UNION ALL of the live table and its archive.* tables.
+CREATE VIEW bookings_history AS SELECT * FROM bookings;
+CREATE VIEW payments_history AS SELECT * FROM payments;
+
+ANALYZE bookings;
+ANALYZE payments;
@@ -0,0 +1,58 @@
+-- Precomputed hostel and room occupancy for the admin hostel/room management page, which
+-- otherwise joins rooms, bookings and room_images on every click. app/db/matviews.py refreshes
+-- them (without blocking readers) shortly after bookings, rooms or hostels change; each
+-- needs a unique index for that.
+
+CREATE MATERIALIZED VIEW room_occupancy AS
+SELECT
+    r.room_id,
+    r.room_hostel_id,
+    r.room_number,
+    r.room_type,
+    r.room_capacity,
+    r.room_price_per_sem,
+    COALESCE(b.confirmed_bookings, 0) AS confirmed_bookings,
+    CASE WHEN b.confirmed_bookings > 0 THEN 'occupied' ELSE 'available' END AS status,
+    COALESCE(i.images, '{}') AS images
+FROM rooms r
+LEFT JOIN (
+    SELECT booking_room_id, COUNT(*) AS confirmed_bookings
+    FROM bookings
+    WHERE booking_status = 'Confirmed'
+    GROUP BY booking_room_id
+) b ON b.booking_room_id = r.room_id
+LEFT JOIN (
+    SELECT image_room_id, array_agg(DISTINCT image_url) AS images
+    FROM room_images
+    GROUP BY image_room_id
+) i ON i.image_room_id = r.room_id;
+
+CREATE UNIQUE INDEX room_occupancy_room_idx ON room_occupancy (room_id);
+CREATE INDEX room_occupancy_hostel_idx ON room_occupancy (room_hostel_id, room_number);
+
+-- Built on room_occupancy, so it is refreshed after it
+CREATE MATERIALIZED VIEW hostel_occupancy AS
+SELECT
+    h.hostel_id,
+    h.hostel_name,
+    h.hostel_location,
+    h.hostel_total_rooms,
+    h.hostel_description,
+    h.hostel_image,
+    COUNT(r.room_id) AS total_rooms,
+    COUNT(r.room_id) FILTER (WHERE r.status = 'occupied') AS occupied_rooms,
+    COUNT(r.room_id) FILTER (WHERE r.status = 'available') AS available_rooms
+FROM hostels h
+LEFT JOIN room_occupancy r ON r.room_hostel_id = h.hostel_id
+GROUP BY h.hostel_id;
+
+CREATE UNIQUE INDEX hostel_occupancy_hostel_idx ON hostel_occupancy (hostel_id);
+
+-- When each view was last refreshed, shown next to the data it serves
+CREATE TABLE materialized_view_refreshes (
+    view_name TEXT PRIMARY KEY,
+    view_refreshed_at TIMESTAMP DEFAULT NOW() NOT NULL,
+    view_refresh_ms NUMERIC(10,1)
+);
+
+INSERT INTO materialized_view_refreshes (view_name) VALUES ('room_occupancy'), ('hostel_occupancy');
@@ -0,0 +1,27 @@
+-- Tell the app when the numbers on the admin dashboard and bookings pages may have moved.
+-- Each worker process LISTENs on dashboard_changes (app/services/live_stats.py) and pushes
+-- fresh counters to open admin pages. Statement-level, so a bulk update is one notification,
+-- and Postgres folds identical notifications within a transaction into one, sent on commit.
+
+CREATE OR REPLACE FUNCTION notify_dashboard_change() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('dashboard_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bookings_notify_dashboard
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON bookings
+FOR EACH STATEMENT EXECUTE FUNCTION notify_dashboard_change();
+
+CREATE TRIGGER payments_notify_dashboard
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON payments
+FOR EACH STATEMENT EXECUTE FUNCTION notify_dashboard_change();
+
+CREATE TRIGGER users_notify_dashboard
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION notify_dashboard_change();
+
+CREATE TRIGGER rooms_notify_dashboard
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON rooms
+FOR EACH STATEMENT EXECUTE FUNCTION notify_dashboard_change();
@@ -0,0 +1,54 @@
+-- Tell the app which rooms gained or lost a booking, so the student room browser can show
+-- spots left as they change (app/services/live_stats.py). One notification per statement,
+-- listing the rooms it touched; a statement touching too many rooms to list says '*'.
+
+CREATE OR REPLACE FUNCTION notify_room_availability() RETURNS TRIGGER AS $$
+DECLARE
+    rooms TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        rooms := '*';
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT string_agg(DISTINCT booking_room_id::TEXT, ',') INTO rooms FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT string_agg(DISTINCT booking_room_id::TEXT, ',') INTO rooms FROM old_rows;
+    ELSE
+        -- Only rooms whose bookings changed status (or moved between rooms)
+        SELECT string_agg(DISTINCT changed.booking_room_id::TEXT, ',') INTO rooms
+        FROM (
+            (SELECT booking_room_id, booking_status FROM new_rows
+             EXCEPT ALL
+             SELECT booking_room_id, booking_status FROM old_rows)
+            UNION ALL
+            (SELECT booking_room_id, booking_status FROM old_rows
+             EXCEPT ALL
+             SELECT booking_room_id, booking_status FROM new_rows)
+        ) changed;
+    END IF;
+
+    IF rooms IS NOT NULL THEN
+        -- NOTIFY payloads stop at 8000 bytes
+        PERFORM pg_notify('room_availability', CASE WHEN length(rooms) > 7900 THEN '*' ELSE rooms END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bookings_insert_notify_rooms
+AFTER INSERT ON bookings
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_room_availability();
+
+CREATE TRIGGER bookings_update_notify_rooms
+AFTER UPDATE ON bookings
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_room_availability();
+
+CREATE TRIGGER bookings_delete_notify_rooms
+AFTER DELETE ON bookings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_room_availability();
+
+CREATE TRIGGER bookings_truncate_notify_rooms
+AFTER TRUNCATE ON bookings
+FOR EACH STATEMENT EXECUTE FUNCTION notify_room_availability();
@@ -0,0 +1,91 @@
+-- Tell the app whose badge counters (pending bookings, account balance) a write moved, so
+-- every worker can drop them from its cache (app/services/student_counters.py). One
+-- notification per statement, listing the students; too many to list says '*'.
+
+CREATE OR REPLACE FUNCTION notify_student_counters() RETURNS TRIGGER AS $$
+DECLARE
+    students TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        students := '*';
+    ELSIF TG_TABLE_NAME = 'bookings' THEN
+        IF TG_OP = 'INSERT' THEN
+            SELECT string_agg(DISTINCT booking_user_id::TEXT, ',') INTO students FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT string_agg(DISTINCT booking_user_id::TEXT, ',') INTO students FROM old_rows;
+        ELSE
+            SELECT string_agg(DISTINCT changed.booking_user_id::TEXT, ',') INTO students
+            FROM (
+                (SELECT booking_user_id, booking_status FROM new_rows
+                 EXCEPT ALL
+                 SELECT booking_user_id, booking_status FROM old_rows)
+                UNION ALL
+                (SELECT booking_user_id, booking_status FROM old_rows
+                 EXCEPT ALL
+                 SELECT booking_user_id, booking_status FROM new_rows)
+            ) changed;
+        END IF;
+    ELSE
+        IF TG_OP = 'INSERT' THEN
+            SELECT string_agg(DISTINCT profile_user_id::TEXT, ',') INTO students FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT string_agg(DISTINCT profile_user_id::TEXT, ',') INTO students FROM old_rows;
+        ELSE
+            SELECT string_agg(DISTINCT changed.profile_user_id::TEXT, ',') INTO students
+            FROM (
+                (SELECT profile_user_id, profile_account_balance FROM new_rows
+                 EXCEPT ALL
+                 SELECT profile_user_id, profile_account_balance FROM old_rows)
+                UNION ALL
+                (SELECT profile_user_id, profile_account_balance FROM old_rows
+                 EXCEPT ALL
+                 SELECT profile_user_id, profile_account_balance FROM new_rows)
+            ) changed;
+        END IF;
+    END IF;
+
+    IF students IS NOT NULL THEN
+        -- NOTIFY payloads stop at 8000 bytes
+        PERFORM pg_notify('student_counters', CASE WHEN length(students) > 7900 THEN '*' ELSE students END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bookings_insert_notify_students
+AFTER INSERT ON bookings
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER bookings_update_notify_students
+AFTER UPDATE ON bookings
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER bookings_delete_notify_students
+AFTER DELETE ON bookings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER bookings_truncate_notify_students
+AFTER TRUNCATE ON bookings
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER user_profile_insert_notify_students
+AFTER INSERT ON user_profile
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER user_profile_update_notify_students
+AFTER UPDATE ON user_profile
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER user_profile_delete_notify_students
+AFTER DELETE ON user_profile
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
+
+CREATE TRIGGER user_profile_truncate_notify_students
+AFTER TRUNCATE ON user_profile
+FOR EACH STATEMENT EXECUTE FUNCTION notify_student_counters();
@@ -0,0 +1,4 @@
+-- flask db archive moves the allocations of archived bookings to archive.allocations_* tables;
+-- like bookings_history and payments_history (migration 0002), this view is redefined to
+-- include them.
+CREATE VIEW allocations_history AS SELECT * FROM allocations;
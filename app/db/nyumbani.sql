@@ -13,7 +13,7 @@ CREATE TABLE user_profile (
     profile_user_id INTEGER UNIQUE REFERENCES users(user_id) ON DELETE CASCADE,
     profile_account_balance NUMERIC(10,2) DEFAULT 0.00 NOT NULL,
     profile_emergency_contact VARCHAR(20),
-    profile_student_id VARCHAR(20) NOT NULL,
+    profile_student_id VARCHAR(20) NOT NULL
 );
 
 CREATE TABLE roles (
@@ -80,6 +80,42 @@ CREATE TABLE allocations (
     allocation_vaccate_date DATE NOT NULL
 );
 
+CREATE TABLE upload_blobs (
+    blob_sha256 CHAR(64) PRIMARY KEY,
+    blob_mime VARCHAR(50) NOT NULL,
+    blob_size INTEGER NOT NULL,
+    blob_storage_key TEXT NOT NULL,
+    blob_thumbnail_key TEXT,
+    blob_ref_count INTEGER DEFAULT 0 NOT NULL,
+    blob_created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE payment_receipts (
+    receipt_payment_id INTEGER PRIMARY KEY REFERENCES payments(payment_id) ON DELETE CASCADE,
+    receipt_blob_sha256 CHAR(64) NOT NULL REFERENCES upload_blobs(blob_sha256),
+    receipt_original_filename TEXT,
+    receipt_uploaded_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Keep blob reference counts in step with payment_receipts (covers cascaded deletes too)
+CREATE OR REPLACE FUNCTION update_blob_ref_count() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE upload_blobs SET blob_ref_count = blob_ref_count + 1
+        WHERE blob_sha256 = NEW.receipt_blob_sha256;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE upload_blobs SET blob_ref_count = blob_ref_count - 1
+        WHERE blob_sha256 = OLD.receipt_blob_sha256;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER payment_receipts_ref_count
+AFTER INSERT OR UPDATE OF receipt_blob_sha256 OR DELETE ON payment_receipts
+FOR EACH ROW EXECUTE FUNCTION update_blob_ref_count();
+
 
 
 INSERT INTO room_images (image_room_id, image_url) VALUES
@@ -92,6 +128,6 @@ INSERT INTO room_images (image_room_id, image_url) VALUES
 (4, 'https://images.unsplash.com/photo-1631049307264-da0ec9d70304?w=500&h=300&fit=crop'),
 (4, 'https://images.unsplash.com/photo-1599809275671-b5942cabc7a2?w=500&h=300&fit=crop'),
 (5, 'https://images.unsplash.com/photo-1588046130717-0eb1c9a169ba?w=500&h=300&fit=crop'),
-(5, 'https://images.unsplash.com/photo-1595526114035-0d45ed16cfbf?w=500&h=300&fit=crop');
+(5, 'https://images.unsplash.com/photo-1595526114035-0d45ed16cfbf?w=500&h=300&fit=crop'),
 (6, 'https://images.unsplash.com/photo-1554995207-c18c203602cb?w=500&h=300&fit=crop'),
 (6, 'https://images.unsplash.com/photo-1502672260266-1c1ef2d93688?w=500&h=300&fit=crop');
\ No newline at end of file
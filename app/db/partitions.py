@@ -0,0 +1,377 @@
+import os
+import re
+import logging
+from datetime import date
+from collections import namedtuple
+from psycopg2 import sql
+
+# Partitioned table -> partition key; see migrations/0002_partition_bookings_payments.sql
+PARTITIONED_TABLES = {
+    'bookings': 'booking_date',
+    'payments': 'payment_date',
+}
+# Months the January, May and September semesters start in
+SEMESTER_START_MONTHS = (1, 5, 9)
+ARCHIVE_SCHEMA = 'archive'
+# Rows fetched per round trip when writing Parquet
+PARQUET_BATCH_ROWS = 50000
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_NAME = re.compile(r'^(?P<table>[a-z]+)_p(?P<year>\d{4})_(?P<month>\d{2})$')
+
+Partition = namedtuple('Partition', 'table name month rows size_bytes')
+ArchivedSemester = namedtuple('ArchivedSemester', 'table year semester partitions rows destination')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+####################### CALENDAR ###########################
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def semester_of(day):
+    """(year, 1-3) of the semester a date falls in"""
+    semester = sum(1 for month in SEMESTER_START_MONTHS if month <= day.month)
+    return day.year, semester
+
+
+def semester_start(year, semester):
+    return date(year, SEMESTER_START_MONTHS[semester - 1], 1)
+
+
+def archive_cutoff(retention_semesters, today=None):
+    """First day of the oldest semester to keep: the current one plus `retention_semesters` before it"""
+    year, semester = semester_of(today or date.today())
+    index = year * len(SEMESTER_START_MONTHS) + semester - 1 - retention_semesters
+    return semester_start(index // len(SEMESTER_START_MONTHS), index % len(SEMESTER_START_MONTHS) + 1)
+
+
+####################### PARTITIONS ###########################
+def ensure_partitions(conn, months_ahead=3, today=None):
+    """Create this month's partition and the next `months_ahead`; returns the names that were new.
+    Rows for a month without a partition land in <table>_default and are moved when it is created."""
+    first = (today or date.today()).replace(day=1)
+    created = []
+    cur = conn.cursor()
+    try:
+        for table in PARTITIONED_TABLES:
+            for offset in range(months_ahead + 1):
+                month = add_months(first, offset)
+                cur.execute("SELECT ensure_month_partition(%s, %s);", (table, month))
+                if cur.fetchone()[0]:
+                    created.append(f"{table}_p{month:%Y_%m}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    if created:
+        logger.info("Created partitions %s", ', '.join(created))
+    return created
+
+
+def list_partitions(conn):
+    """Monthly partitions of every partitioned table, oldest first (default partitions have month None)"""
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT parent.relname, child.relname, child.reltuples::bigint, pg_total_relation_size(child.oid)
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = ANY(%s)
+            ORDER BY parent.relname, child.relname;
+        """, (list(PARTITIONED_TABLES),))
+        rows = cur.fetchall()
+    finally:
+        conn.rollback()
+        cur.close()
+
+    partitions = []
+    for table, name, rows_estimate, size_bytes in rows:
+        match = _PARTITION_NAME.match(name)
+        month = date(int(match.group('year')), int(match.group('month')), 1) if match else None
+        partitions.append(Partition(table, name, month, max(rows_estimate, 0), size_bytes))
+    return partitions
+
+
+####################### ARCHIVAL ###########################
+def archive_semesters(conn, retention_semesters, to='table', out_dir=None, dry_run=False, today=None):
+    """Detach the monthly partitions of semesters older than the retention window and move them out of
+    the live tables: into archive.<table>_<year>_s<n> (to='table') or zstd Parquet files (to='parquet').
+    Returns [ArchivedSemester]; with dry_run nothing is changed."""
+    if to not in ('table', 'parquet'):
+        raise ArchiveError(f"Unknown archive destination {to!r}")
+    if to == 'parquet' and not out_dir:
+        raise ArchiveError("Parquet archives need an output directory")
+    if retention_semesters < 1:
+        raise ArchiveError("Keep at least one past semester online")
+    if to == 'parquet' and not dry_run:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ArchiveError("Parquet archives need pyarrow (pip install pyarrow)")
+
+    cutoff = archive_cutoff(retention_semesters, today)
+    groups = {}
+    for partition in list_partitions(conn):
+        if partition.month and partition.month < cutoff:
+            year, semester = semester_of(partition.month)
+            groups.setdefault((partition.table, year, semester), []).append(partition.name)
+
+    archived = []
+    for (table, year, semester), names in sorted(groups.items()):
+        archive_name = f"{table}_{year}_s{semester}"
+        destination = (f"{ARCHIVE_SCHEMA}.{archive_name}" if to == 'table'
+                       else os.path.join(out_dir, f"{archive_name}.parquet"))
+        if dry_run:
+            rows = count_rows(conn, names)
+        else:
+            rows = archive_semester(conn, table, names, to, archive_name, destination)
+            logger.info("Archived %s rows of %s %s semester %s to %s", rows, table, year, semester, destination)
+        archived.append(ArchivedSemester(table, year, semester, names, rows, destination))
+
+    if archived and not dry_run and to == 'table':
+        refresh_history_views(conn)
+    return archived
+
+
+def count_rows(conn, names):
+    cur = conn.cursor()
+    try:
+        cur.execute(sql.SQL(' UNION ALL ').join(
+            sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(name)) for name in names))
+        return sum(row[0] for row in cur.fetchall())
+    finally:
+        conn.rollback()
+        cur.close()
+
+
+def archive_semester(conn, table, names, to, archive_name, destination):
+    """Copy one semester's partitions out while they are still attached, then move their
+    dependent rows, detach and drop them in a second, short transaction. Call it with no
+    transaction open on `conn`."""
+    key = PARTITIONED_TABLES[table]
+    # Ordered by date so the archive is stored (and compresses) in the order reports read it
+    union = sql.SQL(' UNION ALL ').join(
+        sql.SQL("SELECT * FROM {}").format(sql.Identifier(name)) for name in names)
+    ordered = sql.SQL("SELECT * FROM ({}) semester ORDER BY {}").format(union, sql.Identifier(key))
+    target = sql.Identifier(ARCHIVE_SCHEMA, archive_name)
+    # Allocations go wherever the semester of their booking goes
+    allocations_name = 'allocations' + archive_name[len(table):]
+    allocations_destination = (f"{ARCHIVE_SCHEMA}.{allocations_name}" if to == 'table'
+                               else os.path.join(os.path.dirname(destination), f"{allocations_name}.parquet"))
+
+    cur = conn.cursor()
+    pending_files = []
+    copied = False
+    try:
+        # One snapshot for the copy and its fingerprint
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        # A plain SELECT: the live tables stay writable while the semester is copied
+        if to == 'table':
+            for name in (archive_name, allocations_name) if table == 'bookings' else (archive_name,):
+                cur.execute("SELECT to_regclass(%s);", (f"{ARCHIVE_SCHEMA}.{name}",))
+                if cur.fetchone()[0]:
+                    raise ArchiveError(f"{ARCHIVE_SCHEMA}.{name} already exists; a run that stopped before "
+                                       f"dropping the partitions left it behind, drop it and archive again")
+            cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(sql.Identifier(ARCHIVE_SCHEMA)))
+            create_archive_table(cur, target, table)
+            cur.execute(sql.SQL("INSERT INTO {} {};").format(target, ordered))
+            rows = cur.rowcount
+        else:
+            pending_files.append(destination + '.tmp')
+            rows = write_parquet(conn, ordered, pending_files[-1])
+        copied_rows = fingerprint(cur, union)
+        if to == 'table':
+            conn.commit()
+            copied = True
+        else:
+            conn.rollback()
+
+        # Writes to the old months wait from here on. Anything added, removed or updated since
+        # the copy changes the fingerprint.
+        for name in names:
+            cur.execute(sql.SQL("LOCK TABLE {} IN SHARE MODE;").format(sql.Identifier(name)))
+        if fingerprint(cur, union) != copied_rows:
+            raise ArchiveError(f"{table} rows of {archive_name} changed while they were copied; archive again")
+
+        # DROP TABLE doesn't fire bookings_delete_dependents/payments_delete_dependents
+        # (migration 0002), so see to the rows they would have deleted
+        if table == 'bookings':
+            pending = archive_allocations(conn, cur, union, to, allocations_name, allocations_destination)
+            if pending:
+                pending_files.append(pending)
+        else:
+            delete_receipts(cur, union)
+
+        # CONCURRENTLY can't be used while a default partition exists; the lock lasts until
+        # the commit below
+        for name in names:
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(
+                sql.Identifier(table), sql.Identifier(name)))
+        for name in names:
+            cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if copied:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(target))
+            conn.commit()
+        for pending in pending_files:
+            if os.path.exists(pending):
+                os.remove(pending)
+        raise
+    finally:
+        cur.close()
+
+    for pending in pending_files:
+        # write_parquet() writes nothing for no rows
+        if os.path.exists(pending):
+            os.replace(pending, pending[:-len('.tmp')])
+    return rows
+
+
+def create_archive_table(cur, target, table):
+    """An empty copy of `table`. Only values long enough to be TOASTed are compressed in a heap
+    table, so these hardly shrink; that is what the Parquet archives are for."""
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+                .format(target, sql.Identifier(table)))
+    cur.execute("SELECT 'lz4' = ANY(enumvals) FROM pg_settings WHERE name = 'default_toast_compression';")
+    if not cur.fetchone()[0]:
+        return
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attstorage <> 'p';
+    """, (table,))
+    for (column,) in cur.fetchall():
+        cur.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN {} SET COMPRESSION lz4;").format(
+            target, sql.Identifier(column)))
+
+
+def fingerprint(cur, rows):
+    """Row count and an order-independent sum of row hashes of the query `rows`"""
+    cur.execute(sql.SQL("""
+        SELECT COUNT(*), COALESCE(SUM(('x' || left(md5(semester::text), 15))::bit(60)::bigint), 0)
+        FROM ({}) semester;
+    """).format(rows))
+    return cur.fetchone()
+
+
+def archive_allocations(conn, cur, union, to, archive_name, destination):
+    """Move the allocations of archived bookings to archive.<archive_name> (to='table') or a
+    Parquet file, so archived bookings can still be joined to their payments. Returns the
+    pending Parquet file."""
+    booked = sql.SQL("allocation_booking_id IN (SELECT booking_id FROM ({}) semester)").format(union)
+    if to == 'table':
+        target = sql.Identifier(ARCHIVE_SCHEMA, archive_name)
+        create_archive_table(cur, target, 'allocations')
+        cur.execute(sql.SQL("""
+            WITH moved AS (DELETE FROM allocations WHERE {} RETURNING *)
+            INSERT INTO {} SELECT * FROM moved ORDER BY allocation_id;
+        """).format(booked, target))
+        return None
+
+    # No allocation of these bookings may come or go between writing the file and the DELETE
+    cur.execute("LOCK TABLE allocations IN SHARE ROW EXCLUSIVE MODE;")
+    pending = destination + '.tmp'
+    write_parquet(conn, sql.SQL("SELECT * FROM allocations WHERE {} ORDER BY allocation_id").format(booked),
+                  pending)
+    cur.execute(sql.SQL("DELETE FROM allocations WHERE {};").format(booked))
+    return pending
+
+
+def delete_receipts(cur, union):
+    """Delete the receipts of archived payments, as payments_delete_dependents would. Their
+    blobs' reference counts drop with them (payment_receipts_ref_count), so collect_garbage
+    can remove files nothing else uses."""
+    cur.execute(sql.SQL("""
+        SELECT allocation_payment_id FROM allocations
+        WHERE allocation_payment_id IN (SELECT payment_id FROM ({}) semester)
+        LIMIT 1;
+    """).format(union))
+    row = cur.fetchone()
+    if row:
+        raise ArchiveError(f"payment {row[0]} is still referenced from allocations; "
+                           f"archive the semester of its booking first")
+    cur.execute(sql.SQL("""
+        DELETE FROM payment_receipts
+        WHERE receipt_payment_id IN (SELECT payment_id FROM ({}) semester);
+    """).format(union))
+
+
+def parquet_schema(description):
+    """Arrow schema from the Postgres column types, so a batch of NULLs can't decide a column's type"""
+    import pyarrow as pa
+
+    # type OID -> arrow type; anything else is written as text
+    types = {
+        16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(), 700: pa.float32(),
+        701: pa.float64(), 1082: pa.date32(), 1114: pa.timestamp('us'),
+        1700: pa.decimal128(38, 10),
+    }
+    fields = []
+    for column in description:
+        if column.type_code == 1700 and column.precision:
+            arrow_type = pa.decimal128(column.precision, column.scale)
+        else:
+            arrow_type = types.get(column.type_code, pa.string())
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def write_parquet(conn, query, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rows = 0
+    writer = None
+    # Server-side cursor: a semester of payments doesn't have to fit in memory
+    cur = conn.cursor('parquet_export')
+    try:
+        cur.execute(query)
+        while True:
+            batch = cur.fetchmany(PARQUET_BATCH_ROWS)
+            if not batch:
+                break
+            if writer is None:
+                writer = pq.ParquetWriter(path, parquet_schema(cur.description), compression='zstd')
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, writer.schema)],
+                schema=writer.schema))
+            rows += len(batch)
+    finally:
+        cur.close()
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def refresh_history_views(conn):
+    """<table>_history = the live table UNION ALL every archive.<table>_* table, for report mode"""
+    cur = conn.cursor()
+    try:
+        for table in (*PARTITIONED_TABLES, 'allocations'):
+            cur.execute("""
+                SELECT table_name FROM information_schema.tables
+                WHERE table_schema = %s AND table_name ~ %s
+                ORDER BY table_name;
+            """, (ARCHIVE_SCHEMA, f'^{table}_\\d{{4}}_s\\d$'))
+            sources = [sql.Identifier(table)] + [sql.Identifier(ARCHIVE_SCHEMA, row[0]) for row in cur.fetchall()]
+            cur.execute(sql.SQL("CREATE OR REPLACE VIEW {} AS {};").format(
+                sql.Identifier(f"{table}_history"),
+                sql.SQL(' UNION ALL ').join(sql.SQL("SELECT * FROM {}").format(source) for source in sources)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
@@ -0,0 +1,65 @@
+import os
+import re
+import logging
+from .db import POOL_MODE
+from .instrumentation import add_statement_guard, fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Statements that leave something behind on the server connection once the transaction ends.
+# Behind a transaction-mode pooler the next transaction may run on another server connection,
+# and this one may be handed to another client, so none of them can be used through the pool.
+SESSION_STATE = [
+    ('SET without LOCAL', re.compile(r'^(SET|RESET)\s+(?!LOCAL\b|TRANSACTION\b|CONSTRAINTS\b)', re.I)),
+    ('prepared statement', re.compile(r'^(PREPARE|DEALLOCATE)\b', re.I)),
+    ('LISTEN', re.compile(r'^(UN)?LISTEN\b', re.I)),
+    ('session advisory lock', re.compile(r'\bpg_(try_)?advisory_(lock|unlock)(_shared|_all)?\s*\(', re.I)),
+    ('temporary table', re.compile(r'^CREATE\s+((GLOBAL|LOCAL)\s+)?TEMP(ORARY)?\s+TABLE\b(?!.*\bON\s+COMMIT\s+DROP\b)',
+                                   re.I | re.S)),
+    ('cursor WITH HOLD', re.compile(r'^DECLARE\b.*\bWITH\s+HOLD\b', re.I | re.S)),
+    ('LOAD', re.compile(r'^LOAD\b', re.I)),
+    # psycopg2 opens and ends transactions itself; doing it by hand desynchronises it from the
+    # server, and after a manual COMMIT the rest of the "transaction" can land on another backend
+    ('manual transaction control',
+     re.compile(r'^(BEGIN|START\s+TRANSACTION|COMMIT|END|ROLLBACK(?!\s+TO\b)|ABORT)\b', re.I)),
+]
+
+_LEADING_COMMENTS = re.compile(r'^(\s*(/\*.*?\*/|--[^\n]*\n))*\s*', re.S)
+_settings = {'strict': False}
+_reported = set()
+
+
+class SessionStateError(Exception):
+    """Raised in strict mode for a statement that would leak session state through the pooler"""
+
+
+def session_state(statement):
+    """Label of the session state `statement` leaves behind, or None"""
+    statement = _LEADING_COMMENTS.sub('', statement, count=1)
+    for label, pattern in SESSION_STATE:
+        if pattern.search(statement):
+            return label
+    return None
+
+
+def check_session_state(cursor, statement):
+    """Statement guard: refuse (strict) or report once (otherwise) session-level statements"""
+    label = session_state(statement)
+    if label is None:
+        return
+    if _settings['strict']:
+        raise SessionStateError(f"{label} is not safe behind a transaction-mode pooler: {statement[:200]}")
+    key = fingerprint(statement)
+    if key not in _reported:
+        _reported.add(key)
+        logger.warning("%s is not safe behind a transaction-mode pooler: %s", label, key[:200])
+
+
+def init_pooler_guard(app):
+    """On when POSTGRES_POOL_MODE=transaction; POSTGRES_POOL_STRICT=1 fails the statement instead of
+    logging it, and also turns the check on without a pooler (e.g. in CI)"""
+    app.config.setdefault('POSTGRES_POOL_MODE', POOL_MODE)
+    app.config.setdefault('POSTGRES_POOL_STRICT', os.getenv("POSTGRES_POOL_STRICT", "0") == "1")
+    _settings['strict'] = app.config['POSTGRES_POOL_STRICT']
+    if app.config['POSTGRES_POOL_MODE'] == 'transaction' or _settings['strict']:
+        add_statement_guard(check_session_state)
@@ -0,0 +1,76 @@
+import os
+import re
+import logging
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r'%%|%s')
+_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+_statements = {}
+_settings = {'enabled': True}
+
+
+class PreparedStatement:
+    """A hot statement, written with %s placeholders like any other query.
+
+    The first execute() on a pooled connection PREPAREs it under `name`; later ones only
+    send EXECUTE, so Postgres skips parsing and, once it settles on a generic plan, planning.
+    Behind a transaction-mode pooler the next transaction may land on a server connection
+    that never saw the PREPARE, so there it runs as a plain statement instead."""
+
+    def __init__(self, name, query):
+        self.name = name
+        self.query = query
+        self.params = 0
+
+        def number(match):
+            if match.group() == '%%':
+                return '%'
+            self.params += 1
+            return f'${self.params}'
+        self.prepare = sql.SQL("PREPARE {} AS {}").format(
+            sql.Identifier(name), sql.SQL(_PLACEHOLDER.sub(number, query).strip().rstrip(';')))
+        placeholders = ', '.join(['%s'] * self.params)
+        self.statement = sql.SQL("EXECUTE {}" + (f" ({placeholders})" if self.params else "")).format(
+            sql.Identifier(name))
+
+    def execute(self, cur, params=()):
+        if not _settings['enabled']:
+            return cur.execute(self.query, params)
+        # Server connections (and their prepared statements) live as long as the connection object
+        conn = cur.connection
+        prepared = getattr(conn, 'prepared_statements', None)
+        if prepared is None:
+            prepared = conn.prepared_statements = set()
+        if self.name not in prepared:
+            # Survives a rollback of the surrounding transaction, so it is only ever done once
+            cur.execute(self.prepare)
+            prepared.add(self.name)
+        return cur.execute(self.statement, params)
+
+
+def prepared(name, query):
+    """Register a hot statement under `name` (one per distinct query text)"""
+    if not _NAME.match(name):
+        raise ValueError(f"Invalid prepared statement name: {name!r}")
+    statement = _statements.get(name)
+    if statement is None:
+        statement = _statements[name] = PreparedStatement(name, query)
+    elif statement.query != query:
+        raise ValueError(f"Prepared statement {name!r} is already registered with another query")
+    return statement
+
+
+def registered_statements():
+    return dict(_statements)
+
+
+def init_prepared_statements(app):
+    """POSTGRES_PREPARE=0 turns them off; so do transaction pooling and the strict pooler guard,
+    both of which must not see a PREPARE (see app/db/pooler.py)"""
+    app.config.setdefault('POSTGRES_PREPARE', os.getenv("POSTGRES_PREPARE", "1") == "1")
+    pooled = app.config.get('POSTGRES_POOL_MODE') == 'transaction' or app.config.get('POSTGRES_POOL_STRICT')
+    _settings['enabled'] = app.config['POSTGRES_PREPARE'] and not pooled
+    if app.config['POSTGRES_PREPARE'] and pooled:
+        logger.info("Prepared statements off: running behind a transaction-mode pooler")
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+import logging
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are recorded
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+# Durations kept per fingerprint for percentiles
+SAMPLES_KEPT = 500
+SNAPSHOT_INTERVAL = 10
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'execute')
+# Bumped by reset_snapshots(); a worker that sees a new number drops what it had gathered
+RESET_MARKER = 'reset.generation'
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_local = threading.local()
+_aggregates = {}
+_settings = {'threshold_ms': SLOW_QUERY_MS, 'snapshot_dir': None, 'last_snapshot': 0.0, 'generation': 0}
+
+
+def normalize(statement):
+    """Strip literals and placeholders so the same query shape maps to one fingerprint"""
+    normalized = _STRING_LITERAL.sub('?', statement)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _IN_LIST.sub('(?, ...)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip().rstrip(';')
+
+
+def query_fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+####################### EXPLAIN ###########################
+def explain(connection, executed_query):
+    """EXPLAIN (FORMAT JSON) the statement just run, without disturbing the caller's transaction"""
+    status = connection.info.transaction_status
+    if status not in (extensions.TRANSACTION_STATUS_IDLE, extensions.TRANSACTION_STATUS_INTRANS):
+        return None
+
+    in_transaction = status == extensions.TRANSACTION_STATUS_INTRANS
+    # A bare cursor class, so the EXPLAIN itself isn't instrumented
+    cur = extensions.cursor(connection)
+    try:
+        if in_transaction:
+            cur.execute("SAVEPOINT slow_query_explain;")
+        try:
+            cur.execute(b"EXPLAIN (FORMAT JSON) " + executed_query)
+            plan = cur.fetchone()[0]
+        except Exception as e:
+            logger.error("Error explaining slow query: %s", e)
+            plan = None
+            if in_transaction:
+                cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain;")
+        if in_transaction:
+            cur.execute("RELEASE SAVEPOINT slow_query_explain;")
+        elif not connection.autocommit:
+            connection.rollback()
+        return plan
+    finally:
+        cur.close()
+
+
+####################### RECORDING ###########################
+def record_slow_query(cursor, statement, duration):
+    """Query listener: aggregate statements over the threshold, explaining each new shape once"""
+    duration_ms = duration * 1000
+    if duration_ms < _settings['threshold_ms'] or getattr(_local, 'explaining', False):
+        return
+
+    normalized = normalize(statement)
+    key = query_fingerprint(normalized)
+    with _lock:
+        entry = _aggregates.get(key)
+        is_new = entry is None
+        if is_new:
+            entry = _aggregates[key] = {
+                'fingerprint': key, 'query': normalized, 'count': 0, 'total_ms': 0.0,
+                'max_ms': 0.0, 'samples': [], 'plan': None, 'first_seen': time.time(),
+            }
+        entry['count'] += 1
+        entry['total_ms'] += duration_ms
+        entry['max_ms'] = max(entry['max_ms'], duration_ms)
+        entry['last_seen'] = time.time()
+        entry['samples'].append(round(duration_ms, 3))
+        del entry['samples'][:-SAMPLES_KEPT]
+
+    executed = getattr(cursor, 'query', None)
+    if is_new and executed and normalized.split(' ', 1)[0].lower() in EXPLAINABLE:
+        _local.explaining = True
+        try:
+            entry['plan'] = explain(cursor.connection, executed)
+        finally:
+            _local.explaining = False
+
+    if time.monotonic() - _settings['last_snapshot'] > SNAPSHOT_INTERVAL:
+        write_snapshot()
+
+
+def write_snapshot():
+    """Dump this process's aggregates so the CLI and other workers can read them"""
+    snapshot_dir = _settings['snapshot_dir']
+    if not snapshot_dir:
+        return
+    _settings['last_snapshot'] = time.monotonic()
+    generation = reset_generation(snapshot_dir)
+    with _lock:
+        if generation != _settings['generation']:
+            # Reset from the CLI since the last snapshot: start over
+            _aggregates.clear()
+            _settings['generation'] = generation
+        data = json.dumps(list(_aggregates.values()))
+    path = os.path.join(snapshot_dir, f"{os.getpid()}.json")
+    try:
+        with open(path + '.tmp', 'w') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        logger.error("Error writing slow query snapshot: %s", e)
+
+
+####################### REPORTING ###########################
+def load_snapshots(snapshot_dir):
+    """Merge every process's snapshot into one list of aggregates"""
+    merged = {}
+    try:
+        names = os.listdir(snapshot_dir)
+    except OSError:
+        return merged
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(snapshot_dir, name)) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for entry in entries:
+            current = merged.get(entry['fingerprint'])
+            if current is None:
+                merged[entry['fingerprint']] = dict(entry, samples=list(entry['samples']))
+                continue
+            current['count'] += entry['count']
+            current['total_ms'] += entry['total_ms']
+            current['max_ms'] = max(current['max_ms'], entry['max_ms'])
+            current['samples'].extend(entry['samples'])
+            current['plan'] = current['plan'] or entry['plan']
+            current['first_seen'] = min(current['first_seen'], entry['first_seen'])
+            current['last_seen'] = max(current.get('last_seen', 0), entry.get('last_seen', 0))
+    return merged
+
+
+def top_offenders(snapshot_dir, limit=20, order_by='total_ms'):
+    """Slow query aggregates sorted by total time (or count/max_ms/p95_ms), with percentiles"""
+    if _settings['snapshot_dir'] == snapshot_dir:
+        write_snapshot()
+
+    rows = []
+    for entry in load_snapshots(snapshot_dir).values():
+        samples = sorted(entry.pop('samples'))
+        entry['p50_ms'] = round(percentile(samples, 50), 2)
+        entry['p95_ms'] = round(percentile(samples, 95), 2)
+        entry['max_ms'] = round(entry['max_ms'], 2)
+        entry['total_ms'] = round(entry['total_ms'], 2)
+        rows.append(entry)
+    rows.sort(key=lambda row: row[order_by], reverse=True)
+    return rows[:limit]
+
+
+def reset_generation(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, RESET_MARKER)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def reset_snapshots(snapshot_dir):
+    """Clear the statistics of every process. Running workers see the new generation the next
+    time they write a snapshot and drop their own aggregates instead of writing them back."""
+    generation = reset_generation(snapshot_dir) + 1
+    path = os.path.join(snapshot_dir, RESET_MARKER)
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(generation))
+    os.replace(path + '.tmp', path)
+    with _lock:
+        _aggregates.clear()
+        _settings['generation'] = generation
+    for name in os.listdir(snapshot_dir):
+        if name.endswith('.json'):
+            os.unlink(os.path.join(snapshot_dir, name))
+
+
+def slow_query_dir(app):
+    return os.path.join(app.instance_path, 'slow_queries')
+
+
+def init_slow_query_log(app):
+    from .instrumentation import add_query_listener
+
+    app.config.setdefault('SLOW_QUERY_MS', SLOW_QUERY_MS)
+    _settings['threshold_ms'] = float(app.config['SLOW_QUERY_MS'])
+    _settings['snapshot_dir'] = slow_query_dir(app)
+    os.makedirs(_settings['snapshot_dir'], exist_ok=True)
+    _settings['generation'] = reset_generation(_settings['snapshot_dir'])
+
+    add_query_listener(record_slow_query)
+    atexit.register(write_snapshot)
@@ -1,30 +1,28 @@
 import os
-import random
-import string
-import json
-import io
-import traceback
 import psycopg2.extras
-from psycopg2.extras import execute_values
-from flask import Flask, render_template, url_for, request, jsonify, Blueprint, current_app, redirect, make_response, Response
-from flask_login import login_user, logout_user, login_required, current_user
-from app.db.db import get_db_connection, release_db_connection
-from werkzeug.utils import secure_filename
+import logging
+from flask import render_template, request, jsonify, Blueprint, current_app, Response
+from flask_login import login_required, current_user
+from app.db.db import get_db_connection, release_db_connection, read_only
+from app.db.matviews import schedule_refresh, view_freshness
 from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image
-from datetime import datetime, timedelta
-from weasyprint import HTML
+from datetime import datetime
+from app.services.fragment_cache import invalidate_fragments
+from app.services.metrics import BOOKINGS, PAYMENTS, PDF_RENDER, payment_method_label
+from app.services import live_stats
 from .auth import admin_required
 
 admin = Blueprint('admin', __name__, url_prefix='/')
+logger = logging.getLogger(__name__)
 
 ############ ADMIN DASHBOARD ##################
 @admin.route('/admin/dashboard')
 @login_required
 @admin_required
+@read_only
 def dashboard():
     try:
-        stats = get_dashboard_stats()
+        stats = live_stats.cached('dashboard', get_dashboard_stats)
         recent_students = get_recent_students()
         return render_template(
             '/admin/dashboard.html',
@@ -33,7 +31,15 @@ def dashboard():
             recent_students=recent_students
         )
     except Exception as e:
-        print(f"Error in dashboard: {e}")
+        logger.error("Error in dashboard: %s", e)
+
+
+@admin.route('/admin/events')
+@login_required
+@admin_required
+def live_events():
+    """Server-Sent Events: dashboard/bookings stats as they change (app/services/live_stats.py)"""
+    return live_stats.event_stream_response(live_stats.requested_groups(request.args.getlist('group')))
 
 
 def calculate_percentage_change(current, previous):
@@ -56,7 +62,7 @@ def get_dashboard_stats():
             cur.execute("SELECT COUNT(*) FROM users;")
             total_students = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in total students:", e)
+            logger.error("Error in total students: %s", e)
             total_students = 0
 
         prev_students = total_students // 2
@@ -67,19 +73,19 @@ def get_dashboard_stats():
             cur.execute("SELECT COUNT(*) FROM bookings WHERE booking_status='Confirmed';")
             occupied_rooms = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in occupied rooms:", e)
+            logger.error("Error in occupied rooms: %s", e)
             occupied_rooms = 0
 
         try:
             cur.execute("""
                 SELECT COUNT(*) FROM bookings 
                 WHERE booking_status='Confirmed'
-                AND DATE_TRUNC('month', booking_date) = DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month');
+                AND booking_date >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')::date
+                AND booking_date < DATE_TRUNC('month', CURRENT_DATE)::date;
             """)
             prev_occupied = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in prev occupied:", e)
-            traceback.print_exc()
+            logger.exception("Error in prev occupied: %s", e)
             prev_occupied = 0
 
         occupied_rooms_change = calculate_percentage_change(occupied_rooms, prev_occupied)
@@ -89,18 +95,19 @@ def get_dashboard_stats():
             cur.execute("SELECT COUNT(*) FROM bookings WHERE booking_status='Pending';")
             pending_requests = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in pending:", e)
+            logger.error("Error in pending: %s", e)
             pending_requests = 0
 
         try:
             cur.execute("""
                 SELECT COUNT(*) FROM bookings 
                 WHERE booking_status='Pending'
-                AND DATE_TRUNC('month', booking_date) = DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month');
+                AND booking_date >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')::date
+                AND booking_date < DATE_TRUNC('month', CURRENT_DATE)::date;
             """)
             prev_pending = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in prev pending:", e)
+            logger.error("Error in prev pending: %s", e)
             prev_pending = 0
 
         pending_requests_change = calculate_percentage_change(pending_requests, prev_pending)
@@ -111,11 +118,12 @@ def get_dashboard_stats():
                 SELECT COALESCE(SUM(payment_amount), 0)
                 FROM payments 
                 WHERE payment_status='Success'
-                AND DATE_TRUNC('month', payment_date) = DATE_TRUNC('month', CURRENT_DATE);
+                AND payment_date >= DATE_TRUNC('month', CURRENT_DATE)::date
+                AND payment_date < DATE_TRUNC('month', CURRENT_DATE + INTERVAL '1 month')::date;
             """)
             monthly_revenue = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in monthly revenue:", e)
+            logger.error("Error in monthly revenue: %s", e)
             monthly_revenue = 0
 
         try:
@@ -123,11 +131,12 @@ def get_dashboard_stats():
                 SELECT COALESCE(SUM(payment_amount), 0)
                 FROM payments 
                 WHERE payment_status='Success'
-                AND DATE_TRUNC('month', payment_date) = DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month');
+                AND payment_date >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')::date
+                AND payment_date < DATE_TRUNC('month', CURRENT_DATE)::date;
             """)
             prev_revenue = cur.fetchone()[0]
         except Exception as e:
-            print(">>> Error in prev revenue:", e)
+            logger.error("Error in prev revenue: %s", e)
             prev_revenue = 0
 
         monthly_revenue_change = calculate_percentage_change(monthly_revenue, prev_revenue)
@@ -148,7 +157,7 @@ def get_dashboard_stats():
             months = [row[0] for row in occupancy_data]
             occupancy_counts = [row[1] for row in occupancy_data]
         except Exception as e:
-            print(">>> Error in occupancy chart data:", e)
+            logger.error("Error in occupancy chart data: %s", e)
             months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun']
             occupancy_counts = [0, 0, 0, 0, 0, 0]
 
@@ -169,7 +178,7 @@ def get_dashboard_stats():
             pending_rooms = room_stats[2]
             available_rooms = room_stats[3]
         except Exception as e:
-            print(">>> Error in room status data:", e)
+            logger.error("Error in room status data: %s", e)
             total_rooms = occupied_rooms = pending_rooms = available_rooms = 0
 
         return {
@@ -193,8 +202,7 @@ def get_dashboard_stats():
         }
 
     except Exception as e:
-        print(">>> Fatal error in dashboard stats:", e)
-        traceback.print_exc()
+        logger.exception("Fatal error in dashboard stats: %s", e)
         return {
             "total_students": 0,
             "total_students_change": 0,
@@ -243,7 +251,7 @@ def get_recent_students(limit=5):
         return students
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error getting recent students")
         return []
 
     finally:
@@ -264,7 +272,7 @@ def rooms():
     try:
         return render_template('/admin/hostel_rooms.html', user=current_user)
     except Exception as e:
-        print(f"Error in rooms page: {e}")
+        logger.error("Error in rooms page: %s", e)
         return "Error loading page", 500
 
 
@@ -280,22 +288,20 @@ def get_hostels():
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
+        # Precomputed in the hostel_occupancy materialized view (migration 0003)
         cur.execute("""
             SELECT 
-                h.hostel_id,
-                h.hostel_name,
-                h.hostel_location,
-                h.hostel_total_rooms,
-                h.hostel_description,
-                h.hostel_image,
-                COUNT(r.room_id) as total_rooms,
-                COUNT(CASE WHEN b.booking_id IS NOT NULL AND b.booking_status = 'Confirmed' THEN 1 END) as occupied_rooms,
-                (COUNT(r.room_id) - COUNT(CASE WHEN b.booking_id IS NOT NULL AND b.booking_status = 'Confirmed' THEN 1 END)) as available_rooms
-            FROM hostels h
-            LEFT JOIN rooms r ON h.hostel_id = r.room_hostel_id
-            LEFT JOIN bookings b ON r.room_id = b.booking_room_id AND b.booking_status = 'Confirmed'
-            GROUP BY h.hostel_id, h.hostel_name, h.hostel_location, h.hostel_total_rooms, h.hostel_description
-            ORDER BY h.hostel_name;
+                hostel_id,
+                hostel_name,
+                hostel_location,
+                hostel_total_rooms,
+                hostel_description,
+                hostel_image,
+                total_rooms,
+                occupied_rooms,
+                available_rooms
+            FROM hostel_occupancy
+            ORDER BY hostel_name;
         """)
         
         hostels = cur.fetchall()
@@ -309,12 +315,12 @@ def get_hostels():
         
         return jsonify({
             'success': True,
-            'hostels': hostel_list
+            'hostels': hostel_list,
+            'freshness': view_freshness(cur, 'hostel_occupancy')
         })
         
     except Exception as e:
-        print(f"Error getting hostels: {e}")
-        traceback.print_exc()
+        logger.exception("Error getting hostels: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error fetching hostels data'
@@ -337,24 +343,19 @@ def get_rooms(hostel_id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
+        # Precomputed in the room_occupancy materialized view (migration 0003)
         cur.execute("""
             SELECT 
-                r.room_id,
-                r.room_number,
-                r.room_type,
-                r.room_capacity,
-                r.room_price_per_sem,
-                CASE 
-                    WHEN b.booking_id IS NOT NULL AND b.booking_status = 'Confirmed' THEN 'occupied'
-                    ELSE 'available'
-                END as status,
-                COALESCE(array_agg(DISTINCT ri.image_url) FILTER (WHERE ri.image_url IS NOT NULL), '{}') as images
-            FROM rooms r
-            LEFT JOIN bookings b ON r.room_id = b.booking_room_id AND b.booking_status = 'Confirmed'
-            LEFT JOIN room_images ri ON r.room_id = ri.image_room_id
-            WHERE r.room_hostel_id = %s
-            GROUP BY r.room_id, r.room_number, r.room_type, r.room_capacity, r.room_price_per_sem, b.booking_id, b.booking_status
-            ORDER BY r.room_number;
+                room_id,
+                room_number,
+                room_type,
+                room_capacity,
+                room_price_per_sem,
+                status,
+                images
+            FROM room_occupancy
+            WHERE room_hostel_id = %s
+            ORDER BY room_number;
         """, (hostel_id,))
         
         rooms = cur.fetchall()
@@ -368,12 +369,12 @@ def get_rooms(hostel_id):
         
         return jsonify({
             'success': True,
-            'rooms': room_list
+            'rooms': room_list,
+            'freshness': view_freshness(cur, 'room_occupancy')
         })
         
     except Exception as e:
-        print(f"Error getting rooms: {e}")
-        traceback.print_exc()
+        logger.exception("Error getting rooms: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error fetching rooms data'
@@ -438,8 +439,7 @@ def get_students():
         })
         
     except Exception as e:
-        print(f"Error getting students: {e}")
-        traceback.print_exc()
+        logger.exception("Error getting students: %s", e)
         return jsonify({
             'success': False,
             'message': 'Error fetching students data'
@@ -498,6 +498,8 @@ def add_room():
         room_id = cur.fetchone()[0]
         
         conn.commit()
+        invalidate_fragments('hostels')
+        schedule_refresh()
         
         return jsonify({
             'success': True,
@@ -506,8 +508,7 @@ def add_room():
         })
         
     except Exception as e:
-        print(f"Error adding room: {e}")
-        traceback.print_exc()
+        logger.exception("Error adding room: %s", e)
         
         if conn:
             conn.rollback()
@@ -623,6 +624,9 @@ def assign_room():
         """, (booking_id, booking_date, vaccate_date))
         
         conn.commit()
+        schedule_refresh()
+        BOOKINGS.inc(event='created', source='admin')
+        BOOKINGS.inc(event='confirmed', source='admin')
         
         return jsonify({
             'success': True,
@@ -631,8 +635,7 @@ def assign_room():
         })
         
     except Exception as e:
-        print(f"Error assigning room: {e}")
-        traceback.print_exc()
+        logger.exception("Error assigning room: %s", e)
         
         if conn:
             conn.rollback()
@@ -693,6 +696,8 @@ def add_hostel():
         hostel_id = cur.fetchone()[0]
         
         conn.commit()
+        invalidate_fragments('hostels')
+        schedule_refresh()
         
         return jsonify({
             'success': True,
@@ -701,8 +706,7 @@ def add_hostel():
         })
         
     except Exception as e:
-        print(f"Error adding hostel: {e}")
-        traceback.print_exc()
+        logger.exception("Error adding hostel: %s", e)
         
         if conn:
             conn.rollback()
@@ -730,15 +734,14 @@ def bookings():
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         booking_details = get_booking_details(cur)
-        bookings_stats = get_bookings_stats(cur)
+        bookings_stats = live_stats.cached('bookings', lambda: get_bookings_stats(cur))
         
         return render_template('/admin/bookings.html', 
                              user=current_user,
                              bookings=booking_details,
                              stats=bookings_stats)
     except Exception as e:
-        print(f"Error in bookings page: {e}")
-        traceback.print_exc()
+        logger.exception("Error in bookings page: %s", e)
         return render_template('/admin/bookings.html', 
                              user=current_user,
                              bookings=[],
@@ -779,7 +782,7 @@ def get_booking_details(cur):
         """)
         return cur.fetchall()
     except Exception as e:
-        print(f"Error fetching booking details: {e}")
+        logger.error("Error fetching booking details: %s", e)
         return []
 
 def get_bookings_stats(cur):
@@ -792,7 +795,8 @@ def get_bookings_stats(cur):
                 COUNT(CASE WHEN booking_status = 'Pending' THEN 1 END) as pending_bookings,
                 COUNT(CASE WHEN booking_status = 'Cancelled' THEN 1 END) as cancelled_bookings
             FROM bookings 
-            WHERE DATE_TRUNC('month', booking_date) = DATE_TRUNC('month', CURRENT_DATE);
+            WHERE booking_date >= DATE_TRUNC('month', CURRENT_DATE)::date
+              AND booking_date < DATE_TRUNC('month', CURRENT_DATE + INTERVAL '1 month')::date;
         """)
         current_stats = cur.fetchone()
         
@@ -804,7 +808,8 @@ def get_bookings_stats(cur):
                 COUNT(CASE WHEN booking_status = 'Pending' THEN 1 END) as pending_bookings,
                 COUNT(CASE WHEN booking_status = 'Cancelled' THEN 1 END) as cancelled_bookings
             FROM bookings 
-            WHERE DATE_TRUNC('month', booking_date) = DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month');
+            WHERE booking_date >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')::date
+              AND booking_date < DATE_TRUNC('month', CURRENT_DATE)::date;
         """)
         previous_stats = cur.fetchone()
         
@@ -831,7 +836,7 @@ def get_bookings_stats(cur):
         }
         
     except Exception as e:
-        print(f"Error fetching bookings stats: {e}")
+        logger.error("Error fetching bookings stats: %s", e)
         return {
             "total_bookings": 0,
             "total_change": 0,
@@ -861,6 +866,9 @@ def update_booking_status(booking_id):
         )
         
         conn.commit()
+        schedule_refresh()
+        if new_status in ('Confirmed', 'Cancelled'):
+            BOOKINGS.inc(event=new_status.lower(), source='admin')
         return jsonify({'success': True, 'message': 'Booking status updated successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -993,14 +1001,12 @@ def add_student():
     except psycopg2.Error as e:
         if conn:
             conn.rollback()
-        print(f"Database error adding student: {e}")
-        traceback.print_exc()
+        logger.exception("Database error adding student: %s", e)
         return jsonify({'success': False, 'message': 'Database error occurred'}), 500
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Error adding student: {e}")
-        traceback.print_exc()
+        logger.exception("Error adding student: %s", e)
         return jsonify({'success': False, 'message': 'An error occurred while adding student'}), 500
     finally:
         if cur:
@@ -1092,6 +1098,7 @@ def delete_student(student_id):
             
             # Commit transaction
             conn.commit()
+            schedule_refresh()
             
             # Log the action
             current_app.logger.info(f'Admin {current_user.id} deleted student {student_id}')
@@ -1104,7 +1111,7 @@ def delete_student(student_id):
         except psycopg2.Error as e:
             conn.rollback()
             # If there are foreign key constraints, soft delete instead
-            print(f"Hard delete failed, trying soft delete: {e}")
+            logger.warning("Hard delete failed, trying soft delete: %s", e)
             
             # Perform soft delete (update status and anonymize email)
             cur.execute("""
@@ -1126,8 +1133,7 @@ def delete_student(student_id):
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Error deleting student: {e}")
-        traceback.print_exc()
+        logger.exception("Error deleting student: %s", e)
         return jsonify({'success': False, 'message': 'An error occurred while deleting student'}), 500
     finally:
         if cur:
@@ -1244,8 +1250,7 @@ def manage_students():
                              user=current_user)
         
     except Exception as e:
-        print(f"Error in manage_students: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in manage_students: %s", e)
         return render_template('admin/users.html',
                              students=[],
                              stats={'total_students': 0, 'active_students': 0, 'pending_students': 0, 'inactive_students': 0},
@@ -1277,7 +1282,7 @@ def payments():
                              payments=payment_details,
                              stats=payments_stats)
     except Exception as e:
-        print(f"Error in payments page: {e}")
+        logger.error("Error in payments page: %s", e)
         return render_template('/admin/payment.html', 
                              user=current_user,
                              payments=[],
@@ -1298,6 +1303,7 @@ def get_payment_details(cur):
                 p.payment_method,
                 p.payment_date,
                 p.payment_status,
+                p.payment_receipt,
                 u.user_first_name,
                 u.user_last_name,
                 u.user_email,
@@ -1315,7 +1321,7 @@ def get_payment_details(cur):
         """)
         return cur.fetchall()
     except Exception as e:
-        print(f"Error fetching payment details: {e}")
+        logger.error("Error fetching payment details: %s", e)
         return []
 
 def get_payments_stats(cur):
@@ -1330,7 +1336,8 @@ def get_payments_stats(cur):
                 COUNT(CASE WHEN payment_status = 'Failed' THEN 1 END) as failed_payments,
                 COALESCE(SUM(CASE WHEN payment_status = 'Success' THEN payment_amount ELSE 0 END), 0) as successful_revenue
             FROM payments 
-            WHERE DATE_TRUNC('month', payment_date) = DATE_TRUNC('month', CURRENT_DATE);
+            WHERE payment_date >= DATE_TRUNC('month', CURRENT_DATE)::date
+              AND payment_date < DATE_TRUNC('month', CURRENT_DATE + INTERVAL '1 month')::date;
         """)
         current_stats = cur.fetchone()
         
@@ -1344,7 +1351,8 @@ def get_payments_stats(cur):
                 COUNT(CASE WHEN payment_status = 'Failed' THEN 1 END) as failed_payments,
                 COALESCE(SUM(CASE WHEN payment_status = 'Success' THEN payment_amount ELSE 0 END), 0) as successful_revenue
             FROM payments 
-            WHERE DATE_TRUNC('month', payment_date) = DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month');
+            WHERE payment_date >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL '1 month')::date
+              AND payment_date < DATE_TRUNC('month', CURRENT_DATE)::date;
         """)
         previous_stats = cur.fetchone()
         
@@ -1388,7 +1396,7 @@ def get_payments_stats(cur):
         }
         
     except Exception as e:
-        print(f"Error fetching payments stats: {e}")
+        logger.error("Error fetching payments stats: %s", e)
         return {
             "total_payments": 0,
             "total_payments_change": 0,
@@ -1416,11 +1424,14 @@ def update_payment_status(payment_id):
         cur = conn.cursor()
         
         cur.execute(
-            "UPDATE payments SET payment_status = %s WHERE payment_id = %s",
+            "UPDATE payments SET payment_status = %s WHERE payment_id = %s RETURNING payment_method",
             (new_status, payment_id)
         )
+        updated = cur.fetchone()
         
         conn.commit()
+        if updated and new_status in ('Success', 'Failed'):
+            PAYMENTS.inc(method=payment_method_label(updated[0]), status=new_status)
         return jsonify({'success': True, 'message': 'Payment status updated successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1432,64 +1443,89 @@ def update_payment_status(payment_id):
 
 
 ################# SUPPORT ######################
+# Static help topics; the rendered list is fragment-cached in support.html
+SUPPORT_CATEGORIES = [
+    {
+        'title': 'Booking Help',
+        'icon': 'booking',
+        'questions': [
+            'How to make a booking?',
+            'How to cancel a booking?',
+            'Booking status meanings',
+            'Room selection guide'
+        ]
+    },
+    {
+        'title': 'Payment Help',
+        'icon': 'payment',
+        'questions': [
+            'Payment methods accepted',
+            'Payment failed issues',
+            'Refund process',
+            'Payment confirmation'
+        ]
+    },
+    {
+        'title': 'Account Help',
+        'icon': 'account',
+        'questions': [
+            'How to update profile?',
+            'Password reset',
+            'Account verification',
+            'Contact information update'
+        ]
+    },
+    {
+        'title': 'Technical Support',
+        'icon': 'technical',
+        'questions': [
+            'Website issues',
+            'Mobile app problems',
+            'Login difficulties',
+            'Browser compatibility'
+        ]
+    }
+]
+
+
 @admin.route('/admin/support')
 @login_required
 @admin_required
 def support():
     try:
-        support_categories = [
-            {
-                'title': 'Booking Help',
-                'icon': 'booking',
-                'questions': [
-                    'How to make a booking?',
-                    'How to cancel a booking?',
-                    'Booking status meanings',
-                    'Room selection guide'
-                ]
-            },
-            {
-                'title': 'Payment Help',
-                'icon': 'payment',
-                'questions': [
-                    'Payment methods accepted',
-                    'Payment failed issues',
-                    'Refund process',
-                    'Payment confirmation'
-                ]
-            },
-            {
-                'title': 'Account Help',
-                'icon': 'account',
-                'questions': [
-                    'How to update profile?',
-                    'Password reset',
-                    'Account verification',
-                    'Contact information update'
-                ]
-            },
-            {
-                'title': 'Technical Support',
-                'icon': 'technical',
-                'questions': [
-                    'Website issues',
-                    'Mobile app problems',
-                    'Login difficulties',
-                    'Browser compatibility'
-                ]
-            }
-        ]
-        
         return render_template('/admin/support.html', 
                              user=current_user,
-                             categories=support_categories)
+                             categories=SUPPORT_CATEGORIES)
     except Exception as e:
-        print(f"Error in support page: {e}")
+        logger.error("Error in support page: %s", e)
         return render_template('/admin/support.html', 
                              user=current_user,
                              categories=[])
 
 
+################# SLOW QUERIES ######################
+@admin.route('/admin/slow-queries')
+@login_required
+@admin_required
+def slow_queries():
+    from app.db.slow_queries import top_offenders, slow_query_dir
+
+    order_by = request.args.get('order', 'total_ms')
+    if order_by not in ('total_ms', 'count', 'p95_ms', 'max_ms'):
+        order_by = 'total_ms'
+    try:
+        offenders = top_offenders(slow_query_dir(current_app), limit=50, order_by=order_by)
+    except Exception as e:
+        logger.error("Error loading slow queries: %s", e)
+        offenders = []
+
+    return render_template('/admin/slow_queries.html',
+                         user=current_user,
+                         offenders=offenders,
+                         order_by=order_by,
+                         threshold=current_app.config.get('SLOW_QUERY_MS'))
+
+
 ################# SETTINGS SECTION ####################### 
 @admin.route('/admin/settings')
 @login_required
@@ -1562,8 +1598,7 @@ def update_profile():
         })
         
     except Exception as e:
-        print(f"Error updating profile: {e}")
-        traceback.print_exc()
+        logger.exception("Error updating profile: %s", e)
         
         if conn:
             conn.rollback()
@@ -1652,8 +1687,7 @@ def change_password():
         })
         
     except Exception as e:
-        print(f"Error changing password: {e}")
-        traceback.print_exc()
+        logger.exception("Error changing password: %s", e)
         
         if conn:
             conn.rollback()
@@ -1675,7 +1709,7 @@ def verify_password(plain_password, hashed_password):
     try:
         return check_password_hash(hashed_password, plain_password)
     except Exception as e:
-        print(f"Error verifying password: {e}")
+        logger.error("Error verifying password: %s", e)
         return False
 
 def hash_password(password):
@@ -1683,7 +1717,7 @@ def hash_password(password):
     try:
         return generate_password_hash(password)
     except Exception as e:
-        print(f"Error hashing password: {e}")
+        logger.error("Error hashing password: %s", e)
         # Fallback
         return generate_password_hash(password)
 
@@ -1694,6 +1728,7 @@ def hash_password(password):
 @admin.route('/admin/reports')
 @login_required
 @admin_required
+@read_only
 def reports():
     conn = None
     cur = None
@@ -1701,50 +1736,59 @@ def reports():
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        reports_data = get_reports_data(cur)
-        charts_data = get_charts_data(cur)
+        # ?history=1 also counts semesters that were archived out of the live tables
+        history = request.args.get('history') == '1'
+        reports_data = get_reports_data(cur, history)
+        charts_data = get_charts_data(cur, history)
         
         return render_template('/admin/reports.html', 
                              user=current_user,
                              reports=reports_data,
-                             charts=charts_data)
+                             charts=charts_data,
+                             history=history)
     except Exception as e:
-        print(f"Error in reports page: {e}")
+        logger.error("Error in reports page: %s", e)
         return render_template('/admin/reports.html', 
                              user=current_user,
                              reports={},
-                             charts={})
+                             charts={},
+                             history=False)
     finally:
         if cur:
             cur.close()
         if conn:
             release_db_connection(conn)
 
-def get_reports_data(cur):
+def report_tables(history=False):
+    """Live tables, or views that also cover semesters moved out by `flask db archive`"""
+    return ('bookings_history', 'payments_history') if history else ('bookings', 'payments')
+
+def get_reports_data(cur, history=False):
+    bookings, payments = report_tables(history)
     try:
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 -- Booking statistics
-                (SELECT COUNT(*) FROM bookings) as total_bookings,
-                (SELECT COUNT(*) FROM bookings WHERE booking_status = 'Confirmed') as confirmed_bookings,
-                (SELECT COUNT(*) FROM bookings WHERE booking_status = 'Pending') as pending_bookings,
-                (SELECT COUNT(*) FROM bookings WHERE booking_status = 'Cancelled') as cancelled_bookings,
+                (SELECT COUNT(*) FROM {bookings}) as total_bookings,
+                (SELECT COUNT(*) FROM {bookings} WHERE booking_status = 'Confirmed') as confirmed_bookings,
+                (SELECT COUNT(*) FROM {bookings} WHERE booking_status = 'Pending') as pending_bookings,
+                (SELECT COUNT(*) FROM {bookings} WHERE booking_status = 'Cancelled') as cancelled_bookings,
                 
                 -- Payment statistics
-                (SELECT COUNT(*) FROM payments) as total_payments,
-                (SELECT COUNT(*) FROM payments WHERE payment_status = 'Success') as successful_payments,
-                (SELECT COUNT(*) FROM payments WHERE payment_status = 'Pending') as pending_payments,
-                (SELECT COUNT(*) FROM payments WHERE payment_status = 'Failed') as failed_payments,
-                (SELECT COALESCE(SUM(payment_amount), 0) FROM payments WHERE payment_status = 'Success') as total_revenue,
+                (SELECT COUNT(*) FROM {payments}) as total_payments,
+                (SELECT COUNT(*) FROM {payments} WHERE payment_status = 'Success') as successful_payments,
+                (SELECT COUNT(*) FROM {payments} WHERE payment_status = 'Pending') as pending_payments,
+                (SELECT COUNT(*) FROM {payments} WHERE payment_status = 'Failed') as failed_payments,
+                (SELECT COALESCE(SUM(payment_amount), 0) FROM {payments} WHERE payment_status = 'Success') as total_revenue,
                 
                 -- Room statistics
                 (SELECT COUNT(*) FROM rooms) as total_rooms,
-                (SELECT COUNT(DISTINCT booking_room_id) FROM bookings WHERE booking_status = 'Confirmed') as occupied_rooms,
+                (SELECT COUNT(DISTINCT booking_room_id) FROM {bookings} WHERE booking_status = 'Confirmed') as occupied_rooms,
                 (SELECT COUNT(*) FROM users) as total_users,
                 
                 -- Recent activity
-                (SELECT COUNT(*) FROM bookings WHERE booking_date >= CURRENT_DATE - INTERVAL '7 days') as weekly_bookings,
-                (SELECT COALESCE(SUM(payment_amount), 0) FROM payments WHERE payment_date >= CURRENT_DATE - INTERVAL '30 days' AND payment_status = 'Success') as monthly_revenue,
+                (SELECT COUNT(*) FROM {bookings} WHERE booking_date >= CURRENT_DATE - INTERVAL '7 days') as weekly_bookings,
+                (SELECT COALESCE(SUM(payment_amount), 0) FROM {payments} WHERE payment_date >= CURRENT_DATE - INTERVAL '30 days' AND payment_status = 'Success') as monthly_revenue,
                 
                 -- Gender distribution
                 (SELECT COUNT(*) FROM users WHERE user_gender = 'Male') as male_users,
@@ -1756,22 +1800,23 @@ def get_reports_data(cur):
                 (SELECT COUNT(*) FROM rooms WHERE room_type = 'Shared') as shared_rooms,
                 
                 -- Performance metrics
-                (SELECT AVG(payment_amount) FROM payments WHERE payment_status = 'Success') as avg_booking_value,
-                (SELECT COUNT(*) FROM bookings WHERE booking_date = CURRENT_DATE) as today_bookings
+                (SELECT AVG(payment_amount) FROM {payments} WHERE payment_status = 'Success') as avg_booking_value,
+                (SELECT COUNT(*) FROM {bookings} WHERE booking_date = CURRENT_DATE) as today_bookings
         """)
         return cur.fetchone()
     except Exception as e:
-        print(f"Error fetching reports data: {e}")
+        logger.error("Error fetching reports data: %s", e)
         return {}
 
-def get_charts_data(cur):
+def get_charts_data(cur, history=False):
+    bookings, payments = report_tables(history)
     try:
         # Monthly booking trends
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 TO_CHAR(booking_date, 'Mon') as month,
                 COUNT(*) as booking_count
-            FROM bookings 
+            FROM {bookings} 
             WHERE booking_date >= CURRENT_DATE - INTERVAL '6 months'
             GROUP BY TO_CHAR(booking_date, 'Mon'), DATE_TRUNC('month', booking_date)
             ORDER BY DATE_TRUNC('month', booking_date)
@@ -1780,7 +1825,7 @@ def get_charts_data(cur):
         booking_trends = cur.fetchall()
         
         # Hostel distribution
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 h.hostel_name,
                 COUNT(b.booking_id) as booking_count,
@@ -1788,41 +1833,41 @@ def get_charts_data(cur):
                 COALESCE(SUM(p.payment_amount), 0) as total_revenue
             FROM hostels h
             LEFT JOIN rooms r ON r.room_hostel_id = h.hostel_id
-            LEFT JOIN bookings b ON b.booking_room_id = r.room_id AND b.booking_status = 'Confirmed'
-            LEFT JOIN payments p ON p.payment_reference_number = b.booking_reference_number AND p.payment_status = 'Success'
+            LEFT JOIN {bookings} b ON b.booking_room_id = r.room_id AND b.booking_status = 'Confirmed'
+            LEFT JOIN {payments} p ON p.payment_reference_number = b.booking_reference_number AND p.payment_status = 'Success'
             GROUP BY h.hostel_id, h.hostel_name
             ORDER BY total_revenue DESC;
         """)
         hostel_stats = cur.fetchall()
         
         # Payment method distribution
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 payment_method,
                 COUNT(*) as payment_count,
                 SUM(payment_amount) as total_amount
-            FROM payments 
+            FROM {payments} 
             WHERE payment_status = 'Success'
             GROUP BY payment_method;
         """)
         payment_methods = cur.fetchall()
         
         # Booking status distribution
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 booking_status,
                 COUNT(*) as status_count
-            FROM bookings 
+            FROM {bookings} 
             GROUP BY booking_status;
         """)
         booking_statuses = cur.fetchall()
         
         # Monthly revenue trends
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 TO_CHAR(payment_date, 'Mon') as month,
                 COALESCE(SUM(payment_amount), 0) as revenue
-            FROM payments 
+            FROM {payments} 
             WHERE payment_status = 'Success' 
             AND payment_date >= CURRENT_DATE - INTERVAL '6 months'
             GROUP BY TO_CHAR(payment_date, 'Mon'), DATE_TRUNC('month', payment_date)
@@ -1832,7 +1877,7 @@ def get_charts_data(cur):
         revenue_trends = cur.fetchall()
         
         # Recent bookings
-        cur.execute("""
+        cur.execute(f"""
             SELECT 
                 b.booking_reference_number,
                 u.user_first_name,
@@ -1840,7 +1885,7 @@ def get_charts_data(cur):
                 r.room_number,
                 b.booking_date,
                 b.booking_status
-            FROM bookings b
+            FROM {bookings} b
             JOIN users u ON b.booking_user_id = u.user_id
             JOIN rooms r ON b.booking_room_id = r.room_id
             ORDER BY b.booking_date DESC
@@ -1857,7 +1902,7 @@ def get_charts_data(cur):
             'recent_bookings': recent_bookings
         }
     except Exception as e:
-        print(f"Error fetching charts data: {e}")
+        logger.error("Error fetching charts data: %s", e)
         return {
             'booking_trends': [],
             'hostel_stats': [],
@@ -1870,13 +1915,18 @@ def get_charts_data(cur):
 @admin.route('/admin/reports/export/pdf')
 @login_required
 @admin_required
+@read_only
 def export_reports_pdf():
+    # WeasyPrint drags in cairo/pango and fonttools, so only load it when a PDF is asked for
+    from weasyprint import HTML
+
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        reports_data = get_reports_data(cur)
-        charts_data = get_charts_data(cur)
+        history = request.args.get('history') == '1'
+        reports_data = get_reports_data(cur, history)
+        charts_data = get_charts_data(cur, history)
         
         # Generate comprehensive PDF
         html_content = render_template('/admin/reports_pdf.html',
@@ -1885,7 +1935,8 @@ def export_reports_pdf():
                                      generated_at=datetime.now())
         
         # Create PDF
-        pdf_file = HTML(string=html_content, base_url=os.path.dirname(__file__)).write_pdf()
+        with PDF_RENDER.time(report='reports'):
+            pdf_file = HTML(string=html_content, base_url=os.path.dirname(__file__)).write_pdf()
         
         cur.close()
         release_db_connection(conn)
@@ -1899,7 +1950,7 @@ def export_reports_pdf():
             }
         )
     except Exception as e:
-        print(f"Error generating PDF: {e}")
+        logger.error("Error generating PDF: %s", e)
         return "Error generating PDF report", 500
 
 
@@ -1907,13 +1958,15 @@ def export_reports_pdf():
 @admin.route('/admin/reports/export/csv')
 @login_required
 @admin_required
+@read_only
 def export_reports_csv():
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        reports_data = get_reports_data(cur)
-        charts_data = get_charts_data(cur)
+        history = request.args.get('history') == '1'
+        reports_data = get_reports_data(cur, history)
+        charts_data = get_charts_data(cur, history)
         
         # Generate comprehensive CSV
         csv_content = []
@@ -1964,5 +2017,5 @@ def export_reports_csv():
             }
         )
     except Exception as e:
-        print(f"Error generating CSV: {e}")
+        logger.error("Error generating CSV: %s", e)
         return "Error generating CSV report", 500
\ No newline at end of file
@@ -0,0 +1,299 @@
+"""Async versions of the JSON endpoints, served by app/asgi.py when the app runs under ASGI.
+
+Each mirrors the Flask view of the same URL (admin.py / student.py) and must answer the same
+way; statements are the same apart from asyncpg's $n placeholders.
+"""
+import uuid
+import logging
+from app.asgi import async_route, EventStream
+from app.db.aio import connection, transaction
+from app.db.matviews import schedule_refresh, freshness
+from app.services.metrics import BOOKINGS, PAYMENTS, payment_method_label
+from app.services.live_stats import async_event_stream, requested_groups, requested_rooms, EVENT_STREAM_HEADERS
+from app.services.student_counters import (cached_counters, begin_load, remember_counters, counters_from_row,
+                                           invalidate_counters)
+from .admin import get_room_features
+
+logger = logging.getLogger(__name__)
+
+FRESHNESS_QUERY = """
+    SELECT view_refreshed_at FROM materialized_view_refreshes WHERE view_name = $1;
+"""
+STUDENT_COUNTERS_QUERY = """
+    SELECT
+        (SELECT COUNT(*)
+         FROM bookings
+         WHERE booking_user_id = $1
+         AND booking_status = 'Pending') AS pending_bookings,
+        (SELECT profile_account_balance
+         FROM user_profile
+         WHERE profile_user_id = $1) AS account_balance
+"""
+
+
+############ ADMIN ##################
+@async_route('/admin/events', admin=True)
+async def live_events(request):
+    """Dashboard/bookings stats as they change, held open as a coroutine"""
+    return EventStream(async_event_stream(requested_groups(request.args.get('group', ()))), EVENT_STREAM_HEADERS)
+
+
+@async_route('/admin/get_hostels', admin=True, error='Error fetching hostels data')
+async def get_hostels(request):
+    """Get all hostels from database"""
+    async with connection() as conn:
+        # Precomputed in the hostel_occupancy materialized view (migration 0003)
+        hostels = await conn.fetch("""
+            SELECT
+                hostel_id,
+                hostel_name,
+                hostel_location,
+                hostel_total_rooms,
+                hostel_description,
+                hostel_image,
+                total_rooms,
+                occupied_rooms,
+                available_rooms
+            FROM hostel_occupancy
+            ORDER BY hostel_name;
+        """)
+        refreshed = await conn.fetchrow(FRESHNESS_QUERY, 'hostel_occupancy')
+
+    hostel_list = []
+    for hostel in hostels:
+        hostel_dict = dict(hostel)
+        hostel_dict['status'] = 'available' if hostel_dict['available_rooms'] > 0 else 'full'
+        hostel_list.append(hostel_dict)
+
+    return {
+        'success': True,
+        'hostels': hostel_list,
+        'freshness': freshness('hostel_occupancy', refreshed)
+    }, 200
+
+
+@async_route('/admin/get_rooms/<int:hostel_id>', admin=True, error='Error fetching rooms data')
+async def get_rooms(request, hostel_id):
+    """Get all rooms for a specific hostel"""
+    async with connection() as conn:
+        # Precomputed in the room_occupancy materialized view (migration 0003)
+        rooms = await conn.fetch("""
+            SELECT
+                room_id,
+                room_number,
+                room_type,
+                room_capacity,
+                room_price_per_sem,
+                status,
+                images
+            FROM room_occupancy
+            WHERE room_hostel_id = $1
+            ORDER BY room_number;
+        """, hostel_id)
+        refreshed = await conn.fetchrow(FRESHNESS_QUERY, 'room_occupancy')
+
+    room_list = []
+    for room in rooms:
+        room_dict = dict(room)
+        room_dict['features'] = get_room_features(room_dict['room_type'])
+        room_list.append(room_dict)
+
+    return {
+        'success': True,
+        'rooms': room_list,
+        'freshness': freshness('room_occupancy', refreshed)
+    }, 200
+
+
+@async_route('/admin/get_students', admin=True, error='Error fetching students data')
+async def get_students(request):
+    """Get all students for room assignment"""
+    async with connection() as conn:
+        students = await conn.fetch("""
+            SELECT
+                u.user_id,
+                u.user_first_name,
+                u.user_last_name,
+                u.user_email,
+                p.profile_student_id
+            FROM users u
+            JOIN user_profile p ON u.user_id = p.profile_user_id
+            JOIN user_roles ur ON u.user_id = ur.user_role_user_id
+            JOIN roles r ON ur.user_role_role_id = r.role_id
+            WHERE r.role_name = 'student'
+            AND u.user_id NOT IN (
+                SELECT booking_user_id
+                FROM bookings
+                WHERE booking_status = 'Confirmed'
+            )
+            ORDER BY u.user_first_name, u.user_last_name;
+        """)
+
+    return {
+        'success': True,
+        'students': [dict(student) for student in students]
+    }, 200
+
+
+@async_route('/admin/api/bookings/<int:booking_id>/status', methods=('PUT',), admin=True)
+async def update_booking_status(request, booking_id):
+    data = await request.get_json()
+    new_status = data.get('status')
+
+    async with transaction() as conn:
+        await conn.execute("UPDATE bookings SET booking_status = $1 WHERE booking_id = $2", new_status, booking_id)
+
+    schedule_refresh()
+    if new_status in ('Confirmed', 'Cancelled'):
+        BOOKINGS.inc(event=new_status.lower(), source='admin')
+    return {'success': True, 'message': 'Booking status updated successfully'}, 200
+
+
+@async_route('/admin/api/payments/<int:payment_id>/status', methods=('PUT',), admin=True)
+async def update_payment_status(request, payment_id):
+    data = await request.get_json()
+    new_status = data.get('status')
+
+    async with transaction() as conn:
+        updated = await conn.fetchrow(
+            "UPDATE payments SET payment_status = $1 WHERE payment_id = $2 RETURNING payment_method",
+            new_status, payment_id)
+
+    if updated and new_status in ('Success', 'Failed'):
+        PAYMENTS.inc(method=payment_method_label(updated['payment_method']), status=new_status)
+    return {'success': True, 'message': 'Payment status updated successfully'}, 200
+
+
+############ STUDENT ##################
+@async_route('/student/counters', error='Error getting counters')
+async def counters(request):
+    """Badge counters of the signed-in student, from this process's cache when it has them"""
+    counters = cached_counters(request.user_id)
+    if counters is None:
+        loaded_at = begin_load()
+        async with connection() as conn:
+            counters = counters_from_row(await conn.fetchrow(STUDENT_COUNTERS_QUERY, request.user_id))
+        remember_counters(request.user_id, counters, loaded_at)
+    return {'success': True, 'counters': counters}, 200
+
+
+@async_route('/student/rooms/events')
+async def room_events(request):
+    """Spots left in the rooms of the student's page as they change, held open as a coroutine"""
+    rooms = requested_rooms(','.join(request.args.get('rooms', ())))
+    return EventStream(async_event_stream(rooms=rooms), EVENT_STREAM_HEADERS)
+
+
+@async_route('/student/bookings/create', methods=('POST',), error='Error creating booking', error_status=200)
+async def create_booking(request):
+    """Create a new booking for a room"""
+    data = await request.get_json()
+    room_id = data.get('room_id')
+    user_id = request.user_id
+
+    if not room_id:
+        return {'success': False, 'message': 'Room ID is required'}, 200
+    room_id = int(room_id)
+
+    async with transaction() as conn:
+        # Check if room is available, and hold it until this booking commits
+        room = await conn.fetchrow("""
+            SELECT r.room_id
+            FROM rooms r
+            WHERE r.room_id = $1
+            AND (
+                SELECT COUNT(*)
+                FROM bookings b
+                WHERE b.booking_room_id = r.room_id
+                AND b.booking_status IN ('Confirmed', 'Pending')
+            ) < r.room_capacity
+            FOR UPDATE
+        """, room_id)
+        if not room:
+            return {'success': False, 'message': 'Room is not available'}, 200
+
+        # Check if user already has a pending or confirmed booking
+        active = await conn.fetchrow("""
+            SELECT b.booking_id
+            FROM bookings b
+            LEFT JOIN allocations a ON a.allocation_booking_id = b.booking_id
+            WHERE b.booking_user_id = $1
+            AND (
+                b.booking_status = 'Pending'
+                OR (b.booking_status = 'Confirmed' AND a.allocation_vaccate_date > CURRENT_DATE)
+            )
+        """, user_id)
+        if active:
+            return {'success': False, 'message': 'You already have an active booking'}, 200
+
+        reference_number = f"BK{uuid.uuid4().hex[:8].upper()}"
+
+        room_price = await conn.fetchval("SELECT room_price_per_sem FROM rooms WHERE room_id = $1", room_id)
+        if room_price is None:
+            return {'success': False, 'message': 'Room not found'}, 200
+
+        profile = await conn.fetchrow("""
+            SELECT profile_account_balance
+            FROM user_profile
+            WHERE profile_user_id = $1
+            FOR UPDATE
+        """, user_id)
+        if not profile:
+            return {'success': False, 'message': 'User profile not found'}, 200
+        user_balance = profile['profile_account_balance']
+
+        # If not enough balance, create only booking and exit
+        if user_balance < room_price:
+            booking_id = await conn.fetchval("""
+                INSERT INTO bookings (booking_reference_number, booking_user_id, booking_room_id, booking_status)
+                VALUES ($1, $2, $3, 'Pending')
+                RETURNING booking_id
+            """, reference_number, user_id, room_id)
+            paid = False
+        else:
+            # Otherwise user can pay → deduct balance
+            await conn.execute("""
+                UPDATE user_profile
+                SET profile_account_balance = $1
+                WHERE profile_user_id = $2
+            """, user_balance - room_price, user_id)
+
+            payment_ref = f"PM{uuid.uuid4().hex[:8].upper()}"
+            payment_id = await conn.fetchval("""
+                INSERT INTO payments (payment_reference_number, payment_amount, payment_method, payment_status)
+                VALUES ($1, $2, 'Mpesa', 'Success')
+                RETURNING payment_id
+            """, payment_ref, room_price)
+
+            booking_id = await conn.fetchval("""
+                INSERT INTO bookings (booking_reference_number, booking_user_id, booking_room_id, booking_status)
+                VALUES ($1, $2, $3, 'Confirmed')
+                RETURNING booking_id
+            """, reference_number, user_id, room_id)
+
+            await conn.execute("""
+                INSERT INTO allocations (allocation_booking_id, allocation_payment_id, allocation_vaccate_date)
+                VALUES ($1, $2, CURRENT_DATE + INTERVAL '120 days')
+            """, booking_id, payment_id)
+            paid = True
+
+    invalidate_counters(user_id)
+    BOOKINGS.inc(event='created', source='student')
+    if not paid:
+        return {
+            'success': True,
+            'message': 'Booking created but not confirmed. Insufficient balance.',
+            'booking_id': booking_id,
+            'reference_number': reference_number
+        }, 200
+
+    schedule_refresh()
+    BOOKINGS.inc(event='confirmed', source='student')
+    PAYMENTS.inc(method='Mpesa', status='Success')
+    return {
+        'success': True,
+        'message': 'Booking confirmed and room allocated successfully.',
+        'booking_id': booking_id,
+        'reference_number': reference_number,
+        'payment_reference': payment_ref
+    }, 200
@@ -1,17 +1,13 @@
-import time
-import random
-import string
-import os
 import pytz
-import traceback
-from flask import Blueprint, render_template, url_for, request, redirect, session, jsonify, flash, current_app, abort
+import logging
+from flask import Blueprint, render_template, url_for, request, redirect, session, jsonify, current_app, abort
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from PIL import Image
 from app.db.db import get_db_connection, release_db_connection
+from app.db.prepared import prepared
 from flask_login import login_user, logout_user, login_required, current_user
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.__init__ import User
+from app.services.metrics import LOGINS
 from functools import wraps
 
 
@@ -21,6 +17,22 @@ now = datetime.now(nairobi)
 
 # Creating the blueprint
 auth = Blueprint('auth', __name__, url_prefix='/')
+logger = logging.getLogger(__name__)
+
+# Run on every admin page (and by load_user on every request), so parsed and planned once per connection
+USER_ROLE_NAMES = prepared('user_role_names', """
+    SELECT r.role_name
+    FROM user_roles ur
+    JOIN roles r ON ur.user_role_role_id = r.role_id
+    WHERE ur.user_role_user_id = %s
+""")
+LOGIN_LOOKUP = prepared('login_lookup', """
+    SELECT user_id, user_password_hash, user_email, user_first_name, user_last_name,
+        user_gender, user_phone_number
+    FROM users
+    WHERE user_email = %s
+""")
+LOGIN_ROLE_IDS = prepared('login_role_ids', "SELECT user_role_role_id FROM user_roles WHERE user_role_user_id = %s")
 
 
 def admin_required(view_func):
@@ -33,12 +45,7 @@ def admin_required(view_func):
         conn = get_db_connection()
         try:
             cur = conn.cursor()
-            cur.execute("""
-                SELECT r.role_name
-                FROM user_roles ur
-                JOIN roles r ON ur.user_role_role_id = r.role_id
-                WHERE ur.user_role_user_id = %s
-            """, (current_user.id,))
+            USER_ROLE_NAMES.execute(cur, (current_user.id,))
             roles = [row[0] for row in cur.fetchall()]
             if "admin" not in roles:
                 abort(403)  # Forbidden
@@ -71,27 +78,20 @@ def login():
 
             try:
                 cur = conn.cursor()
-                cur.execute(
-                    '''SELECT user_id, user_password_hash, user_email, user_first_name, user_last_name,
-                        user_gender, user_phone_number
-                       FROM users
-                       WHERE user_email = %s''',
-                    (email,)
-                )
+                LOGIN_LOOKUP.execute(cur, (email,))
                 user_data = cur.fetchone()
 
                 # If user not found or password is null
                 if not user_data or not user_data[1]:
+                    LOGINS.inc(result='failure')
                     return jsonify({"message": "Invalid email or password!"}), 400
 
                 if not check_password_hash(user_data[1], password):
+                    LOGINS.inc(result='failure')
                     return jsonify({"message": "Invalid email or password!"}), 400
 
                 # Fetch user roles after successful password check
-                cur.execute(
-                    "SELECT user_role_role_id FROM user_roles WHERE user_role_user_id = %s",
-                    (user_data[0],)
-                )
+                LOGIN_ROLE_IDS.execute(cur, (user_data[0],))
                 user_role = [role[0] for role in cur.fetchall()]
 
                 if not user_role:
@@ -101,6 +101,7 @@ def login():
                 user_id = user_data[0]
                 user = User(user_id, user_data[2], user_data[3], user_data[4], user_data[5], user_data[6])
                 login_user(user, remember=True)
+                LOGINS.inc(result='success')
 
                 # Redirect based on role
                 if 2 in user_role:
@@ -117,7 +118,7 @@ def login():
         # For GET requests (page load)
         return render_template('/shared/login.html', user=current_user)
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error during login: %s", e)
 
 
 
@@ -154,7 +155,7 @@ def signup():
         
         try:
             cur = conn.cursor()
-            print("Inserting data...........")
+            logger.debug("Inserting data...........")
 
             # Check if the user already exists
             cur.execute("SELECT user_id FROM users WHERE user_email = %s", (user_email,))
@@ -207,8 +208,7 @@ def signup():
                 "message": "Account created successfully! Redirecting..."
             }), 200
         except Exception as e:
-            traceback.print_exc()
-            print(f"Error during signup: {e}")
+            logger.exception("Error during signup: %s", e)
 
         finally:
             cur.close()
@@ -1,25 +1,61 @@
-import os
-import random
-import string
-import json
-import io
-import traceback
 import psycopg2.extras
-from psycopg2.extras import execute_values
-from flask import Flask, render_template, url_for, request, jsonify, Blueprint, current_app, redirect, make_response, Response
-from flask_login import login_user, logout_user, login_required, current_user
-from app.db.db import get_db_connection, release_db_connection
+import logging
+from flask import render_template, url_for, request, jsonify, Blueprint, redirect, flash, current_app
+from flask_login import login_required, current_user
+from app.db.db import get_db_connection, release_db_connection, read_only
+from app.db.prepared import prepared
+from app.db.instrumentation import query_budget
+from app.db.matviews import schedule_refresh
+from app.services.uploads import save_receipt, queue_receipt, discard_receipt, UploadError
+from app.services.storage import record_blob, attach_payment_receipt
+from app.services.metrics import BOOKINGS, PAYMENTS, payment_method_label
+from app.services.live_stats import event_stream_response, requested_rooms, room_streams_open, room_spots
+from app.services.student_counters import student_counters, invalidate_counters
 from werkzeug.utils import secure_filename
-from PIL import Image
-from datetime import datetime, timedelta
-from weasyprint import HTML
+from datetime import datetime
 
 student = Blueprint('student', __name__, url_prefix='/')
+logger = logging.getLogger(__name__)
+
+# Hot statements, parsed and planned once per connection (see app/db/prepared.py)
+USER_BALANCE = prepared('user_balance', """
+    SELECT profile_account_balance
+    FROM user_profile
+    WHERE profile_user_id = %s
+""")
+# Core of the room search; each combination of filters becomes its own prepared statement
+AVAILABLE_ROOMS_QUERY = """
+    SELECT DISTINCT
+        r.room_id,
+        r.room_number,
+        r.room_type,
+        r.room_capacity,
+        r.room_price_per_sem,
+        h.hostel_id,
+        h.hostel_name,
+        h.hostel_location,
+        h.hostel_description,
+        (r.room_capacity - COALESCE((
+            SELECT COUNT(*)
+            FROM bookings b
+            WHERE b.booking_room_id = r.room_id
+            AND b.booking_status IN ('Confirmed', 'Pending')
+        ), 0)) AS spots_left
+    FROM rooms r
+    JOIN hostels h ON r.room_hostel_id = h.hostel_id
+    WHERE (r.room_capacity - COALESCE((
+        SELECT COUNT(*)
+        FROM bookings b
+        WHERE b.booking_room_id = r.room_id
+        AND b.booking_status IN ('Confirmed', 'Pending')
+    ), 0)) > 0
+"""
 
 
 ######################## DASHBOARD ###########################
 @student.route('/student/dashboard')
 @login_required
+@query_budget(10)
 def student_dashboard():
     conn = None
     cur = None
@@ -40,7 +76,7 @@ def student_dashboard():
                              stats=stats,
                              recent_bookings=recent_bookings)
     except Exception as e:
-        print(f"Error in student dashboard: {e}")
+        logger.error("Error in student dashboard: %s", e)
         return render_template('/student/dashboard.html', 
                              user=current_user,
                              stats={},
@@ -97,14 +133,8 @@ def get_student_stats(cur, user_id):
             days_remaining = (vaccate_date - datetime.now().date()).days
             days_remaining = max(0, days_remaining)
         
-        # Get pending notifications count
-        cur.execute("""
-            SELECT COUNT(*) as pending_count
-            FROM bookings 
-            WHERE booking_user_id = %s 
-            AND booking_status = 'Pending'
-        """, (user_id,))
-        pending_notifications = cur.fetchone()['pending_count']
+        # Pending notifications, shared with the badge (app/services/student_counters.py)
+        pending_notifications = student_counters(user_id, cur)['notifications']
         
         # Get chart data
         chart_data = get_student_chart_data(cur, user_id)
@@ -119,7 +149,7 @@ def get_student_stats(cur, user_id):
             'chart_data': chart_data
         }
     except Exception as e:
-        print(f"Error fetching student stats: {e}")
+        logger.error("Error fetching student stats: %s", e)
         return {}
 
 def get_student_chart_data(cur, user_id):
@@ -171,7 +201,7 @@ def get_student_chart_data(cur, user_id):
             'booking_status': booking_status
         }
     except Exception as e:
-        print(f"Error fetching chart data: {e}")
+        logger.error("Error fetching chart data: %s", e)
         return {
             'payment_months': [],
             'payment_amounts': [],
@@ -198,7 +228,7 @@ def get_recent_bookings(cur, user_id):
         """, (user_id,))
         return cur.fetchall()
     except Exception as e:
-        print(f"Error fetching recent bookings: {e}")
+        logger.error("Error fetching recent bookings: %s", e)
         return []
 
 
@@ -206,6 +236,8 @@ def get_recent_bookings(cur, user_id):
 ######################### ROOMS #############################
 @student.route('/student/rooms')
 @login_required
+@read_only
+@query_budget(7)
 def available_rooms():
     conn = None
     cur = None
@@ -223,76 +255,48 @@ def available_rooms():
         search = request.args.get('search', '')
         
         # Build query for available rooms
-        query = """
-            SELECT DISTINCT
-                r.room_id,
-                r.room_number,
-                r.room_type,
-                r.room_capacity,
-                r.room_price_per_sem,
-                h.hostel_id,
-                h.hostel_name,
-                h.hostel_location,
-                h.hostel_description,
-                (r.room_capacity - COALESCE((
-                    SELECT COUNT(*) 
-                    FROM bookings b 
-                    WHERE b.booking_room_id = r.room_id
-                    AND b.booking_status IN ('Confirmed', 'Pending')
-                ), 0)) AS spots_left
-            FROM rooms r
-            JOIN hostels h ON r.room_hostel_id = h.hostel_id
-            WHERE (r.room_capacity - COALESCE((
-                SELECT COUNT(*) 
-                FROM bookings b 
-                WHERE b.booking_room_id = r.room_id
-                AND b.booking_status IN ('Confirmed', 'Pending')
-            ), 0)) > 0
-        """
-        
+        query = AVAILABLE_ROOMS_QUERY
         params = []
+        filters = []
         
         # Additional filters
         if hostel_id:
             query += " AND h.hostel_id = %s"
             params.append(hostel_id)
+            filters.append('hostel')
         
         if room_type:
             query += " AND r.room_type = %s"
             params.append(room_type)
+            filters.append('type')
         
         if price_min:
             query += " AND r.room_price_per_sem >= %s"
             params.append(float(price_min))
+            filters.append('min')
         
         if price_max:
             query += " AND r.room_price_per_sem <= %s"
             params.append(float(price_max))
+            filters.append('max')
         
         if capacity:
             query += " AND r.room_capacity = %s"
             params.append(int(capacity))
+            filters.append('capacity')
         
         if search:
             query += " AND (r.room_number ILIKE %s OR h.hostel_name ILIKE %s OR h.hostel_location ILIKE %s)"
             params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
+            filters.append('search')
         
         # Add ordering
         query += " ORDER BY r.room_price_per_sem ASC, h.hostel_name, r.room_number"
         
         # Execute query
-        cur.execute(query, params)
+        prepared('_'.join(['available_rooms'] + filters), query).execute(cur, params)
         rooms = cur.fetchall()
                 
-        # Get room images
-        for room in rooms:
-            cur.execute("""
-                SELECT image_url FROM room_images 
-                WHERE image_room_id = %s 
-                ORDER BY image_id
-            """, (room['room_id'],))
-            room['images'] = cur.fetchall()
-        
         # Get hostels for filter dropdown
         cur.execute("SELECT hostel_id, hostel_name FROM hostels ORDER BY hostel_name")
         hostels = cur.fetchall()
@@ -307,8 +311,18 @@ def available_rooms():
         end_idx = start_idx + per_page
         paginated_rooms = rooms[start_idx:end_idx]
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, current_user.id)
+        # Get room images, for the rooms on this page only and in one query
+        images = {room['room_id']: [] for room in paginated_rooms}
+        if images:
+            cur.execute("""
+                SELECT image_room_id, image_url FROM room_images 
+                WHERE image_room_id = ANY(%s) 
+                ORDER BY image_id
+            """, (list(images),))
+            for image in cur.fetchall():
+                images[image['image_room_id']].append({'image_url': image['image_url']})
+        for room in paginated_rooms:
+            room['images'] = images[room['room_id']]
         
         return render_template('/student/rooms.html',
                              user=current_user,
@@ -316,38 +330,48 @@ def available_rooms():
                              hostels=hostels,
                              current_page=page,
                              total_pages=total_pages,
-                             notifications_count=notifications_count)
+                             live_rooms=room_streams_open(current_app),
+                             room_poll_seconds=current_app.config['LIVE_STATS_ROOM_POLL_SECONDS'])
     except Exception as e:
-        print(f"Error in available rooms: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in available rooms: %s", e)
         return render_template('/student/rooms.html',
                              user=current_user,
                              rooms=[],
                              hostels=[],
                              current_page=1,
-                             total_pages=1,
-                             notifications_count=0)
+                             total_pages=1)
     finally:
         if cur:
             cur.close()
         if conn:
             release_db_connection(conn)
 
-def get_student_notifications_count(cur, user_id):
-    """Get count of pending notifications for student"""
+@student.route('/student/counters')
+@login_required
+def counters():
+    """Badge counters of the signed-in student, fetched by student_base.html once the page is up"""
     try:
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM bookings 
-            WHERE booking_user_id = %s 
-            AND booking_status = 'Pending'
-        """, (user_id,))
-        result = cur.fetchone()
-        return result['count'] if result else 0
+        return jsonify({'success': True, 'counters': student_counters(current_user.id)})
     except Exception as e:
-        print(f"Error getting notifications count: {e}")
-        return 0
+        logger.error("Error getting student counters: %s", e)
+        return jsonify({'success': False, 'message': 'Error getting counters'}), 500
+
+@student.route('/student/rooms/events')
+@login_required
+def room_events():
+    """Server-Sent Events: spots left in ?rooms=1,2,3 as bookings come and go (app/services/live_stats.py)"""
+    return event_stream_response(rooms=requested_rooms(request.args.get('rooms')))
+
+@student.route('/student/rooms/spots')
+@login_required
+def room_spots_now():
+    """Spots left in ?rooms=1,2,3, polled by rooms.html when it can't hold /student/rooms/events open"""
+    rooms = requested_rooms(request.args.get('rooms'))
+    try:
+        return jsonify({'success': True, 'spots': room_spots(rooms) if rooms else {}})
+    except Exception as e:
+        logger.error("Error getting room spots: %s", e)
+        return jsonify({'success': False, 'message': 'Error getting room spots'}), 500
 
 @student.route('/student/bookings/create', methods=['POST'])
 @login_required
@@ -366,8 +390,7 @@ def create_booking():
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        # Check if room is available
-        cur.execute("BEGIN;")
+        # Check if room is available (psycopg2 has already opened the transaction)
         cur.execute("""
             SELECT r.room_id
             FROM rooms r
@@ -435,6 +458,8 @@ def create_booking():
             
             booking_id = cur.fetchone()['booking_id']
             conn.commit()
+            invalidate_counters(user_id)
+            BOOKINGS.inc(event='created', source='student')
 
             return jsonify({
                 'success': True,
@@ -475,6 +500,11 @@ def create_booking():
         """, (booking_id, payment_id))
 
         conn.commit()
+        invalidate_counters(user_id)
+        schedule_refresh()
+        BOOKINGS.inc(event='created', source='student')
+        BOOKINGS.inc(event='confirmed', source='student')
+        PAYMENTS.inc(method='Mpesa', status='Success')
 
         return jsonify({
             'success': True,
@@ -487,8 +517,7 @@ def create_booking():
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Error creating booking: {e}")
-        traceback.print_exc()
+        logger.exception("Error creating booking: %s", e)
         return jsonify({'success': False, 'message': 'Error creating booking'})
     finally:
         if cur:
@@ -566,19 +595,13 @@ def room_details(room_id):
         """, (room['hostel_id'], room_id))
         similar_rooms = cur.fetchall()
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, current_user.id)
-        
         return render_template('/student/room_details.html',
                              user=current_user,
                              room=room,
                              room_images=room_images,
-                             similar_rooms=similar_rooms,
-                             notifications_count=notifications_count)
+                             similar_rooms=similar_rooms)
     except Exception as e:
-        print(f"Error in room details: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in room details: %s", e)
         flash('Error loading room details', 'error')
         return redirect(url_for('student.available_rooms'))
     finally:
@@ -652,19 +675,14 @@ def my_bookings():
                 days_remaining = (vaccate_date - datetime.now().date()).days
                 booking['days_remaining'] = max(0, days_remaining)
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, user_id)
-        
         return render_template('/student/bookings.html',
                              user=current_user,
-                             bookings=bookings,
-                             notifications_count=notifications_count)
+                             bookings=bookings)
     except Exception as e:
-        print(f"Error in my bookings: {e}")
+        logger.error("Error in my bookings: %s", e)
         return render_template('/student/bookings.html',
                              user=current_user,
-                             bookings=[],
-                             notifications_count=0)
+                             bookings=[])
     finally:
         if cur:
             cur.close()
@@ -705,13 +723,16 @@ def cancel_booking(booking_id):
         """, (booking_id,))
         
         conn.commit()
+        invalidate_counters(user_id)
+        schedule_refresh()
+        BOOKINGS.inc(event='cancelled', source='student')
         
         return jsonify({'success': True, 'message': 'Booking cancelled successfully'})
         
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Error cancelling booking: {e}")
+        logger.error("Error cancelling booking: %s", e)
         return jsonify({'success': False, 'message': 'Error cancelling booking'})
     finally:
         if cur:
@@ -720,21 +741,6 @@ def cancel_booking(booking_id):
             release_db_connection(conn)
 
 
-def get_student_notifications_count(cur, user_id):
-    """Get count of pending notifications for student"""
-    try:
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM bookings 
-            WHERE booking_user_id = %s 
-            AND booking_status = 'Pending'
-        """, (user_id,))
-        result = cur.fetchone()
-        return result['count'] if result else 0
-    except Exception as e:
-        print(f"Error getting notifications count: {e}")
-        return 0
-
 
 ########################## PAYMENT ########################
 @student.route('/student/payments')
@@ -769,29 +775,20 @@ def make_payment():
             booking = cur.fetchone()
         
         # Get user's current account balance
-        cur.execute("""
-            SELECT profile_account_balance 
-            FROM user_profile 
-            WHERE profile_user_id = %s
-        """, (user_id,))
+        USER_BALANCE.execute(cur, (user_id,))
         profile = cur.fetchone()
         account_balance = profile['profile_account_balance'] if profile else 0.00
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, user_id)
-        
         return render_template('/student/make_payment.html',
                              user=current_user,
                              booking=booking,
-                             account_balance=account_balance,
-                             notifications_count=notifications_count)
+                             account_balance=account_balance)
     except Exception as e:
-        print(f"Error in make payment: {e}")
+        logger.error("Error in make payment: %s", e)
         return render_template('/student/make_payment.html',
                              user=current_user,
                              booking=None,
-                             account_balance=0.00,
-                             notifications_count=0)
+                             account_balance=0.00)
     finally:
         if cur:
             cur.close()
@@ -803,6 +800,7 @@ def make_payment():
 def process_payment():
     conn = None
     cur = None
+    receipt = None
     try:
         user_id = current_user.id
         payment_method = request.form.get('payment_method')
@@ -846,34 +844,40 @@ def process_payment():
                 VALUES (%s, %s, 'Mpesa', 'Success')
                 RETURNING payment_id
             """, (payment_reference, amount))
+            payment_id = cur.fetchone()['payment_id']
             
             payment_status = 'Success'
+            recorded = ('Mpesa', 'Success')
             
         else:  # manual payment
             manual_method = request.form.get('manual_payment_method')
             transaction_ref = request.form.get('transaction_reference')
             payment_date = request.form.get('payment_date')
             
-            # Handle file upload
-            receipt_file = None
+            # Handle file upload (re-encoded and thumbnailed in the background once committed)
             if 'receipt' in request.files:
                 file = request.files['receipt']
                 if file and file.filename:
-                    filename = f"receipt_{payment_reference}_{file.filename}"
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    receipt_file = file_path
+                    try:
+                        receipt = save_receipt(file)
+                    except UploadError as e:
+                        return jsonify({'success': False, 'message': str(e)})
             
             cur.execute("""
                 INSERT INTO payments (payment_reference_number, payment_amount, payment_method, payment_status, payment_date, payment_receipt)
-                VALUES (%s, %s, %s, 'Pending', %s, %s)
+                VALUES (%s, %s, %s, 'Pending', COALESCE(%s::date, CURRENT_DATE), %s)
                 RETURNING payment_id
-            """, (payment_reference, amount, manual_method, payment_date, receipt_file))
+            """, (payment_reference, amount, manual_method, payment_date or None, receipt.storage_key if receipt else None))
+            payment_id = cur.fetchone()['payment_id']
+            
+            # Link the payment to its (possibly shared) receipt blob
+            if receipt:
+                record_blob(cur, receipt.content_hash, receipt.mime, receipt.size,
+                            receipt.storage_key, receipt.thumbnail_key)
+                attach_payment_receipt(cur, payment_id, receipt.content_hash, secure_filename(file.filename))
             
             payment_status = 'Success'
-        
-        payment_result = cur.fetchone()
-        payment_id = payment_result['payment_id']
+            recorded = (manual_method, 'Pending')
         
         # Update user's account balance
         cur.execute("""
@@ -902,6 +906,14 @@ def process_payment():
                 """, (booking_id, payment_id, allocation_date, vaccate_date))
         
         conn.commit()
+        if receipt:
+            queue_receipt(receipt)
+            receipt = None
+        invalidate_counters(user_id)
+        schedule_refresh()
+        PAYMENTS.inc(method=payment_method_label(recorded[0]), status=recorded[1])
+        if payment_status == 'Success' and booking and booking['booking_status'] == 'Pending':
+            BOOKINGS.inc(event='confirmed', source='student')
         
         return jsonify({
             'success': True, 
@@ -914,9 +926,11 @@ def process_payment():
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Error processing payment: {e}")
+        logger.error("Error processing payment: %s", e)
         return jsonify({'success': False, 'message': 'Error processing payment'})
     finally:
+        if receipt:
+            discard_receipt(receipt)
         if cur:
             cur.close()
         if conn:
@@ -924,6 +938,7 @@ def process_payment():
 
 @student.route('/student/payments/history')
 @login_required
+@read_only
 def payment_history():
     conn = None
     cur = None
@@ -966,29 +981,20 @@ def payment_history():
         payments = cur.fetchall()
         
         # Get current account balance
-        cur.execute("""
-            SELECT profile_account_balance 
-            FROM user_profile 
-            WHERE profile_user_id = %s
-        """, (user_id,))
+        USER_BALANCE.execute(cur, (user_id,))
         profile = cur.fetchone()
         account_balance = profile['profile_account_balance'] if profile else 0.00
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, user_id)
-        
         return render_template('/student/payment_history.html',
                              user=current_user,
                              payments=payments,
-                             account_balance=account_balance,
-                             notifications_count=notifications_count)
+                             account_balance=account_balance)
     except Exception as e:
-        print(f"Error in payment history: {e}")
+        logger.error("Error in payment history: %s", e)
         return render_template('/student/payment_history.html',
                              user=current_user,
                              payments=[],
-                             account_balance=0.00,
-                             notifications_count=0)
+                             account_balance=0.00)
     finally:
         if cur:
             cur.close()
@@ -998,38 +1004,20 @@ def payment_history():
 def get_user_balance(cur, user_id):
     """Get user's current account balance"""
     try:
-        cur.execute("""
-            SELECT profile_account_balance 
-            FROM user_profile 
-            WHERE profile_user_id = %s
-        """, (user_id,))
+        USER_BALANCE.execute(cur, (user_id,))
         result = cur.fetchone()
         return float(result['profile_account_balance']) if result else 0.00
     except Exception as e:
-        print(f"Error getting user balance: {e}")
+        logger.error("Error getting user balance: %s", e)
         return 0.00
 
-def get_student_notifications_count(cur, user_id):
-    """Get count of pending notifications for student"""
-    try:
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM bookings 
-            WHERE booking_user_id = %s 
-            AND booking_status = 'Pending'
-        """, (user_id,))
-        result = cur.fetchone()
-        return result['count'] if result else 0
-    except Exception as e:
-        print(f"Error getting notifications count: {e}")
-        return 0
-
 
 
 
 ################### PAYMMENT-HISTORY ##################
 @student.route('/student/payments/payment-history')
 @login_required
+@read_only
 def student_payment_history():
     conn = None
     cur = None
@@ -1074,21 +1062,16 @@ def student_payment_history():
         # Calculate payment statistics
         stats = get_payment_statistics(cur, user_id)
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, user_id)
-        
         return render_template('/student/payment_history.html',
                              user=current_user,
                              payments=payments,
-                             stats=stats,
-                             notifications_count=notifications_count)
+                             stats=stats)
     except Exception as e:
-        print(f"Error in payment history: {e}")
+        logger.error("Error in payment history: %s", e)
         return render_template('/student/payment_history.html',
                              user=current_user,
                              payments=[],
-                             stats={},
-                             notifications_count=0)
+                             stats={})
     finally:
         if cur:
             cur.close()
@@ -1128,7 +1111,7 @@ def get_payment_statistics(cur, user_id):
             'failed_payments': counts['failed_payments']
         }
     except Exception as e:
-        print(f"Error getting payment statistics: {e}")
+        logger.error("Error getting payment statistics: %s", e)
         return {
             'total_paid': 0,
             'total_transactions': 0,
@@ -1189,7 +1172,7 @@ def payment_details(payment_id):
                              payment=payment)
         
     except Exception as e:
-        print(f"Error getting payment details: {e}")
+        logger.error("Error getting payment details: %s", e)
         return "Error loading payment details", 500
     finally:
         if cur:
@@ -1216,21 +1199,6 @@ def export_payments_csv():
     # Generate CSV export of payment history
     pass
 
-def get_student_notifications_count(cur, user_id):
-    """Get count of pending notifications for student"""
-    try:
-        cur.execute("""
-            SELECT COUNT(*) as count 
-            FROM bookings 
-            WHERE booking_user_id = %s 
-            AND booking_status = 'Pending'
-        """, (user_id,))
-        result = cur.fetchone()
-        return result['count'] if result else 0
-    except Exception as e:
-        print(f"Error getting notifications count: {e}")
-        return 0
-
 
 
 ############### SUPPORT #############
@@ -1238,17 +1206,12 @@ def get_student_notifications_count(cur, user_id):
 @login_required
 def student_support():
     try:
-        # Get notifications count
-        notifications_count = 0
-        
         return render_template('/student/support.html',
-                             user=current_user,
-                             notifications_count=notifications_count)
+                             user=current_user)
     except Exception as e:
-        print(f"Error in student support: {e}")
+        logger.error("Error in student support: %s", e)
         return render_template('/student/support.html',
-                             user=current_user,
-                             notifications_count=0)
+                             user=current_user)
 
 
 
@@ -1291,17 +1254,12 @@ def student_settings():
                 'profile_student_id': ''
             }
         
-        # Get notifications count
-        notifications_count = get_student_notifications_count(cur, current_user.id)
-        
         return render_template('/student/settings.html', 
                              user=current_user,
-                             profile=profile_data,
-                             notifications_count=notifications_count)
+                             profile=profile_data)
         
     except Exception as e:
-        print(f"Error loading student settings: {e}")
-        traceback.print_exc()
+        logger.exception("Error loading student settings: %s", e)
         # Return with default values if there's an error
         return render_template('/student/settings.html',
                              user=current_user,
@@ -1309,8 +1267,7 @@ def student_settings():
                                  'profile_account_balance': 0.00,
                                  'profile_emergency_contact': '',
                                  'profile_student_id': ''
-                             },
-                             notifications_count=0)
+                             })
     finally:
         if cur:
             cur.close()
@@ -1422,8 +1379,7 @@ def update_student_profile():
         })
         
     except Exception as e:
-        print(f"Error updating student profile: {e}")
-        traceback.print_exc()
+        logger.exception("Error updating student profile: %s", e)
         
         if conn:
             conn.rollback()
@@ -1513,8 +1469,7 @@ def change_student_password():
         })
         
     except Exception as e:
-        print(f"Error changing student password: {e}")
-        traceback.print_exc()
+        logger.exception("Error changing student password: %s", e)
         
         if conn:
             conn.rollback()
@@ -1537,7 +1492,7 @@ def verify_password(plain_password, hashed_password):
         from werkzeug.security import check_password_hash
         return check_password_hash(hashed_password, plain_password)
     except Exception as e:
-        print(f"Error verifying password: {e}")
+        logger.error("Error verifying password: %s", e)
         return False
 
 def hash_password(password):
@@ -1546,7 +1501,7 @@ def hash_password(password):
         from werkzeug.security import generate_password_hash
         return generate_password_hash(password)
     except Exception as e:
-        print(f"Error hashing password: {e}")
+        logger.error("Error hashing password: %s", e)
         # Fallback
         from werkzeug.security import generate_password_hash
         return generate_password_hash(password)
\ No newline at end of file
@@ -0,0 +1,135 @@
+import os
+import json
+import gzip
+import hashlib
+from flask import Blueprint, current_app, request, url_for, send_from_directory, abort
+
+# Static files that get fingerprinted and precompressed
+ASSET_EXTENSIONS = ('.css', '.js')
+ASSET_DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+assets = Blueprint('assets', __name__, url_prefix='/assets')
+
+_manifest = {}
+
+
+####################### BUILD ###########################
+def _brotli(data):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def _gzip(data):
+    # zopfli squeezes a few % more out of gzip at build time; fall back to zlib
+    try:
+        import zopfli.gzip
+        return zopfli.gzip.compress(data)
+    except ImportError:
+        return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def find_assets(static_folder):
+    """Relative paths of every css/js file under static, skipping build output"""
+    found = []
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root.split(os.sep)[0] in (ASSET_DIST_DIR, 'uploads'):
+            continue
+        for name in files:
+            if name.endswith(ASSET_EXTENSIONS):
+                found.append(os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/'))
+    return sorted(found)
+
+
+def build_assets(static_folder):
+    """Write content-hashed copies of each asset plus .br/.gz variants, and a manifest"""
+    dist_folder = os.path.join(static_folder, ASSET_DIST_DIR)
+    manifest = {}
+
+    for rel_path in find_assets(static_folder):
+        with open(os.path.join(static_folder, rel_path), 'rb') as f:
+            data = f.read()
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        root, ext = os.path.splitext(rel_path)
+        hashed_path = f"{root}.{digest}{ext}"
+        dest_path = os.path.join(dist_folder, hashed_path)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+
+        # Unchanged files keep their name, so only rebuild what moved
+        if not os.path.exists(dest_path):
+            with open(dest_path, 'wb') as f:
+                f.write(data)
+            compressed = _brotli(data)
+            if compressed and len(compressed) < len(data):
+                with open(dest_path + '.br', 'wb') as f:
+                    f.write(compressed)
+            compressed = _gzip(data)
+            if len(compressed) < len(data):
+                with open(dest_path + '.gz', 'wb') as f:
+                    f.write(compressed)
+
+        manifest[rel_path] = hashed_path
+
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    global _manifest
+    try:
+        with open(os.path.join(static_folder, ASSET_DIST_DIR, MANIFEST_NAME)) as f:
+            _manifest = json.load(f)
+    except (OSError, ValueError):
+        _manifest = {}
+    return _manifest
+
+
+####################### SERVE ###########################
+def asset_url(endpoint, filename=None, **values):
+    """Drop-in for url_for() that points static css/js at their fingerprinted build"""
+    if endpoint == 'static' and filename:
+        hashed = _manifest.get(filename.lstrip('/'))
+        if hashed and not current_app.debug:
+            return url_for('assets.serve_asset', filename=hashed, **values)
+    return url_for(endpoint, filename=filename, **values) if filename else url_for(endpoint, **values)
+
+
+@assets.route('/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted asset, preferring the precompressed variant the client accepts"""
+    if os.path.basename(filename) == MANIFEST_NAME:
+        abort(404)
+
+    dist_folder = os.path.join(current_app.static_folder, ASSET_DIST_DIR)
+    accepted = request.accept_encodings
+
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] and os.path.isfile(os.path.join(dist_folder, filename + suffix)):
+            encoding = candidate
+            break
+
+    if encoding:
+        mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+        response = send_from_directory(dist_folder, filename + ('.br' if encoding == 'br' else '.gz'),
+                                       mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(dist_folder, filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def init_assets(app):
+    app.register_blueprint(assets)
+    load_manifest(app.static_folder)
+    app.add_template_global(asset_url, 'asset_url')
@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+from functools import wraps
+from flask import request
+
+# Responses we bother compressing / tagging
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'image/svg+xml',
+)
+# Keys views set on the WSGI environ to opt out per route
+ENVIRON_COMPRESS = 'nyumbani.compress'
+ENVIRON_ETAG = 'nyumbani.etag'
+
+
+def compression(enabled=True, etag=True):
+    """Per-route switch for CompressionMiddleware, e.g. @compression(etag=False)"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def decorated_view(*args, **kwargs):
+            request.environ[ENVIRON_COMPRESS] = enabled
+            request.environ[ENVIRON_ETAG] = etag
+            return view_func(*args, **kwargs)
+        return decorated_view
+    return decorator
+
+
+def _brotli_module():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _accepted_encodings(header):
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _etag_matches(if_none_match, etag):
+    """Weak comparison, as RFC 9110 requires for If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CompressionMiddleware:
+    """Brotli/gzip for text responses plus weak ETags and 304s for JSON/HTML.
+
+    Only buffered responses with a Content-Length are touched, so streamed
+    bodies (event streams, send_file) pass straight through. So do HEAD
+    responses: their body is empty, so an ETag or length computed here
+    would not match the GET, and the upstream headers already describe it.
+    """
+
+    def __init__(self, app, min_size=1024, max_size=4 * 1024 * 1024,
+                 gzip_level=6, brotli_quality=5, etags=True):
+        self.app = app
+        self.min_size = min_size
+        self.max_size = max_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.etags = etags
+        self.brotli = _brotli_module()
+
+    def __call__(self, environ, start_response):
+        state = {'buffer': False, 'deciding': True}
+
+        def capture(status, headers, exc_info=None):
+            if state['deciding'] and not exc_info and self._should_buffer(environ, headers):
+                state.update(buffer=True, status=status, headers=headers)
+                return state.setdefault('chunks', []).append
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, capture)
+        state['deciding'] = False
+
+        if not state['buffer']:
+            return app_iter
+
+        try:
+            body = b''.join(state.get('chunks', [])) + b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        return self._finish(environ, start_response, state['status'], state['headers'], body)
+
+    def _should_buffer(self, environ, headers):
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return False
+        header_map = {k.lower(): v for k, v in headers}
+        content_type = header_map.get('content-type', '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return False
+        if 'content-encoding' in header_map:
+            return False
+        try:
+            length = int(header_map.get('content-length', ''))
+        except ValueError:
+            return False
+        return length <= self.max_size
+
+    def _finish(self, environ, start_response, status, headers, body):
+        headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+        header_map = {k.lower(): v for k, v in headers}
+        status_code = int(status.split(' ', 1)[0])
+        method = environ.get('REQUEST_METHOD', 'GET')
+        content_type = header_map.get('content-type', '').split(';')[0].strip().lower()
+
+        cache_control = header_map.get('cache-control', '').lower()
+        compress = (environ.get(ENVIRON_COMPRESS, True) and len(body) >= self.min_size
+                    and 'no-transform' not in cache_control)
+        if compress:
+            self._add_vary(headers)
+
+        # Conditional GET for JSON/HTML
+        if (self.etags and environ.get(ENVIRON_ETAG, True) and status_code == 200
+                and method == 'GET' and content_type in ('text/html', 'application/json')):
+            etag = header_map.get('etag')
+            if not etag:
+                etag = 'W/"%s"' % hashlib.sha1(body).hexdigest()[:20]
+                headers.append(('ETag', etag))
+            if 'cache-control' not in header_map:
+                # Let the browser keep the body but revalidate every time
+                headers.append(('Cache-Control', 'private, no-cache'))
+
+            if _etag_matches(environ.get('HTTP_IF_NONE_MATCH'), etag):
+                not_modified = [(k, v) for k, v in headers
+                                if k.lower() not in ('content-type', 'content-length')]
+                start_response('304 Not Modified', not_modified)
+                return [b'']
+
+        if compress and status_code not in (204, 304):
+            encoding = self._pick_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+            if encoding:
+                body = self._compress(body, encoding)
+                headers.append(('Content-Encoding', encoding))
+
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+    def _pick_encoding(self, header):
+        accepted = _accepted_encodings(header)
+        if self.brotli and accepted.get('br', 0) > 0:
+            return 'br'
+        if accepted.get('gzip', accepted.get('*', 0)) > 0:
+            return 'gzip'
+        return None
+
+    def _compress(self, body, encoding):
+        if encoding == 'br':
+            return self.brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def _add_vary(self, headers):
+        for i, (key, value) in enumerate(headers):
+            if key.lower() == 'vary':
+                if 'accept-encoding' not in value.lower():
+                    headers[i] = (key, f"{value}, Accept-Encoding")
+                return
+        headers.append(('Vary', 'Accept-Encoding'))
+
+
+def init_compression(app):
+    app.config.setdefault('COMPRESSION_ENABLED', True)
+    app.config.setdefault('COMPRESSION_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESSION_ETAGS', True)
+
+    if app.config['COMPRESSION_ENABLED']:
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=app.config['COMPRESSION_MIN_SIZE'],
+            etags=app.config['COMPRESSION_ETAGS'],
+        )
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+
+FRAGMENT_CACHE_SIZE = 512
+FRAGMENT_DEFAULT_TTL = 300
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered template fragments with TTLs and tags.
+
+    Each worker process has its own cache, so invalidating a tag only
+    clears this process; the TTL bounds how stale the others can get.
+    """
+
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, tags = entry
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=FRAGMENT_DEFAULT_TTL, tags=()):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        value, expires_at, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key[, ttl[, tags]] %}...{% endcache %}
+
+    ttl is in seconds (None/0 keeps it until evicted or invalidated) and
+    tags is a list such as ['hostels'] for invalidate_fragments().
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=fragment_cache)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        args.append(parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(FRAGMENT_DEFAULT_TTL))
+        args.append(parser.parse_expression() if parser.stream.skip_if('comma') else nodes.List([]))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', args), [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, ttl, tags, caller):
+        cache = self.environment.fragment_cache
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html, ttl, tags)
+        return html
+
+
+def invalidate_fragments(*tags):
+    """Drop every cached fragment carrying one of these tags"""
+    fragment_cache.invalidate(*tags)
+
+
+def init_template_cache(app):
+    # Compiled templates survive restarts, so new workers skip the compile step
+    bytecode_dir = os.path.join(app.instance_path, 'jinja_bytecode')
+    os.makedirs(bytecode_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+    app.jinja_env.add_extension(FragmentCacheExtension)
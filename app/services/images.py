@@ -0,0 +1,184 @@
+import os
+import hashlib
+import tempfile
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from flask import Blueprint, current_app, url_for, send_file, abort
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# Widths we render variants at. Anything else is a 404, so the cache can't be flooded.
+WIDTH_BUCKETS = (320, 480, 640, 960, 1280)
+DEFAULT_WIDTH = 640
+VARIANT_QUALITY = {'webp': 72, 'avif': 55}
+VARIANT_MIMETYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+# Only photos under these static folders get variants
+SOURCE_FOLDERS = ('images',)
+VARIANT_CACHE = 'public, max-age=604800'
+
+images = Blueprint('images', __name__, url_prefix='/img')
+
+_supported_formats = None
+
+
+def supported_formats():
+    """Variant formats this Pillow build can encode (AVIF needs Pillow 11.2+ or pillow-avif-plugin)"""
+    global _supported_formats
+    if _supported_formats is None:
+        from PIL import Image, features
+        try:
+            import pillow_avif  # noqa: F401 -- registers the AVIF codec on older Pillow
+        except ImportError:
+            pass
+        Image.init()
+
+        formats = []
+        if features.check('webp'):
+            formats.append('webp')
+        if 'AVIF' in Image.SAVE:
+            formats.append('avif')
+        _supported_formats = tuple(formats)
+    return _supported_formats
+
+
+def variant_cache_dir():
+    return os.path.join(current_app.instance_path, 'image_variants')
+
+
+def variant_key(source_path, width, fmt):
+    """Strong validator: changes whenever the source file or the rendition changes"""
+    stat = os.stat(source_path)
+    raw = f"{source_path}:{stat.st_mtime_ns}:{stat.st_size}:{width}:{fmt}:{VARIANT_QUALITY[fmt]}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def render_variant(source_path, dest_path, width, fmt):
+    """Resize to the bucket width (never upscaling) and encode"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        if img.width > width:
+            height = round(img.height * width / img.width)
+            img = img.resize((width, height), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # A temp file of its own: other threads may be rendering the same variant right now
+        fd, part_path = tempfile.mkstemp(prefix=os.path.basename(dest_path) + '.', suffix='.part',
+                                         dir=os.path.dirname(dest_path))
+        options = {'quality': VARIANT_QUALITY[fmt]}
+        if fmt == 'webp':
+            options['method'] = 4
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, fmt.upper(), **options)
+            os.replace(part_path, dest_path)
+        except Exception:
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+            raise
+
+
+def get_variant(static_folder, cache_dir, filename, width, fmt):
+    """Path and ETag of a cached variant, rendering it on first use"""
+    source_path = safe_join(static_folder, filename)
+    if not source_path or not os.path.isfile(source_path):
+        return None, None
+
+    key = variant_key(source_path, width, fmt)
+    dest_path = os.path.join(cache_dir, str(width), f"{key}.{fmt}")
+    if not os.path.exists(dest_path):
+        render_variant(source_path, dest_path, width, fmt)
+    return dest_path, key
+
+
+@images.route('/<int:width>/<fmt>/<path:filename>')
+def variant(width, fmt, filename):
+    """Serve a width-bucketed WebP/AVIF rendition of a static photo"""
+    if width not in WIDTH_BUCKETS or fmt not in supported_formats():
+        abort(404)
+    if not filename.lower().endswith(SOURCE_EXTENSIONS) or filename.split('/')[0] not in SOURCE_FOLDERS:
+        abort(404)
+
+    try:
+        path, etag = get_variant(current_app.static_folder, variant_cache_dir(), filename, width, fmt)
+    except Exception as e:
+        logger.error("Error rendering image variant %s @ %s: %s", filename, width, e)
+        abort(404)
+    if not path:
+        abort(404)
+
+    response = send_file(path, mimetype=VARIANT_MIMETYPES[fmt], etag=etag, conditional=True)
+    response.headers['Cache-Control'] = VARIANT_CACHE
+    return response
+
+
+def build_variants(static_folder, cache_dir):
+    """Render every bucket for every photo under static/images ahead of time"""
+    built = 0
+    for root, dirs, files in os.walk(os.path.join(static_folder, 'images')):
+        for name in files:
+            if not name.lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            filename = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            for fmt in supported_formats():
+                for width in WIDTH_BUCKETS:
+                    get_variant(static_folder, cache_dir, filename, width, fmt)
+                    built += 1
+    return built
+
+
+####################### TEMPLATE HELPERS ###########################
+def _is_unsplash(src):
+    return urlsplit(src).netloc == 'images.unsplash.com'
+
+
+def _unsplash_url(src, width, fmt):
+    """Unsplash resizes on its CDN; keep the crop ratio when rewriting w/h"""
+    parts = urlsplit(src)
+    query = dict(parse_qsl(parts.query))
+    if 'w' in query and 'h' in query:
+        query['h'] = str(round(int(query['h']) * width / int(query['w'])))
+    query['w'] = str(width)
+    query['fm'] = fmt
+    query['q'] = str(VARIANT_QUALITY.get(fmt, 75))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def image_url(src, width=DEFAULT_WIDTH, fmt='webp'):
+    """URL of a single rendition; falls back to the original when we can't resize it"""
+    if not src:
+        return ''
+    if src.startswith('http'):
+        return _unsplash_url(src, width, fmt) if _is_unsplash(src) else src
+
+    filename = src.lstrip('/')
+    if fmt in supported_formats() and filename.lower().endswith(SOURCE_EXTENSIONS) \
+            and filename.split('/')[0] in SOURCE_FOLDERS:
+        return url_for('images.variant', width=width, fmt=fmt, filename=filename)
+    return url_for('static', filename=filename)
+
+
+def image_srcset(src, fmt='webp'):
+    """srcset value covering every width bucket, or '' when the image can't be resized"""
+    if not src:
+        return ''
+    if src.startswith('http') and not _is_unsplash(src):
+        return ''
+    if not src.startswith('http'):
+        filename = src.lstrip('/')
+        if fmt not in supported_formats() or not filename.lower().endswith(SOURCE_EXTENSIONS) \
+                or filename.split('/')[0] not in SOURCE_FOLDERS:
+            return ''
+    return ', '.join(f"{image_url(src, width, fmt)} {width}w" for width in WIDTH_BUCKETS)
+
+
+def init_images(app):
+    app.register_blueprint(images)
+    app.add_template_global(image_url, 'image_url')
+    app.add_template_global(image_srcset, 'image_srcset')
+    app.add_template_global(supported_formats, 'image_formats')
@@ -0,0 +1,465 @@
+"""Admin dashboard and bookings counters, and the spots left in rooms, pushed to open pages
+over Server-Sent Events.
+
+Triggers on bookings, payments, users and rooms (migration 0004) NOTIFY `dashboard_changes`
+when a write commits, and triggers on bookings (migration 0005) NOTIFY `room_availability`
+with the rooms whose bookings changed. Each process keeps one LISTEN connection in a
+background thread. While any admin has a page open, a burst of notifications becomes one
+recomputation of the stats after `debounce` seconds, and only the values that changed go out
+to every /admin/events stream in the process. The pages render from the same snapshot while
+it is known to be current, so reloading them costs no queries either. Likewise the spots left
+in the rooms students have on screen are recounted once per burst, and each
+/student/rooms/events stream gets those of its own rooms. Triggers on bookings and
+user_profile (migration 0006) NOTIFY `student_counters` with the students whose badge
+counters moved, and the listener passes them on to app/services/student_counters.py at once.
+"""
+import os
+import json
+import time
+import queue
+import select
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+from flask import Response
+from app.db.db import POSTGRES_DIRECT_CONFIG, get_db_connection, release_db_connection
+
+CHANNEL = 'dashboard_changes'
+ROOMS_CHANNEL = 'room_availability'
+STUDENTS_CHANNEL = 'student_counters'
+# Payload of a room_availability notification too big for the room ids
+ALL_ROOMS = '*'
+# ...and of a student_counters one too big for the user ids
+ALL_STUDENTS = '*'
+# Rooms one /student/rooms/events stream may follow (a page shows 12)
+MAX_ROOMS_PER_STREAM = 100
+STAT_GROUPS = ('dashboard', 'bookings')
+# Which stats a write to each table can move
+GROUPS_BY_TABLE = {
+    'bookings': ('dashboard', 'bookings'),
+    'payments': ('dashboard',),
+    'users': ('dashboard',),
+    'rooms': ('dashboard',),
+}
+# Gather notifications this long before recomputing...
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+# ...and recompute at least this often anyway: the month windows roll over with no write
+DEFAULT_MAX_AGE_SECONDS = 300
+# Under WSGI a stream holds a thread; end it after this long (the browser reconnects)...
+DEFAULT_WSGI_STREAM_SECONDS = 300
+# ...and beyond this many per process, tell the browser to come back in BUSY_RETRY_SECONDS
+DEFAULT_MAX_WSGI_STREAMS = 2
+# Room pages are opened by every student, not a few admins: none of them get a thread by default...
+DEFAULT_MAX_WSGI_ROOM_STREAMS = 0
+# ...and without a stream they poll /student/rooms/spots this often instead
+DEFAULT_ROOM_POLL_SECONDS = 15
+BUSY_RETRY_SECONDS = 30
+# Comment line so proxies don't close an idle stream
+KEEPALIVE_SECONDS = 15
+RECONNECT_SECONDS = 5
+# Nothing between here and the browser may cache or buffer the stream
+EVENT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+logger = logging.getLogger(__name__)
+
+_hub = None
+_wsgi_streams = None
+_wsgi_room_streams = None
+
+
+def compute(group):
+    """The stats of `group`, straight from the primary"""
+    from app.routes.admin import get_dashboard_stats, get_bookings_stats
+    if group == 'dashboard':
+        return get_dashboard_stats()
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        return get_bookings_stats(cur)
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+
+def room_spots(room_ids):
+    """Spots left in each of `room_ids` (as AVAILABLE_ROOMS_QUERY counts them), from the primary"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT r.room_id, GREATEST(r.room_capacity - COUNT(b.booking_id), 0)
+            FROM rooms r
+            LEFT JOIN bookings b ON b.booking_room_id = r.room_id
+                AND b.booking_status IN ('Confirmed', 'Pending')
+            WHERE r.room_id = ANY(%s)
+            GROUP BY r.room_id, r.room_capacity;
+        """, (list(room_ids),))
+        spots = dict.fromkeys(room_ids, 0)  # a deleted room has none
+        spots.update(cur.fetchall())
+        return spots
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+
+def changed_values(previous, current):
+    """The keys of `current` whose value differs from `previous` (all of them the first time)"""
+    if previous is None:
+        return dict(current)
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+
+# What one stream follows: stat groups, and room ids
+Subscription = namedtuple('Subscription', 'groups rooms')
+
+
+class LiveStats:
+    """The LISTEN connection of this process and the stats and room spots it keeps current.
+
+    The thread starts on first use, so nothing is running in the gunicorn master before the
+    fork. A snapshot is served only while the listener is connected and no notification for
+    its group has arrived since it was computed."""
+
+    def __init__(self, debounce, max_age):
+        self.debounce = debounce
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._listening = False
+        # Bumped by every notification (and on reconnect) for the groups it touches
+        self._versions = dict.fromkeys(STAT_GROUPS, 0)
+        self._snapshots = {}  # group -> (stats, version, computed_at)
+        self._published = {}  # group -> stats the subscribers were last sent
+        self._room_spots = {}  # room id -> spots left the subscribers were last sent
+        self._dirty_rooms = set()
+        self._all_rooms_dirty = False
+        self._subscribers = {}  # callback(event, data) -> Subscription
+        self._student_watchers = []
+        self._thread = None
+        self._wake_r = self._wake_w = None
+
+    def _start(self):
+        # Under self._lock
+        if self._thread is None:
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_w, False)
+            self._thread = threading.Thread(target=self._run, name='live-stats', daemon=True)
+            self._thread.start()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'.')
+        except BlockingIOError:
+            # Plenty of wake-ups already queued
+            pass
+
+    def _bump(self, groups):
+        # Under self._lock
+        for group in groups:
+            self._versions[group] += 1
+
+    def snapshot(self, group):
+        """Current stats of `group`, or None when they may be out of date"""
+        with self._lock:
+            self._start()
+            cached = self._snapshots.get(group)
+            if not self._listening or not cached:
+                return None
+            stats, version, computed_at = cached
+            if version != self._versions[group] or time.monotonic() - computed_at > self.max_age:
+                return None
+            return stats
+
+    def subscribe(self, callback, groups=(), rooms=()):
+        """Call `callback(group, changes)` from the listener thread whenever stats of `groups`
+        change, and `callback('rooms', {room_id: spots_left})` when rooms of `rooms` fill up or
+        free up. Returns the (event, data) subscribers were last sent, for a new stream to
+        start from."""
+        with self._lock:
+            self._start()
+            self._subscribers[callback] = Subscription(tuple(groups), frozenset(rooms))
+            published = [(group, self._published[group]) for group in groups if group in self._published]
+            spots = {room: self._room_spots[room] for room in rooms if room in self._room_spots}
+            if spots:
+                published.append(('rooms', spots))
+        self._wake()
+        return published
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.pop(callback, None)
+
+    def watch_students(self, callback):
+        """Call `callback(*user_ids)` from the listener thread as soon as writes move the counters
+        of those students, and `callback(None)` whenever it may have missed some (on connecting
+        and on losing the connection)"""
+        with self._lock:
+            self._start()
+            self._student_watchers.append(callback)
+
+    @property
+    def listening(self):
+        with self._lock:
+            return self._listening
+
+    def _students_changed(self, user_ids):
+        with self._lock:
+            watchers = list(self._student_watchers)
+        for callback in watchers:
+            try:
+                callback(*user_ids)
+            except Exception as e:
+                logger.warning("Student counters watcher failed: %s", e)
+
+    def _refresh(self, group):
+        with self._lock:
+            version = self._versions[group]
+        stats = compute(group)
+        with self._lock:
+            # A notification meanwhile leaves the snapshot stale; the next round recomputes
+            self._snapshots[group] = (stats, version, time.monotonic())
+        return stats
+
+    def _rooms_changed(self, payload):
+        # Under self._lock
+        if payload == ALL_ROOMS:
+            self._all_rooms_dirty = True
+        else:
+            self._dirty_rooms.update(int(room) for room in payload.split(',') if room)
+
+    def _deliver(self, deliveries):
+        for callback, event, data in deliveries:
+            try:
+                callback(event, data)
+            except Exception as e:
+                logger.debug("Dropping live stats subscriber: %s", e)
+                self.unsubscribe(callback)
+
+    def _publish(self, refresh=False):
+        with self._lock:
+            watched = {group for subscription in self._subscribers.values() for group in subscription.groups}
+        for group in STAT_GROUPS:
+            if group not in watched:
+                continue
+            stats = (not refresh and self.snapshot(group)) or self._refresh(group)
+            with self._lock:
+                changes = changed_values(self._published.get(group), stats)
+                self._published[group] = stats
+                deliveries = [(callback, group, changes) for callback, subscription in self._subscribers.items()
+                              if group in subscription.groups]
+            if changes:
+                self._deliver(deliveries)
+        self._publish_rooms(refresh)
+
+    def _publish_rooms(self, refresh):
+        with self._lock:
+            watched = set().union(*(subscription.rooms for subscription in self._subscribers.values()))
+            # Nobody sees these any more, so nobody hears when they change; forget them
+            for room in self._room_spots.keys() - watched:
+                del self._room_spots[room]
+            if refresh or self._all_rooms_dirty:
+                rooms = watched
+            else:
+                rooms = (self._dirty_rooms & watched) | (watched - self._room_spots.keys())
+            self._dirty_rooms.clear()
+            self._all_rooms_dirty = False
+        if not rooms:
+            return
+
+        spots = room_spots(rooms)
+        with self._lock:
+            changes = {room: left for room, left in spots.items() if self._room_spots.get(room) != left}
+            self._room_spots.update(spots)
+            deliveries = []
+            for callback, subscription in self._subscribers.items():
+                own = {room: changes[room] for room in subscription.rooms & changes.keys()}
+                if own:
+                    deliveries.append((callback, 'rooms', own))
+        self._deliver(deliveries)
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**POSTGRES_DIRECT_CONFIG)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {CHANNEL}; LISTEN {ROOMS_CHANNEL}; LISTEN {STUDENTS_CHANNEL};")
+                with self._lock:
+                    # Whatever was computed before may have missed notifications
+                    self._bump(STAT_GROUPS)
+                    self._all_rooms_dirty = True
+                    self._listening = True
+                self._students_changed([None])
+                self._listen(conn)
+            except Exception as e:
+                logger.warning("Live stats listener lost its connection: %s", e)
+            finally:
+                with self._lock:
+                    self._listening = False
+                    self._bump(STAT_GROUPS)
+                self._students_changed([None])
+                if conn is not None:
+                    conn.close()
+            time.sleep(RECONNECT_SECONDS)
+
+    def _listen(self, conn):
+        due, refresh = time.monotonic(), False
+        while True:
+            timeout = self.max_age if due is None else max(0.0, due - time.monotonic())
+            readable, _, _ = select.select([conn, self._wake_r], [], [], timeout)
+            now = time.monotonic()
+            if conn in readable:
+                conn.poll()
+                notifies = list(conn.notifies)
+                conn.notifies.clear()
+                students = set()
+                for notify in notifies:
+                    if notify.channel != STUDENTS_CHANNEL:
+                        continue
+                    if notify.payload == ALL_STUDENTS:
+                        students.add(None)
+                    else:
+                        students.update(int(user) for user in notify.payload.split(',') if user)
+                if students:
+                    # Not debounced: a student's next page must not show the old counts
+                    self._students_changed([None] if None in students else students)
+                notifies = [notify for notify in notifies if notify.channel != STUDENTS_CHANNEL]
+                if notifies:
+                    with self._lock:
+                        for notify in notifies:
+                            if notify.channel == ROOMS_CHANNEL:
+                                self._rooms_changed(notify.payload)
+                                continue
+                            self._bump(GROUPS_BY_TABLE.get(notify.payload, STAT_GROUPS))
+                            if notify.payload == 'rooms':
+                                # Capacity changes move spots left too
+                                self._all_rooms_dirty = True
+                    if due is None:
+                        due = now + self.debounce
+            if self._wake_r in readable:
+                # A new stream: bring it (and the snapshot) up to date right away
+                os.read(self._wake_r, 4096)
+                due = now
+            if not readable and due is None:
+                # Nothing for max_age seconds
+                due, refresh = now, True
+            if due is not None and now >= due:
+                self._publish(refresh)
+                due, refresh = None, False
+
+
+def cached(group, compute_stats):
+    """Stats of `group` from the listener's snapshot when it is current, else compute_stats()"""
+    stats = _hub.snapshot(group) if _hub is not None else None
+    return stats if stats is not None else compute_stats()
+
+
+def watch_students(callback):
+    """LiveStats.watch_students() of this process"""
+    if _hub is not None:
+        _hub.watch_students(callback)
+
+
+def listening():
+    """Whether this process is hearing about writes as they commit"""
+    return _hub is not None and _hub.listening
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def event_stream(lifetime, groups=(), rooms=()):
+    """text/event-stream chunks for a WSGI response: changes to `groups`/`rooms` as they happen"""
+    events = queue.Queue()
+
+    def deliver(event, data):
+        events.put((event, data))
+
+    published = _hub.subscribe(deliver, groups, rooms)
+    try:
+        yield f"retry: {RECONNECT_SECONDS * 1000}\n\n"
+        for event, data in published:
+            yield server_sent_event(event, data)
+        ends = time.monotonic() + lifetime
+        while (remaining := ends - time.monotonic()) > 0:
+            try:
+                event, data = events.get(timeout=min(KEEPALIVE_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield server_sent_event(event, data)
+    finally:
+        _hub.unsubscribe(deliver)
+
+
+def event_stream_response(groups=(), rooms=()):
+    """The Flask response for an events URL: event_stream() if this process has a thread to spare.
+    Room streams draw on their own budget, so students can't take the admins' threads."""
+    streams = _wsgi_room_streams if rooms else _wsgi_streams
+    if not streams.acquire(blocking=False):
+        return Response(f"retry: {BUSY_RETRY_SECONDS * 1000}\n\n", mimetype='text/event-stream',
+                        headers=EVENT_STREAM_HEADERS)
+    response = Response(event_stream(DEFAULT_WSGI_STREAM_SECONDS, groups, rooms), mimetype='text/event-stream',
+                        headers=EVENT_STREAM_HEADERS)
+    response.call_on_close(streams.release)
+    return response
+
+
+def room_streams_open(app):
+    """Whether room pages should open /student/rooms/events: always under ASGI, under WSGI only
+    with a LIVE_STATS_MAX_WSGI_ROOM_STREAMS budget. Otherwise they poll room_spots()."""
+    return app.config.get('ASGI', False) or app.config['LIVE_STATS_MAX_WSGI_ROOM_STREAMS'] > 0
+
+
+async def async_event_stream(groups=(), rooms=()):
+    """event_stream() for the ASGI app: a coroutine per open page instead of a thread"""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def deliver(event, data):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    published = _hub.subscribe(deliver, groups, rooms)
+    try:
+        yield f"retry: {RECONNECT_SECONDS * 1000}\n\n"
+        for event, data in published:
+            yield server_sent_event(event, data)
+        while True:
+            try:
+                event, data = await asyncio.wait_for(events.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield server_sent_event(event, data)
+    finally:
+        _hub.unsubscribe(deliver)
+
+
+def requested_groups(values):
+    """The stat groups asked for with ?group=..., all of them by default"""
+    return tuple(group for group in STAT_GROUPS if group in values) or STAT_GROUPS
+
+
+def requested_rooms(value):
+    """Room ids from ?rooms=1,2,3 (at most MAX_ROOMS_PER_STREAM)"""
+    rooms = {int(room) for room in (value or '').split(',') if room.strip().isdigit()}
+    return frozenset(sorted(rooms)[:MAX_ROOMS_PER_STREAM])
+
+
+def init_live_stats(app):
+    global _hub, _wsgi_streams, _wsgi_room_streams
+    app.config.setdefault('LIVE_STATS_DEBOUNCE', float(os.getenv("LIVE_STATS_DEBOUNCE", DEFAULT_DEBOUNCE_SECONDS)))
+    app.config.setdefault('LIVE_STATS_MAX_AGE', float(os.getenv("LIVE_STATS_MAX_AGE", DEFAULT_MAX_AGE_SECONDS)))
+    app.config.setdefault('LIVE_STATS_MAX_WSGI_STREAMS',
+                          int(os.getenv("LIVE_STATS_MAX_WSGI_STREAMS", DEFAULT_MAX_WSGI_STREAMS)))
+    app.config.setdefault('LIVE_STATS_MAX_WSGI_ROOM_STREAMS',
+                          int(os.getenv("LIVE_STATS_MAX_WSGI_ROOM_STREAMS", DEFAULT_MAX_WSGI_ROOM_STREAMS)))
+    app.config.setdefault('LIVE_STATS_ROOM_POLL_SECONDS',
+                          float(os.getenv("LIVE_STATS_ROOM_POLL_SECONDS", DEFAULT_ROOM_POLL_SECONDS)))
+    _hub = LiveStats(app.config['LIVE_STATS_DEBOUNCE'], app.config['LIVE_STATS_MAX_AGE'])
+    _wsgi_streams = threading.BoundedSemaphore(app.config['LIVE_STATS_MAX_WSGI_STREAMS'])
+    _wsgi_room_streams = threading.BoundedSemaphore(app.config['LIVE_STATS_MAX_WSGI_ROOM_STREAMS'])
@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import traceback
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+
+# Info-level records from these loggers are sampled; warnings and errors always go out
+DEFAULT_SAMPLE_RATES = {'nyumbani.access': 1.0, 'nyumbani.sql': 0.1}
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'exception'}
+
+access_logger = logging.getLogger('nyumbani.access')
+# Request fields for records logged while app/asgi.py serves a request without Flask
+async_request_context = contextvars.ContextVar('async_request_context', default=None)
+_listener = None
+
+
+####################### RECORDS ###########################
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request they were logged from (runs on the request thread)"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.endpoint = request.endpoint
+            record.method = request.method
+            record.path = request.path
+            # Only a user Flask-Login already loaded; touching current_user here could recurse into the DB
+            record.user_id = getattr(g.get('_login_user'), 'id', None)
+        elif async_request_context.get():
+            for key, value in async_request_context.get().items():
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to the listener thread; keeps the traceback as its own field"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exception = ''.join(traceback.format_exception(*record.exc_info))
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        exception = getattr(record, 'exception', None)
+        if not exception and record.exc_info:
+            exception = self.formatException(record.exc_info)
+        if exception:
+            entry['exception'] = exception
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable output for local development"""
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            line += f" [{request_id}]"
+        exception = getattr(record, 'exception', None)
+        return f"{line}\n{exception}" if exception else line
+
+
+####################### REQUEST IDS ###########################
+def current_request_id():
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+def _incoming_request_id():
+    return request_id_from(request.headers.get(REQUEST_ID_HEADER, ''))
+
+
+def request_id_from(candidate):
+    """The caller's X-Request-ID if it looks like one, otherwise a new id"""
+    return candidate if _REQUEST_ID.match(candidate or '') else uuid.uuid4().hex
+
+
+####################### SETUP ###########################
+def stop_logging():
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+def init_logging(app):
+    """JSON (or text) logs written by a background listener thread, with per-request context"""
+    global _listener
+    app.config.setdefault('LOG_LEVEL', os.getenv("LOG_LEVEL", "INFO").upper())
+    app.config.setdefault('LOG_FORMAT', os.getenv("LOG_FORMAT", "json"))
+    app.config.setdefault('LOG_SAMPLE_RATES', dict(DEFAULT_SAMPLE_RATES, **{
+        name: float(os.getenv(env, DEFAULT_SAMPLE_RATES[name]))
+        for name, env in (('nyumbani.access', 'LOG_ACCESS_SAMPLE_RATE'), ('nyumbani.sql', 'LOG_SQL_SAMPLE_RATE'))
+    }))
+
+    stop_logging()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if app.config['LOG_FORMAT'] == 'json' else TextFormatter())
+
+    log_queue = queue.Queue(-1)
+    handler = AsyncQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_RATES']))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, AsyncQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(app.config['LOG_LEVEL'])
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = _incoming_request_id()
+        g._log_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        response.headers[REQUEST_ID_HEADER] = g.get('request_id', '')
+        started = g.pop('_log_started', None)
+        if started is not None:
+            duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            level = logging.WARNING if response.status_code >= 500 else logging.INFO
+            access_logger.log(level, f"{request.method} {request.path} {response.status_code}",
+                              extra={'status': response.status_code, 'duration_ms': duration_ms})
+        return response
@@ -0,0 +1,348 @@
+import os
+import hmac
+import json
+import time
+import atexit
+import threading
+import logging
+from contextlib import contextmanager
+from flask import Blueprint, Response, current_app, request, g, abort
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no compaction of dead workers' files
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 5
+ARCHIVE_NAME = 'archive.json'
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+metrics = Blueprint('metrics', __name__)
+logger = logging.getLogger(__name__)
+
+
+####################### REGISTRY ###########################
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _values_snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def snapshot(self):
+        return {'kind': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames),
+                'values': self._values_snapshot()}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Point-in-time value; with a callback it is read when the snapshot is taken.
+    Across workers the live processes' values are summed."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, callback=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _values_snapshot(self):
+        if self.callback:
+            try:
+                for labels, value in self.callback():
+                    self.set(value, **labels)
+            except Exception as e:
+                logger.error("Error collecting gauge %s: %s", self.name, e)
+        return super()._values_snapshot()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        data = super().snapshot()
+        data['buckets'] = list(self.buckets)
+        return data
+
+
+####################### APPLICATION METRICS ###########################
+def _pool_state():
+    from app.db.db import pool_usage
+    usage = pool_usage()
+    if usage is None:
+        return []
+    in_use, maxconn = usage
+    return [({'state': 'in_use'}, in_use), ({'state': 'max'}, maxconn)]
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency',
+                            ('blueprint', 'endpoint', 'method', 'status'))
+DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'Postgres pool connections', ('state',), callback=_pool_state)
+DB_POOL_EXHAUSTED = Counter('db_pool_exhausted_total', 'Times a connection was requested from a full pool')
+BOOKINGS = Counter('bookings_total', 'Booking lifecycle events', ('event', 'source'))
+PAYMENTS = Counter('payments_total', 'Payments recorded', ('method', 'status'))
+# The values the payments.payment_method CHECK constraint allows (app/db/nyumbani.sql)
+KNOWN_PAYMENT_METHODS = ('Mpesa', 'Cash')
+LOGINS = Counter('logins_total', 'Login attempts', ('result',))
+PDF_RENDER = Histogram('pdf_render_seconds', 'WeasyPrint render time', ('report',),
+                       buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+
+def payment_method_label(method):
+    """Keep label values bounded; the manual method comes from the form"""
+    return method if method in KNOWN_PAYMENT_METHODS else 'Other'
+
+
+####################### MULTI-PROCESS FILES ###########################
+_state = {'dir': None, 'last_flush': 0.0}
+
+
+def flush(force=False):
+    """Write this process's metrics to <dir>/<pid>.json"""
+    metrics_dir = _state['dir']
+    if not metrics_dir or (not force and time.monotonic() - _state['last_flush'] < FLUSH_INTERVAL):
+        return
+    _state['last_flush'] = time.monotonic()
+    path = os.path.join(metrics_dir, f"{os.getpid()}.json")
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(REGISTRY.snapshot(), f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        logger.error("Error writing metrics: %s", e)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge_into(merged, snapshot, include_gauges):
+    for name, data in snapshot.items():
+        if data['kind'] == 'gauge' and not include_gauges:
+            continue
+        target = merged.setdefault(name, dict(data, values={}))
+        for labels, value in data['values']:
+            key = tuple(labels)
+            if data['kind'] == 'histogram':
+                current = target['values'].get(key)
+                if current is None:
+                    target['values'][key] = [list(value[0]), value[1], value[2]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+            else:
+                target['values'][key] = target['values'].get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _compact_dead(metrics_dir, dead_files):
+    """Fold counters/histograms of exited workers into archive.json so files don't pile up"""
+    if not dead_files or fcntl is None:
+        return
+    with open(os.path.join(metrics_dir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(metrics_dir, ARCHIVE_NAME)
+        merged = {}
+        archive = _read(archive_path)
+        if archive:
+            _merge_into(merged, archive, include_gauges=False)
+        # Re-check under the lock: another scrape may have compacted them, or the pid been reused
+        dead_files = [path for path in dead_files if os.path.exists(path)
+                      and not _pid_alive(int(os.path.basename(path)[:-len('.json')]))]
+        for path in dead_files:
+            snapshot = _read(path)
+            if snapshot:
+                _merge_into(merged, snapshot, include_gauges=False)
+        for data in merged.values():
+            data['values'] = [[list(k), v] for k, v in data['values'].items()]
+        with open(archive_path + '.tmp', 'w') as f:
+            json.dump(merged, f)
+        os.replace(archive_path + '.tmp', archive_path)
+        for path in dead_files:
+            os.unlink(path)
+
+
+def collect(metrics_dir):
+    """Aggregate every worker's file: counters and histograms summed, gauges from live workers only"""
+    flush(force=True)
+    merged = {}
+    dead_files = []
+    for name in sorted(os.listdir(metrics_dir)):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(metrics_dir, name)
+        stem = name[:-len('.json')]
+        if name == ARCHIVE_NAME:
+            alive = False
+        elif stem.isdigit():
+            alive = _pid_alive(int(stem))
+            if not alive:
+                dead_files.append(path)
+        else:
+            continue
+        snapshot = _read(path)
+        if snapshot:
+            _merge_into(merged, snapshot, include_gauges=alive)
+
+    # Registered metrics nobody has touched yet still show up
+    for name, metric in REGISTRY.metrics.items():
+        merged.setdefault(name, dict(metric.snapshot(), values={}))
+
+    try:
+        _compact_dead(metrics_dir, dead_files)
+    except OSError as e:
+        logger.error("Error compacting metrics: %s", e)
+    return merged
+
+
+####################### EXPOSITION ###########################
+def _label_str(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+
+def _num(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_text(merged):
+    """Prometheus text exposition format 0.0.4"""
+    lines = []
+    for name in sorted(merged):
+        data = merged[name]
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['kind']}")
+        names = data['labelnames']
+        for key, value in sorted(data['values'].items()):
+            if data['kind'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(data['buckets'], value[0]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_label_str(names, key, [('le', _num(float(bound)))])} {cumulative}")
+                lines.append(f"{name}_bucket{_label_str(names, key, [('le', '+Inf')])} {value[2]}")
+                lines.append(f"{name}_sum{_label_str(names, key)} {_num(float(value[1]))}")
+                lines.append(f"{name}_count{_label_str(names, key)} {value[2]}")
+            else:
+                lines.append(f"{name}{_label_str(names, key)} {_num(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed():
+    """With METRICS_TOKEN, scrapers must send it; without one, only this machine may scrape,
+    and not through a proxy (which would make every visitor look local)"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    return request.remote_addr in LOOPBACK_ADDRESSES and 'X-Forwarded-For' not in request.headers
+
+
+@metrics.route('/metrics')
+def metrics_endpoint():
+    if not scrape_allowed():
+        abort(403)
+    return Response(render_text(collect(_state['dir'])), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    app.config.setdefault('METRICS_DIR', os.getenv("METRICS_DIR") or os.path.join(app.instance_path, 'metrics'))
+    app.config.setdefault('METRICS_TOKEN', os.getenv("METRICS_TOKEN"))
+    _state['dir'] = app.config['METRICS_DIR']
+    os.makedirs(_state['dir'], exist_ok=True)
+    app.register_blueprint(metrics)
+
+    @app.before_request
+    def start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        started = g.pop('_request_started', None)
+        if started is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - started,
+                                    blueprint=request.blueprint or '', endpoint=request.endpoint or 'none',
+                                    method=request.method, status=response.status_code)
+        flush()
+        return response
+
+    atexit.register(flush, True)
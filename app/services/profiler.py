@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import random
+import zlib
+import logging
+import threading
+from collections import Counter
+from xml.sax.saxutils import escape
+from flask import g, request, has_request_context
+
+PROFILE_HEADER = 'X-Profile'
+DEFAULT_INTERVAL_MS = 5
+FOLDED_SUFFIX = '.folded'
+
+logger = logging.getLogger(__name__)
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_write_lock = threading.Lock()
+_sampler = None
+
+
+####################### SAMPLER ###########################
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(_PACKAGE_ROOT):
+        filename = os.path.relpath(filename, _PACKAGE_ROOT)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+def collapse(frame):
+    """Root-first `a;b;c` stack, the format flamegraph tools read"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class Sampler:
+    """One background thread per process that snapshots the stacks of the threads being profiled.
+
+    Sampling instead of tracing keeps the cost to the profiled request small and fixed,
+    and the thread only exists while at least one request is being profiled."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, counts in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+####################### STORAGE ###########################
+def _profile_file(profile_dir, endpoint):
+    safe_endpoint = ''.join(c if c.isalnum() or c in '._-' else '_' for c in endpoint)
+    return os.path.join(profile_dir, f"{safe_endpoint}.{os.getpid()}{FOLDED_SUFFIX}")
+
+
+def write_samples(profile_dir, endpoint, counts):
+    lines = ''.join(f"{stack} {count}\n" for stack, count in counts.items())
+    with _write_lock:
+        with open(_profile_file(profile_dir, endpoint), 'a') as f:
+            f.write(lines)
+
+
+def load_samples(profile_dir):
+    """{endpoint: Counter(stack -> samples)} merged over every worker and request"""
+    merged = {}
+    try:
+        names = os.listdir(profile_dir)
+    except OSError:
+        return merged
+    for name in sorted(names):
+        if not name.endswith(FOLDED_SUFFIX):
+            continue
+        endpoint = name[:-len(FOLDED_SUFFIX)].rsplit('.', 1)[0]
+        counts = merged.setdefault(endpoint, Counter())
+        with open(os.path.join(profile_dir, name)) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+    return merged
+
+
+def reset_samples(profile_dir):
+    for name in os.listdir(profile_dir):
+        if name.endswith(FOLDED_SUFFIX):
+            os.unlink(os.path.join(profile_dir, name))
+
+
+####################### FLAMEGRAPH ###########################
+def _build_tree(counts):
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in counts.items():
+        root['value'] += count
+        node = root
+        for label in stack.split(';'):
+            node = node['children'].setdefault(label, {'name': label, 'value': 0, 'children': {}})
+            node['value'] += count
+    return root
+
+
+def _colour(name):
+    seed = zlib.crc32(name.encode())
+    return f"rgb({205 + seed % 50},{(seed >> 8) % 180},{(seed >> 16) % 55})"
+
+
+def render_flamegraph(counts, title, width=1200, frame_height=16, min_width=0.3):
+    """Self-contained SVG flamegraph (root at the bottom, hover a frame for its share)"""
+    root = _build_tree(counts)
+    total = root['value'] or 1
+    scale = (width - 20) / total
+    rects = []
+    depth_max = 0
+
+    def walk(node, x, depth):
+        nonlocal depth_max
+        node_width = node['value'] * scale
+        if node_width < min_width:
+            return
+        depth_max = max(depth_max, depth)
+        rects.append((node, x, depth, node_width))
+        child_x = x
+        for child in sorted(node['children'].values(), key=lambda child: child['name']):
+            walk(child, child_x, depth + 1)
+            child_x += child['value'] * scale
+
+    walk(root, 10, 0)
+    height = (depth_max + 1) * frame_height + 50
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana, sans-serif" font-size="11">',
+        f'<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="15">{escape(title)}</text>',
+    ]
+    for node, x, depth, node_width in rects:
+        y = height - (depth + 1) * frame_height - 10
+        share = node['value'] * 100 / total
+        label = escape(node['name'])
+        parts.append(
+            f'<g><title>{label} ({node["value"]} samples, {share:.2f}%)</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{node_width:.2f}" height="{frame_height - 1}" '
+            f'fill="{_colour(node["name"])}" rx="2"/>')
+        chars = int((node_width - 6) / 7)
+        if chars >= 3:
+            text = node['name'] if len(node['name']) <= chars else node['name'][:chars - 2] + '..'
+            parts.append(f'<text x="{x + 3:.2f}" y="{y + frame_height - 4}">{escape(text)}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+####################### FLASK INTEGRATION ###########################
+def _wants_profile(app):
+    if request.headers.get(PROFILE_HEADER) == '1':
+        from flask_login import current_user
+        if current_user.is_authenticated and 'admin' in getattr(current_user, 'roles', []):
+            return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def profile_dir(app):
+    return app.config['PROFILE_DIR']
+
+
+def init_profiler(app):
+    """Profile a fraction of requests (PROFILE_SAMPLE_RATE), or an admin's request sent with `X-Profile: 1`"""
+    global _sampler
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.getenv("PROFILE_SAMPLE_RATE", 0)))
+    app.config.setdefault('PROFILE_INTERVAL_MS', float(os.getenv("PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS)))
+    app.config.setdefault('PROFILE_DIR', os.getenv("PROFILE_DIR") or os.path.join(app.instance_path, 'profiles'))
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    _sampler = Sampler(app.config['PROFILE_INTERVAL_MS'] / 1000)
+
+    @app.before_request
+    def start_profiling():
+        if request.endpoint in ('static', 'metrics.metrics_endpoint') or not _wants_profile(app):
+            return
+        g._profiling = threading.get_ident()
+        _sampler.start(g._profiling)
+
+    @app.teardown_request
+    def stop_profiling(exc):
+        thread_id = g.pop('_profiling', None) if has_request_context() else None
+        if thread_id is None:
+            return
+        counts = _sampler.stop(thread_id)
+        if not counts:
+            return
+        endpoint = request.endpoint or 'unknown'
+        try:
+            write_samples(profile_dir(app), endpoint, counts)
+        except OSError as e:
+            logger.error("Error writing profile for %s: %s", endpoint, e)
+            return
+        logger.info("Profiled %s: %s samples", endpoint, sum(counts.values()))
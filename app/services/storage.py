@@ -0,0 +1,289 @@
+import os
+import re
+import shutil
+import hashlib
+import threading
+import tempfile
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Blob keys are "<sha256>.<ext>", "<sha256>_thumb.<ext>" or "<sha256>_original.<ext>"
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}(_thumb|_original)?\.[a-z0-9]+$')
+
+_storage = None
+
+
+class StorageBackend(ABC):
+    """Interface for blob stores. Keys are content-addressed, so writes are idempotent."""
+
+    @abstractmethod
+    def exists(self, key):
+        """Whether a blob is stored under key"""
+
+    @abstractmethod
+    def put_file(self, key, src_path, content_type=None):
+        """Move a local file into the store under key"""
+
+    @abstractmethod
+    def open(self, key):
+        """A binary file-like object with the blob's bytes"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove the blob under key; a missing blob is not an error"""
+
+    @abstractmethod
+    def url_for(self, key):
+        """Public URL the blob is served from"""
+
+
+class LocalStorageBackend(StorageBackend):
+    """Blobs on disk, sharded as ab/cd/<key> so no directory gets huge"""
+
+    def __init__(self, root, static_prefix):
+        self.root = root
+        self.static_prefix = static_prefix.strip('/')
+        os.makedirs(self.root, exist_ok=True)
+
+    def shard(self, key):
+        return os.path.join(key[:2], key[2:4], key)
+
+    def path_for(self, key):
+        return os.path.join(self.root, self.shard(key))
+
+    def exists(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def put_file(self, key, src_path, content_type=None):
+        dest_path = self.path_for(key)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # Write next to the destination then rename, so readers never see half a file
+        part_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+        shutil.move(src_path, part_path)
+        os.replace(part_path, dest_path)
+
+    def open(self, key):
+        return open(self.path_for(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def url_for(self, key):
+        from flask import url_for
+        return url_for('static', filename=f"{self.static_prefix}/{self.shard(key).replace(os.sep, '/')}")
+
+
+class S3StorageBackend(StorageBackend):
+    """S3-compatible store (MinIO works locally). Needs boto3."""
+
+    def __init__(self, bucket, endpoint_url=None, public_url=None, **client_kwargs):
+        import boto3
+        self.bucket = bucket
+        self.public_url = (public_url or endpoint_url or '').rstrip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, **client_kwargs)
+
+    def shard(self, key):
+        return f"{key[:2]}/{key[2:4]}/{key}"
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.shard(key))
+            return True
+        except ClientError:
+            return False
+
+    def put_file(self, key, src_path, content_type=None):
+        extra = {'ContentType': content_type} if content_type else {}
+        self.client.upload_file(src_path, self.bucket, self.shard(key), ExtraArgs=extra)
+        os.unlink(src_path)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.shard(key))['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.shard(key))
+
+    def url_for(self, key):
+        return f"{self.public_url}/{self.bucket}/{self.shard(key)}"
+
+
+def init_storage(app):
+    """Pick the blob backend from config"""
+    global _storage
+    backend = app.config.get('UPLOAD_STORAGE_BACKEND', 'local')
+
+    if backend == 's3':
+        _storage = S3StorageBackend(
+            app.config['UPLOAD_S3_BUCKET'],
+            endpoint_url=app.config.get('UPLOAD_S3_ENDPOINT'),
+            public_url=app.config.get('UPLOAD_S3_PUBLIC_URL'),
+            aws_access_key_id=app.config.get('UPLOAD_S3_ACCESS_KEY'),
+            aws_secret_access_key=app.config.get('UPLOAD_S3_SECRET_KEY'),
+        )
+    else:
+        _storage = LocalStorageBackend(
+            os.path.join(app.config['UPLOAD_FOLDER'], 'blobs'),
+            static_prefix='uploads/blobs',
+        )
+    return _storage
+
+
+def get_storage():
+    return _storage
+
+
+def is_blob_key(value):
+    return bool(value) and bool(BLOB_KEY_PATTERN.match(value))
+
+
+def upload_url(key):
+    """Template filter: public URL of a stored blob, or None for legacy values"""
+    if not is_blob_key(key) or _storage is None:
+        return None
+    return _storage.url_for(key)
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+####################### METADATA ###########################
+def record_blob(cur, content_hash, mime, size, storage_key, thumbnail_key=None):
+    """Register a blob. Reference counts are kept by triggers on payment_receipts.
+
+    An existing row is touched, which locks it until the caller commits and restarts its grace
+    period, so collect_garbage() can't remove it in between."""
+    cur.execute("""
+        INSERT INTO upload_blobs (blob_sha256, blob_mime, blob_size, blob_storage_key, blob_thumbnail_key)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (blob_sha256) DO UPDATE SET blob_created_at = NOW()
+    """, (content_hash, mime, size, storage_key, thumbnail_key))
+
+
+def attach_payment_receipt(cur, payment_id, content_hash, original_filename=None):
+    """Point a payment at a blob"""
+    cur.execute("""
+        INSERT INTO payment_receipts (receipt_payment_id, receipt_blob_sha256, receipt_original_filename)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (receipt_payment_id) DO UPDATE
+        SET receipt_blob_sha256 = EXCLUDED.receipt_blob_sha256,
+            receipt_original_filename = EXCLUDED.receipt_original_filename
+    """, (payment_id, content_hash, original_filename))
+
+
+def use_original_receipt(cur, content_hash, storage_key, original_key):
+    """Point a blob, and the payments showing it, from storage_key to the upload kept as it came
+    (see store_original()); it has no thumbnail"""
+    cur.execute("""
+        UPDATE upload_blobs SET blob_storage_key = %s, blob_thumbnail_key = NULL
+        WHERE blob_sha256 = %s
+    """, (original_key, content_hash))
+    cur.execute("""
+        UPDATE payments SET payment_receipt = %s
+        WHERE payment_id IN (SELECT receipt_payment_id FROM payment_receipts WHERE receipt_blob_sha256 = %s)
+        AND payment_receipt = %s
+    """, (original_key, content_hash, storage_key))
+
+
+def collect_garbage(cur, grace_period='1 hour'):
+    """Delete blobs nobody references any more. Returns the number removed.
+
+    One transaction per blob: its row stays locked (and is checked again once locked) until its
+    files are gone, so an upload of the same content waits and then stores it afresh."""
+    cur.execute("""
+        SELECT blob_sha256 FROM upload_blobs
+        WHERE blob_ref_count <= 0
+        AND blob_created_at < NOW() - %s::interval
+    """, (grace_period,))
+    candidates = [row[0] for row in cur.fetchall()]
+    cur.connection.commit()
+
+    removed = 0
+    for content_hash in candidates:
+        try:
+            cur.execute("""
+                DELETE FROM upload_blobs
+                WHERE blob_sha256 = %s
+                AND blob_ref_count <= 0
+                AND blob_created_at < NOW() - %s::interval
+                RETURNING blob_thumbnail_key, blob_storage_key
+            """, (content_hash, grace_period))
+            row = cur.fetchone()
+            if row:
+                # Thumbnail first, so a blob is never left without its main file
+                for key in row:
+                    if key:
+                        _storage.delete(key)
+                removed += 1
+            cur.connection.commit()
+        except Exception as e:
+            cur.connection.rollback()
+            logger.error("Error deleting blob %s: %s", content_hash, e)
+    return removed
+
+
+def import_legacy_uploads(cur, upload_folder):
+    """Move flat receipt_<ref>_<name> files into the blob store, deduplicating as we go.
+
+    Commits file by file: a flat file is only deleted once its payment points at a stored blob
+    for good, and a file that fails leaves the others (and itself) as they were."""
+    from .uploads import sniff_mime, receipt_keys, process_receipt
+
+    imported = 0
+    for filename in sorted(os.listdir(upload_folder)):
+        path = os.path.join(upload_folder, filename)
+        if not os.path.isfile(path) or not filename.startswith('receipt_'):
+            continue
+
+        try:
+            payment_ref = filename.split('_', 2)[1]
+            with open(path, 'rb') as f:
+                mime = sniff_mime(f.read(16))
+            if not mime:
+                logger.warning("Skipping %s: unsupported file type", filename)
+                continue
+
+            content_hash = hash_file(path)
+            size = os.path.getsize(path)
+            storage_key, thumbnail_key = receipt_keys(content_hash, mime)
+
+            record_blob(cur, content_hash, mime, size, storage_key, thumbnail_key)
+            cur.execute("""
+                UPDATE payments SET payment_receipt = %s
+                WHERE payment_reference_number = %s
+                RETURNING payment_id
+            """, (storage_key, payment_ref))
+            payment = cur.fetchone()
+            if payment:
+                attach_payment_receipt(cur, payment[0], content_hash, filename.split('_', 2)[2])
+
+            # Re-encode a copy into the store while the blob row is locked
+            fd, tmp_path = tempfile.mkstemp(prefix='upload_', suffix='.part')
+            os.close(fd)
+            shutil.copyfile(path, tmp_path)
+            stored = process_receipt(_storage, tmp_path, mime, storage_key, thumbnail_key)
+            if not stored:
+                cur.connection.rollback()
+                logger.error("Skipping %s: the blob could not be stored", filename)
+                continue
+            if stored[0] != storage_key:
+                use_original_receipt(cur, content_hash, storage_key, stored[0])
+
+            # The flat file goes only once the rows pointing at the blob have committed
+            cur.connection.commit()
+            os.unlink(path)
+            imported += 1
+        except Exception as e:
+            cur.connection.rollback()
+            logger.exception("Error importing %s: %s", filename, e)
+    return imported
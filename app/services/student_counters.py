@@ -0,0 +1,121 @@
+"""Per-student counters behind the badges on every student page: pending bookings, account
+balance and notifications, cached for STUDENT_COUNTERS_TTL seconds.
+
+Pages don't wait on them: student_base.html fetches them from /student/counters after the
+page has rendered. Triggers on bookings and user_profile (migration 0006) NOTIFY
+`student_counters` with the students a write touched, and the live stats listener
+(app/services/live_stats.py) drops their entries in every process as soon as it commits.
+Writes made here drop them straight away as well. While the listener is down nothing is
+cached, so the TTL only matters for writes that bypass the triggers.
+"""
+import os
+import threading
+import psycopg2.extras
+from app.db.db import get_db_connection, release_db_connection
+from app.db.prepared import prepared
+from app.services import live_stats
+from app.services.fragment_cache import FragmentCache
+
+DEFAULT_TTL_SECONDS = 60
+# One entry per student signed in to this process lately
+COUNTERS_CACHE_SIZE = 10000
+
+STUDENT_COUNTERS = prepared('student_counters', """
+    SELECT
+        (SELECT COUNT(*)
+         FROM bookings
+         WHERE booking_user_id = %s
+         AND booking_status = 'Pending') AS pending_bookings,
+        (SELECT profile_account_balance
+         FROM user_profile
+         WHERE profile_user_id = %s) AS account_balance
+""")
+
+_cache = FragmentCache(COUNTERS_CACHE_SIZE)
+_settings = {'ttl': DEFAULT_TTL_SECONDS}
+_lock = threading.Lock()
+# Bumped by every invalidation, so counts read before one are not cached after it
+_generation = 0
+_watching = False
+
+
+def _key(user_id):
+    return f"student-counters:{user_id}"
+
+
+def _tag(user_id):
+    return f"user:{user_id}"
+
+
+def counters_from_row(row):
+    """Counters from a row of STUDENT_COUNTERS (None when the query found nothing)"""
+    pending = row['pending_bookings'] if row else 0
+    return {
+        'pending_bookings': pending,
+        'account_balance': float(row['account_balance'] or 0) if row else 0.0,
+        # Booking requests still waiting on the warden are the only notices students get
+        'notifications': pending,
+    }
+
+
+def cached_counters(user_id):
+    """The counters of `user_id` if this process has them, else None"""
+    return _cache.get(_key(user_id))
+
+
+def begin_load():
+    """Call before reading counters from the database; pass the result to remember_counters()"""
+    global _watching
+    with _lock:
+        if not _watching:
+            live_stats.watch_students(invalidate_counters)
+            _watching = True
+        return _generation
+
+
+def remember_counters(user_id, counters, loaded_at):
+    """Cache counters read since begin_load() returned `loaded_at`, unless a write may have
+    moved them meanwhile"""
+    with _lock:
+        if loaded_at == _generation and live_stats.listening():
+            _cache.set(_key(user_id), counters, _settings['ttl'], (_tag(user_id),))
+
+
+def student_counters(user_id, cur=None):
+    """The counters of `user_id`, from the cache when it has them. Pass the view's cursor (a
+    RealDictCursor on the primary) to query through it rather than a connection of its own."""
+    counters = cached_counters(user_id)
+    if counters is not None:
+        return counters
+
+    loaded_at = begin_load()
+    if cur is not None:
+        STUDENT_COUNTERS.execute(cur, (user_id, user_id))
+        counters = counters_from_row(cur.fetchone())
+    else:
+        conn = get_db_connection()
+        own_cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        try:
+            STUDENT_COUNTERS.execute(own_cur, (user_id, user_id))
+            counters = counters_from_row(own_cur.fetchone())
+        finally:
+            own_cur.close()
+            release_db_connection(conn)
+    remember_counters(user_id, counters, loaded_at)
+    return counters
+
+
+def invalidate_counters(*user_ids):
+    """Forget the counters of `user_ids`; of every student when called with None"""
+    global _generation
+    with _lock:
+        _generation += 1
+        if None in user_ids:
+            _cache.clear()
+        else:
+            _cache.invalidate(*(_tag(user_id) for user_id in user_ids))
+
+
+def init_student_counters(app):
+    app.config.setdefault('STUDENT_COUNTERS_TTL', float(os.getenv("STUDENT_COUNTERS_TTL", DEFAULT_TTL_SECONDS)))
+    _settings['ttl'] = app.config['STUDENT_COUNTERS_TTL']
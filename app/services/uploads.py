@@ -0,0 +1,225 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .storage import get_storage, is_blob_key
+
+logger = logging.getLogger(__name__)
+
+# Receipt upload settings
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_RECEIPT_BYTES = 5 * 1024 * 1024
+RECEIPT_MAX_DIMENSION = 1600
+RECEIPT_QUALITY = 80
+THUMBNAIL_SIZE = (240, 240)
+THUMBNAIL_QUALITY = 70
+
+# Magic bytes of the receipt formats we accept
+FILE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'%PDF-', 'application/pdf'),
+]
+# Extension of a receipt stored as it was uploaded
+ORIGINAL_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp', 'application/pdf': 'pdf'}
+
+# Receipts are re-encoded off the request thread
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='receipt-worker')
+_image_format = None
+
+StoredUpload = namedtuple('StoredUpload', 'content_hash mime size storage_key thumbnail_key tmp_path')
+
+
+class UploadError(Exception):
+    """Raised when an uploaded file is rejected"""
+
+
+def sniff_mime(head):
+    """Work out the file type from its first bytes, ignoring the client's claim"""
+    for signature, mime in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def stream_to_temp(file_storage, max_bytes=MAX_RECEIPT_BYTES):
+    """Stream an upload to a temp file in chunks, hashing and size-checking as we go"""
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    tmp = tempfile.NamedTemporaryFile(prefix='upload_', suffix='.part', delete=False)
+    try:
+        with tmp:
+            while True:
+                chunk = file_storage.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError('File is larger than the %d MB limit' % (max_bytes // (1024 * 1024)))
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        if size == 0:
+            raise UploadError('Uploaded file is empty')
+
+        mime = sniff_mime(head)
+        if not mime:
+            raise UploadError('Unsupported file type. Upload a JPG, PNG, WebP or PDF')
+
+        return tmp.name, digest.hexdigest(), mime, size
+    except Exception:
+        os.unlink(tmp.name)
+        raise
+
+
+def get_image_format():
+    """WebP when Pillow was built with it, JPEG otherwise"""
+    global _image_format
+    if _image_format is None:
+        from PIL import features
+        _image_format = 'WEBP' if features.check('webp') else 'JPEG'
+    return _image_format
+
+
+def receipt_keys(content_hash, mime):
+    """Blob keys of the stored receipt and its thumbnail"""
+    if mime == 'application/pdf':
+        return f"{content_hash}.pdf", None
+    ext = 'webp' if get_image_format() == 'WEBP' else 'jpg'
+    return f"{content_hash}.{ext}", f"{content_hash}_thumb.{ext}"
+
+
+def original_key(content_hash, mime):
+    """Blob key of a receipt kept as it was uploaded because it could not be re-encoded; PDFs are
+    always kept that way"""
+    if mime == 'application/pdf':
+        return f"{content_hash}.pdf"
+    return f"{content_hash}_original.{ORIGINAL_EXTENSIONS[mime]}"
+
+
+def thumbnail_key_for(receipt_key):
+    """Template filter: thumbnail key for a stored receipt, or None for PDFs, originals and legacy files"""
+    if not is_blob_key(receipt_key) or receipt_key.endswith('.pdf'):
+        return None
+    root, ext = os.path.splitext(receipt_key)
+    if root.endswith('_original'):
+        return None
+    if root.endswith('_thumb'):
+        return receipt_key
+    return f"{root}_thumb{ext}"
+
+
+def save_receipt(file_storage):
+    """Accept a receipt upload; hand it to queue_receipt() once the payment has committed, or to
+    discard_receipt() if it never does.
+
+    The content hash is known once the stream is read, so the payment row
+    can point at the blob straight away while the worker re-encodes it.
+    Identical files map to the same blob and are only processed once.
+    """
+    tmp_path, content_hash, mime, size = stream_to_temp(file_storage)
+    storage_key, thumbnail_key = receipt_keys(content_hash, mime)
+    return StoredUpload(content_hash, mime, size, storage_key, thumbnail_key, tmp_path)
+
+
+def queue_receipt(upload):
+    """Re-encode a saved receipt in the background. Only after its upload_blobs row has committed:
+    by then collect_garbage() has either finished with an earlier copy or will leave it alone."""
+    _executor.submit(_process_and_record, get_storage(), upload)
+
+
+def _process_and_record(storage, upload):
+    stored = process_receipt(storage, upload.tmp_path, upload.mime, upload.storage_key, upload.thumbnail_key)
+    if stored and stored[0] != upload.storage_key:
+        from app.db.db import get_db_connection, release_db_connection
+        from .storage import use_original_receipt
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            use_original_receipt(cur, upload.content_hash, upload.storage_key, stored[0])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Error pointing receipt %s at %s: %s", upload.storage_key, stored[0], e)
+        finally:
+            cur.close()
+            release_db_connection(conn)
+
+
+def discard_receipt(upload):
+    if os.path.exists(upload.tmp_path):
+        os.unlink(upload.tmp_path)
+
+
+def store_original(storage, tmp_path, mime, content_hash):
+    """Fallback for a receipt that could not be re-encoded: keep the uploaded bytes as they are,
+    with their own type and extension and no thumbnail. Returns the key, or None if that failed
+    too; the caller points the blob at it with use_original_receipt()."""
+    key = original_key(content_hash, mime)
+    try:
+        if not storage.exists(key):
+            if not os.path.exists(tmp_path):
+                return None
+            storage.put_file(key, tmp_path, mime)
+        return key
+    except Exception as e:
+        logger.exception("Error storing receipt %s: %s", key, e)
+        return None
+
+
+def process_receipt(storage, tmp_path, mime, storage_key, thumbnail_key):
+    """Background job: re-encode the receipt at bounded resolution and write its thumbnail.
+    Returns the (storage_key, thumbnail_key) stored, which are those of store_original() when
+    the image could not be re-encoded, or None when nothing could be stored."""
+    work_dir = None
+    try:
+        # Same content already stored under this hash
+        if storage.exists(storage_key):
+            return storage_key, thumbnail_key
+
+        if mime == 'application/pdf':
+            storage.put_file(storage_key, tmp_path, mime)
+            return storage_key, None
+
+        from PIL import Image, ImageOps
+        Image.MAX_IMAGE_PIXELS = 40_000_000
+
+        image_format = get_image_format()
+        content_type = 'image/webp' if image_format == 'WEBP' else 'image/jpeg'
+        work_dir = tempfile.mkdtemp(prefix='receipt_')
+
+        with Image.open(tmp_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if image_format == 'JPEG' or img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGB')
+
+            img.thumbnail((RECEIPT_MAX_DIMENSION, RECEIPT_MAX_DIMENSION))
+            main_path = os.path.join(work_dir, storage_key)
+            img.save(main_path, image_format, quality=RECEIPT_QUALITY, optimize=True)
+
+            img.thumbnail(THUMBNAIL_SIZE)
+            thumb_path = os.path.join(work_dir, thumbnail_key)
+            img.save(thumb_path, image_format, quality=THUMBNAIL_QUALITY, optimize=True)
+
+        # Thumbnail first: once the main blob exists the receipt counts as stored
+        storage.put_file(thumbnail_key, thumb_path, content_type)
+        storage.put_file(storage_key, main_path, content_type)
+        return storage_key, thumbnail_key
+    except Exception as e:
+        logger.exception("Error processing receipt %s, storing the upload as it came: %s", storage_key, e)
+        key = store_original(storage, tmp_path, mime, storage_key.split('.', 1)[0])
+        return (key, None) if key else None
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,26 @@
+import time
+import logging
+from app.db.db import warm_db_pool
+
+logger = logging.getLogger(__name__)
+
+
+def warm_templates(app):
+    """Compile every template once so the first render of each page isn't slow"""
+    compiled = 0
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            logger.error("Error compiling template %s: %s", name, e)
+    return compiled
+
+
+def warm_up(app, connections):
+    """Get a freshly started worker ready before it accepts traffic"""
+    started = time.perf_counter()
+    opened = warm_db_pool(connections)
+    compiled = warm_templates(app)
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info("Worker warm: %s DB connection(s), %s template(s) in %.0f ms", opened, compiled, elapsed)
@@ -0,0 +1,36 @@
+// Live counters for the admin pages. The element with data-live-stats="<group>" names the stats
+// to follow and data-live-url the event stream (/admin/events); every change updates the
+// [data-stat="<key>"] elements, flips the [data-stat-trend="<key>"] badges between their
+// data-up/data-down classes, and is passed on as a 'live-stats' event (e.g. for the charts).
+(function() {
+    const root = document.querySelector('[data-live-stats]');
+    if (!root || !window.EventSource) return;
+
+    const ARROW_UP = 'M18 15L12 9L6 15';
+    const ARROW_DOWN = 'M6 9L12 15L18 9';
+
+    function update(changes) {
+        Object.keys(changes).forEach(function(key) {
+            const value = changes[key];
+            if (value !== null && typeof value === 'object') return;
+
+            document.querySelectorAll('[data-stat="' + key + '"]').forEach(function(element) {
+                element.textContent = value;
+            });
+            document.querySelectorAll('[data-stat-trend="' + key + '"]').forEach(function(element) {
+                const up = Number(value) >= 0;
+                element.classList.toggle(element.dataset.up, up);
+                element.classList.toggle(element.dataset.down, !up);
+                const arrow = element.querySelector('path');
+                if (arrow) arrow.setAttribute('d', up ? ARROW_UP : ARROW_DOWN);
+            });
+        });
+        document.dispatchEvent(new CustomEvent('live-stats', { detail: changes }));
+    }
+
+    // EventSource reconnects on its own, after however long the server's `retry:` asks for
+    const source = new EventSource(root.dataset.liveUrl);
+    source.addEventListener(root.dataset.liveStats, function(event) {
+        update(JSON.parse(event.data));
+    });
+})();
@@ -0,0 +1,18 @@
+// Badge counters for the student pages. They are not part of the page render: once the page is
+// up, this fetches them from /student/counters and fills every [data-counter="<key>"] element.
+// A badge stays hidden (empty) while its count is zero or unknown.
+(function() {
+    const badges = document.querySelectorAll('[data-counter]');
+    if (!badges.length) return;
+
+    fetch('/student/counters', { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+        .then(function(response) { return response.ok ? response.json() : null; })
+        .then(function(data) {
+            if (!data || !data.success) return;
+            badges.forEach(function(badge) {
+                const value = data.counters[badge.dataset.counter];
+                badge.textContent = value ? value : '';
+            });
+        })
+        .catch(function() {});
+})();
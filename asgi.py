@@ -0,0 +1,11 @@
+"""ASGI entry point: async JSON endpoints, everything else through Flask (see app/asgi.py).
+
+    WEB_ASGI=1 gunicorn -c gunicorn.conf.py
+    uvicorn asgi:app --port 8000          (development)
+"""
+import os
+from run import app as flask_app
+from app.asgi import create_asgi_app
+
+# Flask requests still run in threads; as many at once as a gthread worker would take
+app = create_asgi_app(flask_app, wsgi_threads=int(os.getenv('WEB_THREADS', 4)))
@@ -0,0 +1,221 @@
+"""Concurrent pending requests one worker can carry: gthread (WSGI) vs uvicorn (ASGI).
+
+Starts gunicorn with a single worker twice, once as `run:app` on threads and
+once as `asgi:app` (WEB_ASGI=1), and for each level of concurrency keeps that
+many clients requesting the async JSON endpoints as an admin for a while.
+Postgres is reached through a local proxy that adds --db-latency-ms to each
+round trip, the way a database across the network does, so requests spend
+their time waiting on it. Reports throughput, latency, failed requests and
+the worker's peak resident memory:
+
+    python bench/datagen.py --reset
+    python bench/bench_async.py --levels 50,500,2000 --db-latency-ms 5
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.bench_server import free_port, server_command, wait_until_up, percentile  # noqa: E402
+from bench.datagen import ADMIN_EMAIL  # noqa: E402
+
+DEFAULT_PATHS = ['/admin/get_hostels', '/admin/get_rooms/1', '/admin/get_rooms/2']
+DEFAULT_LEVELS = '50,500,2000'
+
+
+####################### SLOW POSTGRES ###########################
+class LatencyProxy(threading.Thread):
+    """TCP proxy in front of Postgres that holds every chunk for `latency` seconds"""
+
+    def __init__(self, upstream_host, upstream_port, latency):
+        super().__init__(daemon=True)
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.latency = latency
+        self.port = free_port()
+        self.ready = threading.Event()
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._client, '127.0.0.1', self.port)
+        self.ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _open_upstream(self):
+        if self.upstream_host.startswith('/'):
+            return await asyncio.open_unix_connection(f"{self.upstream_host}/.s.PGSQL.{self.upstream_port}")
+        return await asyncio.open_connection(self.upstream_host, self.upstream_port)
+
+    async def _client(self, reader, writer):
+        up_reader, up_writer = await self._open_upstream()
+        await asyncio.gather(self._pipe(reader, up_writer), self._pipe(up_reader, writer), return_exceptions=True)
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(self.latency)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+####################### LOAD ###########################
+async def request(port, path, cookie):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write((f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n"
+                      "Connection: close\r\n\r\n").encode())
+        await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def load(port, paths, cookie, concurrency, duration, timeout):
+    latencies, failures = [], [0]
+    stop_at = time.monotonic() + duration
+
+    async def client(offset):
+        i = offset
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(request(port, paths[i % len(paths)], cookie), timeout)
+                if status == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    failures[0] += 1
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                failures[0] += 1
+            i += 1
+
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return sorted(latencies), failures[0]
+
+
+def worker_rss_mb(master_pid):
+    """Resident memory of the master's worker processes, from /proc"""
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue
+        if int(status.get('PPid', 0)) == master_pid:
+            total += int(status['VmRSS'].split()[0])
+    return round(total / 1024, 1)
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, master_pid):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.peak = 0.0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, worker_rss_mb(self.master_pid))
+            self.stop_event.wait(0.5)
+
+
+def run_mode(name, env, args, levels, cookie):
+    port = free_port()
+    proc = subprocess.Popen(server_command('gunicorn', port), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        if not wait_until_up(port):
+            raise SystemExit(f"{name}: server did not come up")
+        asyncio.run(load(port, args.paths, cookie, 4, 2, args.timeout))
+        for level in levels:
+            sampler = RssSampler(proc.pid)
+            sampler.start()
+            latencies, failures = asyncio.run(load(port, args.paths, cookie, level, args.duration, args.timeout))
+            sampler.stop_event.set()
+            sampler.join()
+            results[level] = {
+                'rps': round(len(latencies) / args.duration, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'failed': failures,
+                'rss_mb': sampler.peak,
+            }
+            print(f"{name:<5} {level:>6} {results[level]['rps']:>9} {results[level]['p50_ms']:>9} "
+                  f"{results[level]['p99_ms']:>9} {failures:>7} {sampler.peak:>8}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return results
+
+
+def session_cookie():
+    """A signed Flask session for the bench admin, as if they had logged in"""
+    import psycopg2
+    from app import create_app
+    from app.db.db import POSTGRES_CONFIG
+
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM users WHERE user_email = %s;", (ADMIN_EMAIL,))
+        row = cur.fetchone()
+    finally:
+        conn.close()
+    if not row:
+        raise SystemExit("No bench admin; run bench/datagen.py first")
+    app = create_app()
+    value = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(row[0]), '_fresh': True})
+    return f"{app.config['SESSION_COOKIE_NAME']}={value}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default=DEFAULT_LEVELS, help='Concurrent clients to try, comma separated')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per level')
+    parser.add_argument('--timeout', type=float, default=30, help='A request slower than this counts as failed')
+    parser.add_argument('--db-latency-ms', type=float, default=5, help='Added to each Postgres round trip')
+    parser.add_argument('--threads', type=int, default=4, help='gthread threads (and Flask threads under ASGI)')
+    parser.add_argument('--path', dest='paths', action='append', help='Endpoint to request (repeatable)')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'bench', 'results', 'async.json'))
+    args = parser.parse_args()
+    args.paths = args.paths or DEFAULT_PATHS
+    levels = [int(level) for level in args.levels.split(',')]
+
+    from app.db.db import POSTGRES_CONFIG
+    proxy = LatencyProxy(POSTGRES_CONFIG['host'] or '127.0.0.1', int(POSTGRES_CONFIG['port'] or 5432),
+                         args.db_latency_ms / 1000)
+    proxy.start()
+    proxy.ready.wait()
+    cookie = session_cookie()
+
+    base_env = dict(os.environ, WEB_CONCURRENCY='1', WEB_THREADS=str(args.threads), LOG_LEVEL='WARNING',
+                    POSTGRES_HOST='127.0.0.1', POSTGRES_PORT=str(proxy.port))
+    print(f"{'mode':<5} {'users':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7} {'RSS MB':>8}")
+    results = {
+        'wsgi': run_mode('wsgi', base_env, args, levels, cookie),
+        'asgi': run_mode('asgi', dict(base_env, WEB_ASGI='1'), args, levels, cookie),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
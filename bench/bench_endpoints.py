@@ -0,0 +1,172 @@
+"""End-to-end latency and query counts of the heaviest pages.
+
+Renders each endpoint through the Flask test client (no network, so the
+numbers are application + database time) signed in as the accounts created
+by bench/datagen.py, and writes the results to JSON so two commits can be
+compared:
+
+    python bench/datagen.py --reset
+    python bench/bench_endpoints.py --out bench/results/before.json
+    python bench/bench_endpoints.py --compare bench/results/before.json --max-regression 20
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.bench_server import percentile  # noqa: E402
+from bench.datagen import ADMIN_EMAIL, STUDENT_EMAIL  # noqa: E402
+
+# (role, path)
+ENDPOINTS = [
+    ('student', '/student/rooms'),
+    ('student', '/student/payments/payment-history'),
+    ('admin', '/admin/dashboard'),
+    ('admin', '/admin/reports'),
+]
+DATASET_TABLES = ('hostels', 'rooms', 'users', 'bookings', 'payments', 'allocations')
+# Slowdowns smaller than this are noise on pages that render in a few ms
+NOISE_FLOOR_MS = 2
+
+_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def signed_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def dataset_summary(cur):
+    summary = {}
+    for table in DATASET_TABLES:
+        cur.execute(f"SELECT COUNT(*) FROM {table};")
+        summary[table] = cur.fetchone()[0]
+    return summary
+
+
+def measure(client, path, iterations, warmup):
+    for _ in range(warmup):
+        client.get(path)
+
+    latencies, db_ms, queries, statuses = [], [], [], set()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(path)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses.add(response.status_code)
+        timing = _SERVER_TIMING.search(response.headers.get('Server-Timing', ''))
+        if timing:
+            db_ms.append(float(timing.group(1)))
+            queries.append(int(timing.group(2)))
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'max_ms': round(latencies[-1], 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'db_ms': round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+        'queries': max(queries) if queries else None,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Print the change against a previous run; True if any p50 or query count got worse than allowed"""
+    failed = False
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'}:")
+    for path, current in results['endpoints'].items():
+        before = baseline['endpoints'].get(path)
+        if not before:
+            continue
+        change = (current['p50_ms'] - before['p50_ms']) * 100 / before['p50_ms'] if before['p50_ms'] else 0.0
+        more_queries = (current['queries'] or 0) > (before['queries'] or 0)
+        slower = change > max_regression and current['p50_ms'] - before['p50_ms'] > NOISE_FLOOR_MS
+        regressed = slower or more_queries
+        failed = failed or regressed
+        print(f"  {'REGRESSED' if regressed else 'ok':<9} {path:<40} p50 {before['p50_ms']:>8.1f} -> "
+              f"{current['p50_ms']:>8.1f} ms ({change:+.0f}%)  queries {before['queries']} -> {current['queries']}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--path', dest='paths', action='append', help='Only benchmark this path (repeatable)')
+    parser.add_argument('--out', help='Where to write the JSON results (default bench/results/<commit>.json)')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--max-regression', type=float, default=20, help='Allowed p50 slowdown in percent')
+    args = parser.parse_args()
+
+    # Keep the request log and the in-page SQL panel out of the measurements
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['SQL_DEBUG_PANEL'] = '0'
+
+    from app import create_app
+    from app.db.db import get_db_connection, release_db_connection
+
+    app = create_app()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id, user_email FROM users WHERE user_email IN (%s, %s);",
+                    (ADMIN_EMAIL, STUDENT_EMAIL.format(2)))
+        accounts = {('admin' if email == ADMIN_EMAIL else 'student'): user_id for user_id, email in cur.fetchall()}
+        dataset = dataset_summary(cur)
+        conn.rollback()
+        cur.close()
+    finally:
+        release_db_connection(conn)
+    if len(accounts) != 2:
+        raise SystemExit("Bench accounts not found; load data with bench/datagen.py first")
+
+    clients = {role: signed_in_client(app, user_id) for role, user_id in accounts.items()}
+    results = {
+        'commit': git_commit(),
+        'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'dataset': dataset,
+        'endpoints': {},
+    }
+    for role, path in ENDPOINTS:
+        if args.paths and path not in args.paths:
+            continue
+        result = measure(clients[role], path, args.iterations, args.warmup)
+        results['endpoints'][path] = result
+        print(f"{path:<40} p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+              f"db {result['db_ms']} ms  {result['queries']} queries  status {result['status']}")
+
+    out = args.out or os.path.join(ROOT, 'bench', 'results', f"{results['commit'] or 'latest'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Queries the admin dashboard costs while admins keep it open: reloading vs /admin/events.
+
+Keeps --admins dashboards open for --duration seconds while a booking flips
+between Pending and Cancelled --writes-per-second times a second. First each
+admin reloads the page every --reload seconds, the way they did before the
+page updated itself; then each holds an event stream instead (a subscriber
+of app/services/live_stats.py, as /admin/events is). Reports the statements
+the app sent to Postgres per minute either way, and how long a committed
+write took to reach the open pages:
+
+    python bench/datagen.py --reset
+    python bench/bench_live_stats.py --admins 20 --reload 10 --duration 60
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.bench_server import percentile  # noqa: E402
+from bench.datagen import ADMIN_EMAIL  # noqa: E402
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, cursor, statement, duration):
+        with self._lock:
+            self.count += 1
+
+
+class Writer(threading.Thread):
+    """Flips one Pending booking to Cancelled and back, and remembers when each flip committed"""
+
+    def __init__(self, rate, duration):
+        super().__init__(daemon=True)
+        self.rate = rate
+        self.duration = duration
+        self.commits = []
+
+    def run(self):
+        import psycopg2
+        from app.db.db import POSTGRES_CONFIG
+
+        conn = psycopg2.connect(**POSTGRES_CONFIG)
+        cur = conn.cursor()
+        cur.execute("SELECT booking_id FROM bookings WHERE booking_status = 'Pending' ORDER BY booking_id LIMIT 1;")
+        booking_id = cur.fetchone()[0]
+        status = 'Pending'
+        try:
+            stop_at = time.monotonic() + self.duration
+            while time.monotonic() < stop_at:
+                status = 'Cancelled' if status == 'Pending' else 'Pending'
+                cur.execute("UPDATE bookings SET booking_status = %s WHERE booking_id = %s;", (status, booking_id))
+                conn.commit()
+                self.commits.append(time.monotonic())
+                time.sleep(1 / self.rate)
+        finally:
+            cur.execute("UPDATE bookings SET booking_status = 'Pending' WHERE booking_id = %s;", (booking_id,))
+            conn.commit()
+            conn.close()
+
+
+def admin_client(app):
+    from app.db.db import get_db_connection, release_db_connection
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM users WHERE user_email = %s;", (ADMIN_EMAIL,))
+        row = cur.fetchone()
+    finally:
+        release_db_connection(conn)
+    if not row:
+        raise SystemExit("No bench admin; run bench/datagen.py first")
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(row[0])
+        session['_fresh'] = True
+    return client
+
+
+def run_reloading(app, counter, args):
+    client = admin_client(app)
+    writer = Writer(args.writes_per_second, args.duration)
+    counter.count = 0
+    writer.start()
+    stop_at = time.monotonic() + args.duration
+    next_reload = [time.monotonic() + args.reload * n / args.admins for n in range(args.admins)]
+    while time.monotonic() < stop_at:
+        n = min(range(args.admins), key=next_reload.__getitem__)
+        time.sleep(max(0.0, next_reload[n] - time.monotonic()))
+        client.get('/admin/dashboard')
+        next_reload[n] += args.reload
+    writer.join()
+    return {'statements_per_minute': round(counter.count * 60 / args.duration, 1)}
+
+
+def run_streaming(app, counter, args):
+    from app.services import live_stats
+
+    delivered = []
+
+    def deliver(group, changes):
+        if 'pending_requests' in changes:
+            delivered.append(time.monotonic())
+
+    callbacks = [lambda group, changes: None for _ in range(args.admins - 1)] + [deliver]
+    for callback in callbacks:
+        live_stats._hub.subscribe(callback, ('dashboard',))
+    time.sleep(2)
+    writer = Writer(args.writes_per_second, args.duration)
+    counter.count = 0
+    writer.start()
+    writer.join()
+    time.sleep(2)
+    statements = counter.count
+    for callback in callbacks:
+        live_stats._hub.unsubscribe(callback)
+
+    delays = sorted(
+        min(at for at in delivered if at >= committed) - committed
+        for committed in writer.commits if any(at >= committed for at in delivered)
+    )
+    return {
+        'statements_per_minute': round(statements * 60 / args.duration, 1),
+        'updates_delivered': len(delivered),
+        'p50_delay_ms': round(percentile(delays, 50) * 1000, 1),
+        'p99_delay_ms': round(percentile(delays, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--admins', type=int, default=20, help='Dashboards open at once')
+    parser.add_argument('--reload', type=float, default=10, help='Seconds between reloads of each page')
+    parser.add_argument('--writes-per-second', type=float, default=2)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds per mode')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'bench', 'results', 'live_stats.json'))
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.db.instrumentation import add_query_listener
+    app = create_app()
+    counter = StatementCounter()
+    add_query_listener(counter)
+
+    results = {'reloading': run_reloading(app, counter, args)}
+    print(f"reloading: {results['reloading']['statements_per_minute']} statements/min")
+    results['streaming'] = run_streaming(app, counter, args)
+    print(f"streaming: {results['streaming']['statements_per_minute']} statements/min, "
+          f"{results['streaming']['updates_delivered']} updates, "
+          f"delay p50 {results['streaming']['p50_delay_ms']} ms, p99 {results['streaming']['p99_delay_ms']} ms")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Parse and plan overhead of the hot statements, plain vs prepared.
+
+Runs each statement registered in app/db/prepared.py over one connection,
+first as a plain query and then through PREPARE/EXECUTE, and reports the
+mean round trip of each along with the planning time Postgres reports
+(EXPLAIN ANALYZE) once the prepared statement has settled on its plan:
+
+    python bench/datagen.py --reset
+    python bench/bench_prepared.py --runs 500 --out bench/results/prepared.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.datagen import STUDENT_EMAIL  # noqa: E402
+
+# Statement name -> parameters that exist in bench/datagen.py data
+SAMPLE_PARAMS = {
+    'user_role_names': (2,),
+    'login_lookup': (STUDENT_EMAIL.format(2),),
+    'login_role_ids': (2,),
+    'student_counters': (2, 2),
+    'user_balance': (2,),
+    'available_rooms': (),
+    'available_rooms_type_min': ('Single', 20000.0),
+}
+# Postgres plans the first five EXECUTEs for their parameters before trying a generic plan
+CUSTOM_PLAN_EXECUTIONS = 5
+
+
+def planning_ms(cur, query, params):
+    cur.execute("EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) " + query, params)
+    return cur.fetchone()[0][0]['Planning Time']
+
+
+def round_trip_ms(cur, query, params, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        cur.execute(query, params)
+        cur.fetchall()
+    return (time.perf_counter() - started) * 1000 / runs
+
+
+def measure(conn, statement, params, runs):
+    cur = conn.cursor()
+    plain_plan = min(planning_ms(cur, statement.query, params) for _ in range(5))
+    plain = round_trip_ms(cur, statement.query, params, runs)
+
+    cur.execute(statement.prepare)
+    execute = statement.statement.as_string(cur)
+    round_trip_ms(cur, execute, params, CUSTOM_PLAN_EXECUTIONS)
+    prepared = round_trip_ms(cur, execute, params, runs)
+    prepared_plan = min(planning_ms(cur, execute, params) for _ in range(5))
+    cur.execute("SELECT generic_plans, custom_plans FROM pg_prepared_statements WHERE name = %s;",
+                (statement.name,))
+    generic_plans, custom_plans = cur.fetchone()
+    cur.execute("DEALLOCATE " + statement.name)
+    conn.rollback()
+    cur.close()
+    return {
+        'plain_ms': round(plain, 3),
+        'prepared_ms': round(prepared, 3),
+        'plain_planning_ms': round(plain_plan, 3),
+        'prepared_planning_ms': round(prepared_plan, 3),
+        'generic_plan': generic_plans > 0,
+        'custom_plans': custom_plans,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=200, help='Executions per statement and mode')
+    parser.add_argument('--only', action='append', help='Statement name (repeatable)')
+    parser.add_argument('--out', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    import psycopg2
+    from app.db.db import POSTGRES_CONFIG
+    from app.db.prepared import prepared, registered_statements
+    # Importing the routes registers their statements
+    import app.routes.auth  # noqa: F401
+    from app.routes.student import AVAILABLE_ROOMS_QUERY
+    prepared('available_rooms_type_min',
+             AVAILABLE_ROOMS_QUERY + " AND r.room_type = %s AND r.room_price_per_sem >= %s"
+             " ORDER BY r.room_price_per_sem ASC, h.hostel_name, r.room_number")
+    prepared('available_rooms', AVAILABLE_ROOMS_QUERY + " ORDER BY r.room_price_per_sem ASC, h.hostel_name, r.room_number")
+
+    statements = registered_statements()
+    names = args.only or [name for name in SAMPLE_PARAMS if name in statements]
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    try:
+        results = {name: measure(conn, statements[name], SAMPLE_PARAMS[name], args.runs) for name in names}
+    finally:
+        conn.close()
+
+    print(f"{'statement':<26} {'plain ms':>9} {'prepared':>9} {'plan ms':>8} {'-> prep':>8}  plan")
+    for name, result in results.items():
+        kind = 'generic' if result['generic_plan'] else f"custom x{result['custom_plans']}"
+        print(f"{name:<26} {result['plain_ms']:>9.3f} {result['prepared_ms']:>9.3f} "
+              f"{result['plain_planning_ms']:>8.3f} {result['prepared_planning_ms']:>8.3f}  {kind}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Execution time and plan shape of the hot-path queries.
+
+Runs each query under EXPLAIN (ANALYZE, FORMAT JSON) and reports the best
+execution time and whether Postgres had to fall back to a sequential scan.
+Use it on either side of a migration:
+
+    python bench/bench_queries.py --out bench/results/queries-before.json
+    flask --app run db migrate
+    python bench/bench_queries.py --compare bench/results/queries-before.json
+"""
+import os
+import sys
+import json
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The predicates the views filter on, with parameters that exist in bench/datagen.py data
+HOT_QUERIES = {
+    'active bookings of a student': (
+        "SELECT booking_id FROM bookings WHERE booking_user_id = %s AND booking_status IN ('Pending', 'Confirmed');",
+        (2,)),
+    'spots left in a room': (
+        "SELECT COUNT(*) FROM bookings WHERE booking_room_id = %s AND booking_status IN ('Confirmed', 'Pending');",
+        (1,)),
+    'pending payments this month': (
+        "SELECT COUNT(*), COALESCE(SUM(payment_amount), 0) FROM payments "
+        "WHERE payment_status = 'Pending' AND payment_date >= DATE_TRUNC('month', CURRENT_DATE);", ()),
+    'revenue last 30 days': (
+        "SELECT COALESCE(SUM(payment_amount), 0) FROM payments "
+        "WHERE payment_status = 'Success' AND payment_date >= CURRENT_DATE - 30;", ()),
+    'photos of a room': (
+        "SELECT image_url FROM room_images WHERE image_room_id = %s;", (1,)),
+    'rooms of a hostel by price': (
+        "SELECT room_id, room_number FROM rooms WHERE room_hostel_id = %s AND room_price_per_sem <= %s "
+        "ORDER BY room_price_per_sem;", (1, 30000)),
+    'allocation of a payment': (
+        "SELECT allocation_id FROM allocations WHERE allocation_payment_id = %s;", (1,)),
+}
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def measure(cur, query, params, runs):
+    best, plan = None, None
+    for _ in range(runs):
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+        result = cur.fetchone()[0][0]
+        if best is None or result['Execution Time'] < best:
+            best, plan = result['Execution Time'], result['Plan']
+    nodes = list(plan_nodes(plan))
+    return {
+        'ms': round(best, 3),
+        'seq_scans': sorted({n['Relation Name'] for n in nodes if n['Node Type'] == 'Seq Scan'}),
+        'indexes': sorted({n['Index Name'] for n in nodes if 'Index Name' in n}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Best of N executions')
+    parser.add_argument('--out', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Earlier results to show the change against')
+    args = parser.parse_args()
+
+    import psycopg2
+    from app.db.db import POSTGRES_CONFIG
+
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    try:
+        cur = conn.cursor()
+        results = {name: measure(cur, query, params, args.runs) for name, (query, params) in HOT_QUERIES.items()}
+        conn.rollback()
+    finally:
+        conn.close()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    for name, result in results.items():
+        before = baseline.get(name)
+        change = f"{before['ms']:>9.3f} -> " if before else ''
+        scans = f"seq scan on {', '.join(result['seq_scans'])}" if result['seq_scans'] else ', '.join(result['indexes'])
+        print(f"{name:<30} {change}{result['ms']:>9.3f} ms  {scans}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Throughput of the Flask dev server vs the gunicorn setup.
+
+Starts each server on a free port, hammers a few read-only pages from a
+pool of client threads and prints requests/s and latency percentiles.
+
+    python bench/bench_server.py --duration 20 --concurrency 32
+    python bench/bench_server.py --server gunicorn --path /student/rooms --cookie "session=..."
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PATHS = ['/', '/login']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(kind, port):
+    if kind == 'dev':
+        return [sys.executable, '-m', 'flask', '--app', 'run', 'run', '--port', str(port)]
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+            '--access-logfile', '/dev/null']
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def hammer(base_url, paths, duration, concurrency, cookie=None):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(offset):
+        i = offset
+        local, failed = [], 0
+        while time.monotonic() < stop_at:
+            req = urllib.request.Request(base_url + paths[i % len(paths)])
+            if cookie:
+                req.add_header('Cookie', cookie)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                local.append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                failed += 1
+            i += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), errors[0]
+
+
+def run_benchmark(kind, args):
+    port = free_port()
+    proc = subprocess.Popen(server_command(kind, port), cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_until_up(port):
+            print(f"{kind}: server did not come up")
+            return None
+        base_url = f"http://127.0.0.1:{port}"
+        # One untimed pass so both servers start warm
+        hammer(base_url, args.paths, 2, 2, args.cookie)
+        latencies, errors = hammer(base_url, args.paths, args.duration, args.concurrency, args.cookie)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    rps = len(latencies) / args.duration
+    print(f"{kind:>9}: {rps:8.1f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:6.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:6.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:6.1f} ms  "
+          f"errors {errors}")
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('dev', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--path', dest='paths', action='append', help='Page to request (repeatable)')
+    parser.add_argument('--cookie', help='Session cookie for pages behind login')
+    args = parser.parse_args()
+    args.paths = args.paths or DEFAULT_PATHS
+
+    results = {}
+    for kind in (('dev', 'gunicorn') if args.server == 'both' else (args.server,)):
+        results[kind] = run_benchmark(kind, args)
+
+    if results.get('dev') and results.get('gunicorn'):
+        print(f"gunicorn is {results['gunicorn'] / results['dev']:.1f}x the dev server")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Fill a local Postgres with production-sized synthetic data.
+
+Rows are generated deterministically from --seed and streamed in with COPY,
+so the default volumes load in a few minutes. Every user shares the same
+password; the first user is an admin and the rest are students.
+
+    python bench/datagen.py --reset
+    python bench/datagen.py --reset --hostels 5 --rooms 500 --users 2000 --bookings 8000
+
+Point it at a scratch database: --reset truncates every application table.
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_PASSWORD = 'nyumbani-bench'
+ADMIN_EMAIL = 'admin@bench.nyumbani.test'
+STUDENT_EMAIL = 'student{}@bench.nyumbani.test'
+
+TABLES = ('allocations', 'payment_receipts', 'payments', 'bookings', 'room_images', 'rooms', 'hostels',
+          'user_roles', 'user_profile', 'users')
+ROOM_TYPES = (('Single', 1, 45000, 0.5), ('Double', 2, 32000, 0.3), ('Shared', 4, 21000, 0.2))
+BOOKING_STATUSES = (('Confirmed', 0.6), ('Pending', 0.25), ('Cancelled', 0.15))
+PAYMENT_STATUSES = (('Success', 0.85), ('Pending', 0.1), ('Failed', 0.05))
+PAYMENT_METHODS = (('Mpesa', 0.8), ('Cash', 0.2))
+LOCATIONS = ('Juja', 'Thika', 'Kahawa', 'Ruiru', 'Githurai', 'Kenyatta Road', 'Gachororo')
+FIRST_NAMES = ('Amani', 'Baraka', 'Chebet', 'Dalia', 'Esther', 'Faith', 'Gitau', 'Halima', 'Imani', 'Jabari',
+               'Kamau', 'Lulu', 'Mwangi', 'Nia', 'Otieno', 'Pendo', 'Rehema', 'Sefu', 'Wanjiru', 'Zawadi')
+LAST_NAMES = ('Achieng', 'Kariuki', 'Mutua', 'Njoroge', 'Odhiambo', 'Wafula', 'Kiprono', 'Mohamed', 'Njeri',
+              'Omondi', 'Chege', 'Kilonzo', 'Wekesa', 'Atieno', 'Maina')
+IMAGE_URLS = (
+    'https://images.unsplash.com/photo-1586023492125-27b2c045efd7?w=500&h=300&fit=crop',
+    'https://images.unsplash.com/photo-1564078516393-cf04bd966897?w=500&h=300&fit=crop',
+    'https://images.unsplash.com/photo-1555854877-bab0e564b8d5?w=500&h=300&fit=crop',
+    'https://images.unsplash.com/photo-1631049307264-da0ec9d70304?w=500&h=300&fit=crop',
+)
+
+
+class RowStream:
+    """File-like object that renders rows as CSV on demand, so COPY never needs the whole table in memory"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self._writer = csv.writer(self, lineterminator='\n')
+        self.count = 0
+
+    def write(self, text):
+        self._buffer += text
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(['' if value is None else value for value in row])
+            self.count += 1
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def weighted(rng, choices):
+    roll = rng.random()
+    for value, weight in choices:
+        roll -= weight
+        if roll < 0:
+            return value
+    return choices[-1][0]
+
+
+def copy_rows(cur, table, columns, rows):
+    started = time.perf_counter()
+    stream = RowStream(rows)
+    # NULL '' matches how RowStream writes None
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')", stream, size=1 << 16)
+    print(f"  {table:<14} {stream.count:>9} rows in {time.perf_counter() - started:6.1f} s")
+    return stream.count
+
+
+####################### GENERATORS ###########################
+def hostel_rows(args, rng):
+    per_hostel = args.rooms // args.hostels
+    for hostel_id in range(1, args.hostels + 1):
+        total = per_hostel + (1 if hostel_id <= args.rooms % args.hostels else 0)
+        yield (hostel_id, f"Hostel {hostel_id:03d}", rng.choice(LOCATIONS), total,
+               f"Synthetic hostel {hostel_id} for load testing", IMAGE_URLS[hostel_id % len(IMAGE_URLS)])
+
+
+def room_rows(args, rng, rooms):
+    room_id = 0
+    for hostel_id in range(1, args.hostels + 1):
+        per_hostel = args.rooms // args.hostels + (1 if hostel_id <= args.rooms % args.hostels else 0)
+        for number in range(1, per_hostel + 1):
+            room_id += 1
+            room_type, capacity, base_price, _ = weighted(rng, [(t, t[3]) for t in ROOM_TYPES])
+            price = base_price + rng.randrange(0, 8000, 500)
+            rooms.append(price)
+            yield (room_id, hostel_id, f"{hostel_id:03d}-{number:05d}", room_type, capacity, price)
+
+
+def room_image_rows(rooms):
+    for room_id in range(1, len(rooms) + 1):
+        yield (room_id, IMAGE_URLS[room_id % len(IMAGE_URLS)])
+
+
+def user_rows(args, rng, password_hash):
+    yield (1, ADMIN_EMAIL, '0700000000', 'Bench', 'Admin', 'Female', password_hash)
+    for user_id in range(2, args.users + 1):
+        yield (user_id, STUDENT_EMAIL.format(user_id), f"07{rng.randrange(10 ** 8):08d}",
+               rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(('Male', 'Female')), password_hash)
+
+
+def profile_rows(args, rng):
+    for user_id in range(2, args.users + 1):
+        yield (user_id, rng.randrange(0, 20000, 250), f"07{rng.randrange(10 ** 8):08d}", f"SCT{user_id:08d}")
+
+
+def user_role_rows(args, roles):
+    yield (1, roles['admin'])
+    for user_id in range(2, args.users + 1):
+        yield (user_id, roles['student'])
+
+
+def booking_rows(args, rng, rooms, bookings):
+    """Spread bookings over the students, each student booking distinct rooms"""
+    students = args.users - 1
+    today = date.today()
+    span = args.years * 365
+    booking_id = 0
+    for index in range(students):
+        user_id = index + 2
+        count = args.bookings // students + (1 if index < args.bookings % students else 0)
+        for room_index in rng.sample(range(len(rooms)), min(count, len(rooms))):
+            booking_id += 1
+            booked_on = today - timedelta(days=rng.randrange(span))
+            status = weighted(rng, BOOKING_STATUSES)
+            bookings.append((booking_id, room_index, booked_on, status))
+            yield (booking_id, f"BK{booking_id:010d}", user_id, room_index + 1, booked_on, status)
+
+
+def payment_rows(rng, rooms, bookings, payments):
+    today = date.today()
+    payment_id = 0
+    for booking_id, room_index, booked_on, booking_status in bookings:
+        if booking_status == 'Cancelled' or rng.random() > 0.9:
+            continue
+        payment_id += 1
+        status = 'Success' if booking_status == 'Confirmed' else weighted(rng, PAYMENT_STATUSES)
+        paid_on = min(today, booked_on + timedelta(days=rng.randrange(15)))
+        payments.append((payment_id, booking_id, booking_status, status, paid_on))
+        # The views join payments to bookings on the reference number
+        yield (payment_id, f"BK{booking_id:010d}", rooms[room_index], weighted(rng, PAYMENT_METHODS),
+               paid_on, status)
+
+
+def allocation_rows(payments):
+    for payment_id, booking_id, booking_status, status, paid_on in payments:
+        if booking_status == 'Confirmed' and status == 'Success':
+            yield (booking_id, payment_id, paid_on, paid_on + timedelta(days=120))
+
+
+####################### MAIN ###########################
+def generate(conn, args):
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(args.seed)
+    cur = conn.cursor()
+    if args.reset:
+        cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE;")
+    cur.execute("INSERT INTO roles (role_name) VALUES ('student'), ('admin') ON CONFLICT (role_name) DO NOTHING;")
+    cur.execute("SELECT role_name, role_id FROM roles;")
+    roles = dict(cur.fetchall())
+    # After migration 0002: one partition per generated month, so old rows don't pile up in *_default
+    cur.execute("SELECT to_regproc('ensure_month_partition') IS NOT NULL;")
+    if cur.fetchone()[0]:
+        cur.execute("""
+            SELECT ensure_month_partition(parent, month::date)
+            FROM unnest(ARRAY['bookings', 'payments']) AS parent,
+                 generate_series(DATE_TRUNC('month', CURRENT_DATE - %s * INTERVAL '1 year'),
+                                 CURRENT_DATE + INTERVAL '3 months', INTERVAL '1 month') AS month;
+        """, (args.years,))
+
+    rooms, bookings, payments = [], [], []
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    copy_rows(cur, 'hostels', ('hostel_id', 'hostel_name', 'hostel_location', 'hostel_total_rooms',
+                               'hostel_description', 'hostel_image'), hostel_rows(args, rng))
+    copy_rows(cur, 'rooms', ('room_id', 'room_hostel_id', 'room_number', 'room_type', 'room_capacity',
+                             'room_price_per_sem'), room_rows(args, rng, rooms))
+    copy_rows(cur, 'room_images', ('image_room_id', 'image_url'), room_image_rows(rooms))
+    copy_rows(cur, 'users', ('user_id', 'user_email', 'user_phone_number', 'user_first_name', 'user_last_name',
+                             'user_gender', 'user_password_hash'), user_rows(args, rng, password_hash))
+    copy_rows(cur, 'user_profile', ('profile_user_id', 'profile_account_balance', 'profile_emergency_contact',
+                                    'profile_student_id'), profile_rows(args, rng))
+    copy_rows(cur, 'user_roles', ('user_role_user_id', 'user_role_role_id'), user_role_rows(args, roles))
+    copy_rows(cur, 'bookings', ('booking_id', 'booking_reference_number', 'booking_user_id', 'booking_room_id',
+                                'booking_date', 'booking_status'), booking_rows(args, rng, rooms, bookings))
+    copy_rows(cur, 'payments', ('payment_id', 'payment_reference_number', 'payment_amount', 'payment_method',
+                                'payment_date', 'payment_status'), payment_rows(rng, rooms, bookings, payments))
+    copy_rows(cur, 'allocations', ('allocation_booking_id', 'allocation_payment_id', 'allocation_date',
+                                   'allocation_vaccate_date'), allocation_rows(payments))
+
+    # Explicit ids bypassed the sequences
+    for table, column in (('hostels', 'hostel_id'), ('rooms', 'room_id'), ('users', 'user_id'),
+                          ('bookings', 'booking_id'), ('payments', 'payment_id')):
+        cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                    f"COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false);")
+    conn.commit()
+
+    conn.autocommit = True
+    cur.execute("ANALYZE;")
+    cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hostels', type=int, default=50)
+    parser.add_argument('--rooms', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=100000, help='Including the admin account')
+    parser.add_argument('--bookings', type=int, default=500000)
+    parser.add_argument('--years', type=int, default=4, help='How far back booking dates go')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='Truncate the application tables first')
+    args = parser.parse_args()
+    if args.users < 2 or args.rooms < args.hostels:
+        parser.error('need at least one student and one room per hostel')
+
+    import psycopg2
+    from app.db.db import POSTGRES_CONFIG
+
+    started = time.perf_counter()
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    try:
+        generate(conn, args)
+    finally:
+        conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f} s. "
+          f"Sign in as {ADMIN_EMAIL} or {STUDENT_EMAIL.format(2)} with password '{BENCH_PASSWORD}'")
+
+
+if __name__ == '__main__':
+    main()
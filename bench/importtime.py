@@ -0,0 +1,76 @@
+"""Cold start regression check.
+
+Runs `python -X importtime` on a fresh interpreter that imports the app and
+calls create_app(), then fails if the cumulative import time goes over the
+budget or if a module we only want loaded on demand shows up at startup.
+
+    python bench/importtime.py --budget-ms 600 --top 15
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy packages that must stay behind a lazy import
+LAZY_MODULES = ('weasyprint', 'PIL', 'matplotlib', 'bson', 'pymongo', 'flask_pymongo', 'boto3')
+
+STARTUP_CODE = 'from app import create_app; create_app()'
+
+
+def run_importtime(code=STARTUP_CODE):
+    """Import timings of a cold interpreter as [(module, self_us, cumulative_us)]"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"Startup failed with exit code {result.returncode}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Indentation marks nesting; only top level imports add up to the total
+        timings.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', 800)))
+    parser.add_argument('--top', type=int, default=10, help='Show the N slowest modules')
+    parser.add_argument('--runs', type=int, default=3, help='Take the best of N cold starts')
+    args = parser.parse_args()
+
+    best_total, best_timings = None, None
+    for _ in range(args.runs):
+        timings = run_importtime()
+        total = sum(cumulative for name, _, cumulative in timings if not name.startswith(' ' * 2))
+        if best_total is None or total < best_total:
+            best_total, best_timings = total, timings
+
+    print(f"Cold start imports: {best_total / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("Slowest modules by self time:")
+    for name, self_us, cumulative_us in sorted(best_timings, key=lambda t: t[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name.strip()}")
+
+    failures = []
+    loaded = {name.strip().split('.')[0] for name, _, _ in best_timings}
+    eager = [module for module in LAZY_MODULES if module in loaded]
+    if eager:
+        failures.append(f"Imported at startup but should be lazy: {', '.join(eager)}")
+    if best_total / 1000 > args.budget_ms:
+        failures.append(f"Cold start {best_total / 1000:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""Registration-week load test.
+
+Virtual students sign in, browse /student/rooms with filters, open rooms,
+race each other for a handful of popular rooms through
+/student/bookings/create and pay through /student/payments/process, while a
+few admins poll the dashboard and export reports. Users are added and
+removed following a ramp profile, and the run ends with a JSON and HTML
+report of throughput, error rate and latency percentiles per endpoint.
+
+Load data with bench/datagen.py first, then point it at a running instance
+(or let it start one):
+
+    python bench/loadtest.py --host http://127.0.0.1:8000 --profile smoke
+    python bench/loadtest.py --start gunicorn --profile registration-week --report bench/results/load
+    python bench/loadtest.py --start gunicorn --stages 30:50,120:400,60:400,30:0
+
+Every virtual user is a thread, so a single load generator tops out at a
+few thousand users; run several with --first-student offsets past that.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.datagen import ADMIN_EMAIL, STUDENT_EMAIL, BENCH_PASSWORD  # noqa: E402
+from bench.bench_server import free_port, server_command, wait_until_up, percentile  # noqa: E402
+
+# Ramp profiles: (seconds, users) stages, ramping linearly to `users` over `seconds`
+PROFILES = {
+    'smoke': [(10, 10), (20, 10), (5, 0)],
+    'registration-week': [(60, 200), (120, 1000), (300, 1000), (60, 2000), (120, 2000), (60, 0)],
+    'soak': [(60, 300), (1800, 300), (30, 0)],
+}
+ADMIN_SHARE = 0.02
+REQUEST_TIMEOUT = 60
+ROOM_FILTERS = [
+    {}, {'type': 'Single'}, {'type': 'Double'}, {'type': 'Shared'},
+    {'price_max': '30000'}, {'price_min': '30000', 'price_max': '45000'}, {'capacity': '2'}, {'search': 'Hostel 00'},
+]
+
+
+####################### STATS ###########################
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.timeline = {}
+        self.started = time.monotonic()
+
+    def record(self, name, duration, outcome):
+        second = int(time.monotonic() - self.started)
+        with self._lock:
+            entry = self.endpoints.setdefault(name, {'latencies': [], 'ok': 0, 'rejected': 0, 'failed': 0})
+            entry['latencies'].append(duration)
+            entry[outcome] += 1
+            tick = self.timeline.setdefault(second, {'requests': 0, 'failed': 0, 'users': 0})
+            tick['requests'] += 1
+            tick['failed'] += outcome == 'failed'
+
+    def users(self, count):
+        second = int(time.monotonic() - self.started)
+        with self._lock:
+            self.timeline.setdefault(second, {'requests': 0, 'failed': 0, 'users': 0})['users'] = count
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name, entry in sorted(self.endpoints.items()):
+            latencies = sorted(entry['latencies'])
+            total = len(latencies)
+            endpoints[name] = {
+                'requests': total,
+                'ok': entry['ok'],
+                'rejected': entry['rejected'],
+                'failed': entry['failed'],
+                'error_rate': round(entry['failed'] / total, 4) if total else 0.0,
+                'rps': round(total / elapsed, 2),
+                **{f"p{pct}_ms": round(percentile(latencies, pct) * 1000, 1) for pct in (50, 90, 95, 99)},
+                'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            }
+        timeline = [{'second': second, **tick} for second, tick in sorted(self.timeline.items())]
+        return {'elapsed_s': round(elapsed, 1), 'endpoints': endpoints, 'timeline': timeline}
+
+
+####################### VIRTUAL USERS ###########################
+class Session:
+    """One browser: its own cookie jar, every request timed under a readable name"""
+
+    def __init__(self, base_url, stats):
+        self.base_url = base_url
+        self.stats = stats
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, name, path, params=None, json_body=None, form=None):
+        url = self.base_url + path + (f"?{urllib.parse.urlencode(params)}" if params else '')
+        headers, data = {}, None
+        if json_body is not None:
+            data, headers['Content-Type'] = json.dumps(json_body).encode(), 'application/json'
+        elif form is not None:
+            data, headers['Content-Type'] = urllib.parse.urlencode(form).encode(), 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        body, outcome = None, 'ok'
+        try:
+            with self.opener.open(urllib.request.Request(url, data=data, headers=headers),
+                                  timeout=REQUEST_TIMEOUT) as response:
+                raw = response.read()
+                if 'json' in response.headers.get('Content-Type', ''):
+                    body = json.loads(raw)
+                    # The app answers business refusals ("room is not available") with 200 + success: false
+                    if isinstance(body, dict) and body.get('success') is False:
+                        outcome = 'rejected'
+        except urllib.error.HTTPError as e:
+            outcome = 'rejected' if e.code < 500 else 'failed'
+        except (urllib.error.URLError, OSError, ValueError):
+            outcome = 'failed'
+        self.stats.record(name, time.perf_counter() - started, outcome)
+        return body, outcome
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, session, email, ctx):
+        super().__init__(daemon=True)
+        self.session = session
+        self.email = email
+        self.ctx = ctx
+        self.rng = random.Random()
+        self.stop_event = threading.Event()
+
+    def think(self, low=1.0, high=4.0):
+        self.stop_event.wait(self.rng.uniform(low, high) * self.ctx['think'])
+
+    def run(self):
+        _, outcome = self.session.request('POST /login', '/login',
+                                          json_body={'email': self.email, 'password': BENCH_PASSWORD})
+        if outcome != 'ok':
+            return
+        while not self.stop_event.is_set():
+            self.iteration()
+
+    def iteration(self):
+        raise NotImplementedError
+
+
+class Student(VirtualUser):
+    def iteration(self):
+        filters = dict(self.rng.choice(ROOM_FILTERS), page=self.rng.choice((1, 1, 1, 2, 3)))
+        self.session.request('GET /student/rooms', '/student/rooms', params=filters)
+        self.think()
+
+        room_id = self.rng.randint(1, self.ctx['rooms'])
+        self.session.request('GET /student/rooms/<id>', f"/student/rooms/{room_id}")
+        self.think()
+
+        if self.rng.random() < 0.3:
+            # Everyone wants the same few rooms
+            body, outcome = self.session.request('POST /student/bookings/create', '/student/bookings/create',
+                                                 json_body={'room_id': self.rng.randint(1, self.ctx['hot_rooms'])})
+            if outcome == 'ok' and body and body.get('booking_id') and not body.get('payment_reference'):
+                self.think(0.5, 2)
+                self.session.request('POST /student/payments/process', '/student/payments/process', form={
+                    'payment_method': 'mpesa', 'booking_id': body['booking_id'],
+                    'amount': self.rng.choice((15000, 25000, 45000)), 'phone_number': '0712345678',
+                })
+        elif self.rng.random() < 0.3:
+            self.session.request('GET /student/bookings', '/student/bookings')
+        self.think()
+
+
+class Admin(VirtualUser):
+    def iteration(self):
+        self.session.request('GET /admin/dashboard', '/admin/dashboard')
+        self.think(3, 6)
+        if self.rng.random() < 0.1:
+            self.session.request('GET /admin/reports', '/admin/reports')
+            self.session.request('GET /admin/reports/export/csv', '/admin/reports/export/csv')
+        elif self.rng.random() < 0.1:
+            self.session.request('GET /admin/bookings', '/admin/bookings')
+        self.think(3, 6)
+
+
+####################### RAMP ###########################
+def parse_stages(text):
+    stages = []
+    for part in text.split(','):
+        seconds, users = part.split(':')
+        stages.append((float(seconds), int(users)))
+    return stages
+
+
+def target_users(stages, elapsed):
+    """Users wanted `elapsed` seconds in, or None once the profile is over"""
+    previous = 0
+    for seconds, users in stages:
+        if elapsed < seconds:
+            return int(round(previous + (users - previous) * elapsed / seconds))
+        elapsed -= seconds
+        previous = users
+    return None
+
+
+def run_load(base_url, stages, ctx):
+    stats = Stats()
+    active, next_student = [], ctx['first_student']
+    started = time.monotonic()
+    while True:
+        target = target_users(stages, time.monotonic() - started)
+        if target is None:
+            break
+        active = [user for user in active if user.is_alive()]
+        while len(active) < target:
+            admins = sum(isinstance(user, Admin) for user in active)
+            if admins < max(1, int(target * ADMIN_SHARE)):
+                user = Admin(Session(base_url, stats), ADMIN_EMAIL, ctx)
+            else:
+                user = Student(Session(base_url, stats), STUDENT_EMAIL.format(next_student), ctx)
+                next_student = ctx['first_student'] + (next_student + 1 - ctx['first_student']) % ctx['students']
+            user.start()
+            active.append(user)
+        while len(active) > target:
+            active.pop().stop_event.set()
+        stats.users(len(active))
+        time.sleep(1)
+
+    for user in active:
+        user.stop_event.set()
+    for user in active:
+        user.join(timeout=REQUEST_TIMEOUT)
+    return stats.summary(time.monotonic() - started)
+
+
+####################### REPORT ###########################
+def _chart(timeline, width=900, height=220):
+    if not timeline:
+        return ''
+    last = timeline[-1]['second'] or 1
+    top_rps = max(tick['requests'] for tick in timeline) or 1
+    top_users = max(tick['users'] for tick in timeline) or 1
+
+    def line(key, top, colour):
+        points = ' '.join(f"{40 + tick['second'] * (width - 60) / last:.1f},"
+                          f"{height - 20 - tick[key] * (height - 40) / top:.1f}" for tick in timeline)
+        return f'<polyline fill="none" stroke="{colour}" stroke-width="1.5" points="{points}"/>'
+
+    return (f'<svg width="{width}" height="{height}" font-size="11" font-family="sans-serif">'
+            f'<text x="40" y="12" fill="#2a7">requests/s (max {top_rps})</text>'
+            f'<text x="260" y="12" fill="#36c">users (max {top_users})</text>'
+            f'<text x="480" y="12" fill="#c33">failures/s</text>'
+            f'{line("requests", top_rps, "#2a7")}{line("users", top_users, "#36c")}{line("failed", top_rps, "#c33")}'
+            f'<text x="40" y="{height - 4}">0 s</text><text x="{width - 60}" y="{height - 4}">{last} s</text></svg>')
+
+
+def render_html(report):
+    rows = ''.join(
+        f"<tr><td>{name}</td><td>{e['requests']}</td><td>{e['rps']}</td><td>{e['rejected']}</td>"
+        f"<td class=\"{'bad' if e['error_rate'] > 0.01 else ''}\">{e['error_rate'] * 100:.2f}%</td>"
+        f"<td>{e['p50_ms']}</td><td>{e['p90_ms']}</td><td>{e['p95_ms']}</td><td>{e['p99_ms']}</td><td>{e['max_ms']}</td></tr>"
+        for name, e in report['endpoints'].items())
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Load test: {report['profile']}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2rem; color: #222; }}
+table {{ border-collapse: collapse; }}
+td, th {{ padding: 4px 10px; border-bottom: 1px solid #ddd; text-align: right; }}
+td:first-child, th:first-child {{ text-align: left; font-family: monospace; }}
+.bad {{ color: #c33; font-weight: bold; }}
+</style></head>
+<body>
+<h1>Load test: {report['profile']}</h1>
+<p>{report['base_url']} &middot; commit {report['commit']} &middot; {report['elapsed_s']} s &middot;
+stages {report['stages']}</p>
+{_chart(report['timeline'])}
+<table>
+<tr><th>Endpoint</th><th>Requests</th><th>req/s</th><th>Rejected</th><th>Errors</th>
+<th>p50 ms</th><th>p90 ms</th><th>p95 ms</th><th>p99 ms</th><th>max ms</th></tr>
+{rows}
+</table>
+</body></html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='http://127.0.0.1:8000', help='Running instance to load')
+    parser.add_argument('--start', choices=('dev', 'gunicorn'), help='Start a local server instead of using --host')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='smoke')
+    parser.add_argument('--stages', help='Custom ramp, e.g. 30:50,120:400,30:0 (seconds:users)')
+    parser.add_argument('--students', type=int, default=99999, help='How many bench students exist')
+    parser.add_argument('--first-student', type=int, default=2, help='First student number to sign in as')
+    parser.add_argument('--rooms', type=int, default=20000, help='Room ids to browse (1..N)')
+    parser.add_argument('--hot-rooms', type=int, default=10, help='Room ids everyone tries to book (1..N)')
+    parser.add_argument('--think', type=float, default=1.0, help='Think time multiplier')
+    parser.add_argument('--report', default=os.path.join(ROOT, 'bench', 'results', 'loadtest'),
+                        help='Report path without extension; .json and .html are written')
+    args = parser.parse_args()
+
+    stages = parse_stages(args.stages) if args.stages else PROFILES[args.profile]
+    ctx = {'students': args.students, 'first_student': args.first_student, 'rooms': args.rooms,
+           'hot_rooms': args.hot_rooms, 'think': args.think}
+
+    proc = None
+    base_url = args.host.rstrip('/')
+    if args.start:
+        port = free_port()
+        proc = subprocess.Popen(server_command(args.start, port), cwd=ROOT,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{port}"
+        if not wait_until_up(port):
+            proc.terminate()
+            raise SystemExit(f"{args.start} server did not come up")
+    try:
+        report = run_load(base_url, stages, ctx)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    report.update({'profile': args.stages or args.profile, 'stages': stages, 'base_url': base_url,
+                   'commit': commit.stdout.strip() or None})
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report + '.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(args.report + '.html', 'w') as f:
+        f.write(render_html(report))
+
+    print(f"{'endpoint':<34} {'reqs':>7} {'req/s':>7} {'rej':>6} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, e in report['endpoints'].items():
+        print(f"{name:<34} {e['requests']:>7} {e['rps']:>7} {e['rejected']:>6} {e['error_rate'] * 100:>6.2f} "
+              f"{e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8}")
+    print(f"Report written to {args.report}.json and {args.report}.html")
+
+
+if __name__ == '__main__':
+    main()
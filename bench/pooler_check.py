@@ -0,0 +1,183 @@
+"""Run the app behind a transaction-mode pooler and check that it still behaves.
+
+Starts gunicorn twice against the same database, once straight at Postgres
+and once through PgBouncer in transaction mode (see pgbouncer.ini), drives
+the same load-test stages at both, and compares:
+
+  * failed requests: both runs use POSTGRES_POOL_STRICT=1, so any statement
+    that would leave session state on a pooled connection fails its request;
+  * booking invariants after each run: no student ends up with two active
+    bookings, and no room takes more new bookings than it had spots left
+    (create_booking's row lock has to hold within one pooled transaction);
+  * peak Postgres backends used by the app, sampled from pg_stat_activity,
+    which is what the pooler is there to save.
+
+Load data with bench/datagen.py, start PgBouncer, then:
+
+    pgbouncer pgbouncer.ini &
+    python bench/pooler_check.py --pooler 127.0.0.1:6432 --workers 8 --threads 4
+
+POSTGRES_* in the environment must point at Postgres itself.
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.bench_server import free_port, server_command, wait_until_up  # noqa: E402
+from bench.loadtest import run_load, parse_stages  # noqa: E402
+
+DEFAULT_STAGES = '10:40,30:40,5:0'
+ACTIVE = ('Pending', 'Confirmed')
+
+
+class BackendSampler(threading.Thread):
+    """Peak number of client backends connected to the database while the load runs"""
+
+    def __init__(self, conn, interval=0.25):
+        super().__init__(daemon=True)
+        self.conn = conn
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        cur = self.conn.cursor()
+        while not self.stop_event.is_set():
+            cur.execute("""
+                SELECT COUNT(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid();
+            """)
+            self.peak = max(self.peak, cur.fetchone()[0])
+            self.conn.rollback()
+            self.stop_event.wait(self.interval)
+        cur.close()
+
+
+def snapshot(cur, hot_rooms):
+    """Where bookings stand before a run: last booking id and spots left in each hot room"""
+    cur.execute("SELECT COALESCE(MAX(booking_id), 0) FROM bookings;")
+    last_booking = cur.fetchone()[0]
+    cur.execute("""
+        SELECT r.room_id, r.room_capacity - COUNT(b.booking_id)
+        FROM rooms r
+        LEFT JOIN bookings b ON b.booking_room_id = r.room_id AND b.booking_status = ANY(%s)
+        WHERE r.room_id <= %s
+        GROUP BY r.room_id;
+    """, (list(ACTIVE), hot_rooms))
+    return last_booking, dict(cur.fetchall())
+
+
+def invariant_violations(cur, last_booking, spots_left):
+    violations = []
+    cur.execute("""
+        SELECT booking_user_id, COUNT(*) FROM bookings
+        WHERE booking_id > %s AND booking_status = ANY(%s)
+        GROUP BY booking_user_id HAVING COUNT(*) > 1;
+    """, (last_booking, list(ACTIVE)))
+    violations += [f"student {user_id} got {count} active bookings" for user_id, count in cur.fetchall()]
+    cur.execute("""
+        SELECT booking_room_id, COUNT(*) FROM bookings
+        WHERE booking_id > %s AND booking_status = ANY(%s)
+        GROUP BY booking_room_id;
+    """, (last_booking, list(ACTIVE)))
+    for room_id, count in cur.fetchall():
+        allowed = max(0, spots_left.get(room_id, count))
+        if count > allowed:
+            violations.append(f"room {room_id} took {count} bookings with {allowed} spots left")
+    return violations
+
+
+def run(name, env, conn, args, ctx):
+    cur = conn.cursor()
+    last_booking, spots_left = snapshot(cur, args.hot_rooms)
+    conn.rollback()
+
+    port = free_port()
+    proc = subprocess.Popen(server_command('gunicorn', port), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_until_up(port):
+        proc.terminate()
+        raise SystemExit(f"gunicorn ({name}) did not come up")
+    sampler = BackendSampler(conn)
+    sampler.start()
+    try:
+        report = run_load(f"http://127.0.0.1:{port}", parse_stages(args.stages), ctx)
+    finally:
+        sampler.stop_event.set()
+        sampler.join()
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    violations = invariant_violations(cur, last_booking, spots_left)
+    conn.rollback()
+    cur.close()
+    requests = sum(e['requests'] for e in report['endpoints'].values())
+    failed = sum(round(e['requests'] * e['error_rate']) for e in report['endpoints'].values())
+    return {
+        'requests': requests,
+        'failed': failed,
+        'app_connections': args.workers * args.threads,
+        'peak_backends': sampler.peak,
+        'violations': violations,
+        'endpoints': report['endpoints'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pooler', default='127.0.0.1:6432', help='host:port of PgBouncer (pool_mode = transaction)')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--stages', default=DEFAULT_STAGES, help='Load ramp as seconds:users,...')
+    parser.add_argument('--students', type=int, default=99999, help='How many bench students exist')
+    parser.add_argument('--rooms', type=int, default=20000, help='Room ids to browse (1..N)')
+    parser.add_argument('--hot-rooms', type=int, default=10, help='Room ids everyone tries to book (1..N)')
+    parser.add_argument('--skip-direct', action='store_true', help='Only run through the pooler')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'bench', 'results', 'pooler-check.json'))
+    args = parser.parse_args()
+
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+    from app.db.db import POSTGRES_CONFIG
+
+    host, _, port = args.pooler.rpartition(':')
+    base_env = dict(os.environ, WEB_CONCURRENCY=str(args.workers), WEB_THREADS=str(args.threads),
+                    POSTGRES_POOL_MAX=str(args.threads), POSTGRES_POOL_STRICT='1', LOG_LEVEL='WARNING')
+    direct_url = make_dsn(host=POSTGRES_CONFIG['host'], port=POSTGRES_CONFIG['port'])
+    runs = {} if args.skip_direct else {'direct': dict(base_env, POSTGRES_POOL_MODE='session')}
+    runs['pgbouncer'] = dict(base_env, POSTGRES_HOST=host, POSTGRES_PORT=port, POSTGRES_POOL_MODE='transaction',
+                             POSTGRES_DIRECT_URL=direct_url)
+
+    # Both runs start from roughly the same state: each signs in a different slice of students
+    half = args.students // 2
+    conn = psycopg2.connect(**POSTGRES_CONFIG)
+    results = {}
+    try:
+        for index, (name, env) in enumerate(runs.items()):
+            ctx = {'students': half, 'first_student': 2 + index * half, 'rooms': args.rooms,
+                   'hot_rooms': args.hot_rooms, 'think': 1.0}
+            results[name] = run(name, env, conn, args, ctx)
+    finally:
+        conn.close()
+
+    print(f"{'run':<10} {'requests':>9} {'failed':>7} {'app conns':>10} {'PG backends':>12}  invariants")
+    for name, result in results.items():
+        print(f"{name:<10} {result['requests']:>9} {result['failed']:>7} {result['app_connections']:>10} "
+              f"{result['peak_backends']:>12}  {'; '.join(result['violations']) or 'ok'}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if any(result['failed'] or result['violations'] for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Production server settings.
+
+    gunicorn -c gunicorn.conf.py
+
+Each worker builds its own app, so the Postgres pool is opened after the
+fork and no connection is ever shared between processes. Workers warm
+their pool and templates before they are handed any traffic.
+
+Graceful reload with no dropped requests:
+    kill -HUP <master pid>     new workers with fresh code, old ones finish their requests
+Upgrading gunicorn itself:
+    kill -USR2 <master pid>    then -WINCH and -QUIT the old master once the new one is up
+"""
+import os
+import multiprocessing
+
+# WEB_ASGI=1 serves asgi:app on uvicorn workers: the JSON endpoints that mostly wait on
+# Postgres run as coroutines on their own asyncpg pool, the rest of the app on threads as before
+asgi = os.getenv('WEB_ASGI') == '1'
+wsgi_app = 'asgi:app' if asgi else 'run:app'
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+
+# Postgres only takes so many clients; every worker holds up to POSTGRES_POOL_MAX (plus POSTGRES_ASYNC_POOL_MAX under ASGI),
+# and one LISTEN connection for the live admin stats (app/services/live_stats.py).
+# Behind a transaction-mode pooler the limit is the pooler's max_client_conn instead.
+pool_max = int(os.getenv('POSTGRES_POOL_MAX', 10))
+pooled = os.getenv('POSTGRES_POOL_MODE') == 'transaction'
+db_max_connections = int(os.getenv('POSTGRES_MAX_CONNECTIONS', 1000 if pooled else 100))
+async_pool_max = int(os.getenv('POSTGRES_ASYNC_POOL_MAX', 20)) if asgi else 0
+
+# Views block on Postgres, so threads help; one pooled connection per thread
+worker_class = 'uvicorn_worker.UvicornWorker' if asgi else 'gthread'
+threads = int(os.getenv('WEB_THREADS', min(4, pool_max)))
+workers = int(os.getenv('WEB_CONCURRENCY', max(1, min(
+    multiprocessing.cpu_count() * 2 + 1,
+    db_max_connections // (pool_max + async_pool_max + 1),
+))))
+
+# Not preloaded: HUP then re-imports the app, and nothing DB-related exists before fork
+preload_app = False
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks can't build up
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Next months' bookings/payments partitions; the master runs this once per deploy
+    from app.db.migrate import connect
+    from app.db.partitions import ensure_partitions
+    try:
+        conn = connect()
+        try:
+            ensure_partitions(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        server.log.warning("Could not create upcoming partitions: %s", e)
+
+
+def post_worker_init(worker):
+    from app.services.warmup import warm_up
+    # Under ASGI, worker.wsgi is the app/asgi.py wrapper around the Flask app
+    warm_up(getattr(worker.wsgi, 'flask_app', worker.wsgi), min(threads, pool_max))
+
+
+def worker_exit(server, worker):
+    from app.db.db import close_db_pool, close_replica_pools
+    close_db_pool()
+    close_replica_pools()
@@ -0,0 +1,40 @@
+import pytest
+from flask import Flask
+from app.db.instrumentation import (QueryBudgetExceeded, init_sql_instrumentation, notify_query_listeners,
+                                    query_budget)
+
+
+def make_app(strict):
+    app = Flask(__name__)
+    app.testing = True
+    init_sql_instrumentation(app)
+    app.config['SQL_STRICT_BUDGET'] = strict
+
+    @app.route('/within')
+    @query_budget(2)
+    def within():
+        for _ in range(2):
+            notify_query_listeners(None, "SELECT 1", 0.001)
+        return 'ok'
+
+    @app.route('/over')
+    @query_budget(2)
+    def over():
+        for _ in range(3):
+            notify_query_listeners(None, "SELECT 1", 0.001)
+        return 'ok'
+
+    return app
+
+
+def test_strict_budget_fails_views_over_their_budget():
+    client = make_app(strict=True).test_client()
+    assert client.get('/within').status_code == 200
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/over')
+
+
+def test_budget_is_only_reported_when_not_strict():
+    response = make_app(strict=False).test_client().get('/over')
+    assert response.status_code == 200
+    assert '3 queries' in response.headers['Server-Timing']
@@ -0,0 +1,12 @@
+from app.services.live_stats import MAX_ROOMS_PER_STREAM, requested_rooms
+
+
+def test_requested_rooms():
+    assert requested_rooms('3,1, 2,,x,-4,2') == frozenset({1, 2, 3})
+    assert requested_rooms('') == frozenset()
+    assert requested_rooms(None) == frozenset()
+
+
+def test_requested_rooms_is_capped():
+    value = ','.join(str(room) for room in range(MAX_ROOMS_PER_STREAM * 2, 0, -1))
+    assert requested_rooms(value) == frozenset(range(1, MAX_ROOMS_PER_STREAM + 1))
@@ -0,0 +1,35 @@
+import pytest
+from flask import Flask
+from app.services import metrics
+
+
+def make_app(tmp_path, token=None):
+    app = Flask(__name__)
+    app.config['METRICS_DIR'] = str(tmp_path)
+    app.config['METRICS_TOKEN'] = token
+    metrics.init_metrics(app)
+    return app
+
+
+@pytest.mark.parametrize('remote_addr, headers, status', [
+    ('127.0.0.1', {}, 200),
+    ('::1', {}, 200),
+    ('10.0.0.7', {}, 403),
+    ('127.0.0.1', {'X-Forwarded-For': '203.0.113.9'}, 403),
+])
+def test_without_a_token_only_local_scrapes_are_allowed(tmp_path, remote_addr, headers, status):
+    client = make_app(tmp_path).test_client()
+    response = client.get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': remote_addr})
+    assert response.status_code == status
+
+
+@pytest.mark.parametrize('authorization, status', [
+    ('Bearer secret', 200),
+    ('Bearer wrong', 403),
+    (None, 403),
+])
+def test_token_is_required_when_set(tmp_path, authorization, status):
+    client = make_app(tmp_path, token='secret').test_client()
+    headers = {'Authorization': authorization} if authorization else {}
+    response = client.get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': '10.0.0.7'})
+    assert response.status_code == status
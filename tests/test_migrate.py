@@ -0,0 +1,55 @@
+import pytest
+from app.db.migrate import Migration, MigrationError, apply_migration
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.connection.statements.append(' '.join(query.split()))
+        self.rows = [(name,) for name in self.connection.invalid] if 'indisvalid' in query else []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, invalid=()):
+        self.invalid = invalid
+        self.statements = []
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+CONCURRENT = Migration(
+    version=1, name='hot_path_indexes', path='0001_hot_path_indexes.sql',
+    sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON a (b);\n', checksum='0' * 64, transactional=False,
+)
+
+
+def test_concurrent_migration_refuses_invalid_indexes():
+    conn = FakeConnection(invalid=['idx_a'])
+    with pytest.raises(MigrationError, match='idx_a'):
+        apply_migration(conn, CONCURRENT)
+    assert not any(statement.startswith('CREATE INDEX') for statement in conn.statements)
+    assert conn.autocommit is False
+
+
+def test_concurrent_migration_runs_without_invalid_indexes():
+    conn = FakeConnection()
+    apply_migration(conn, CONCURRENT)
+    assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON a (b)' in conn.statements
+    assert any(statement.startswith('INSERT INTO schema_migrations') for statement in conn.statements)
@@ -0,0 +1,25 @@
+from datetime import date
+import pytest
+from app.db.partitions import archive_cutoff, semester_of
+
+
+@pytest.mark.parametrize('day, semester', [
+    (date(2024, 1, 1), (2024, 1)),
+    (date(2024, 4, 30), (2024, 1)),
+    (date(2024, 5, 1), (2024, 2)),
+    (date(2024, 8, 31), (2024, 2)),
+    (date(2024, 9, 1), (2024, 3)),
+    (date(2024, 12, 31), (2024, 3)),
+])
+def test_semester_of(day, semester):
+    assert semester_of(day) == semester
+
+
+@pytest.mark.parametrize('retention, today, cutoff', [
+    (0, date(2024, 6, 15), date(2024, 5, 1)),
+    (1, date(2024, 6, 15), date(2024, 1, 1)),
+    (2, date(2024, 2, 1), date(2023, 5, 1)),
+    (6, date(2024, 10, 1), date(2022, 9, 1)),
+])
+def test_archive_cutoff(retention, today, cutoff):
+    assert archive_cutoff(retention, today) == cutoff
@@ -0,0 +1,22 @@
+import pytest
+from app.db.pooler import session_state
+
+
+@pytest.mark.parametrize('statement, label', [
+    ("SET search_path TO archive", 'SET without LOCAL'),
+    ("RESET ALL", 'SET without LOCAL'),
+    ("SET LOCAL statement_timeout = 0", None),
+    ("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE", None),
+    ("/* request_id=abc, endpoint=x */ PREPARE q AS SELECT 1", 'prepared statement'),
+    ("LISTEN dashboard_changes", 'LISTEN'),
+    ("SELECT pg_advisory_lock(1)", 'session advisory lock'),
+    ("SELECT pg_advisory_xact_lock(1)", None),
+    ("CREATE TEMP TABLE t (a INT)", 'temporary table'),
+    ("CREATE TEMP TABLE t (a INT) ON COMMIT DROP", None),
+    ("DECLARE c CURSOR WITH HOLD FOR SELECT 1", 'cursor WITH HOLD'),
+    ("COMMIT", 'manual transaction control'),
+    ("ROLLBACK TO SAVEPOINT s", None),
+    ("SELECT * FROM bookings WHERE booking_status = 'Pending'", None),
+])
+def test_session_state(statement, label):
+    assert session_state(statement) == label
@@ -0,0 +1,28 @@
+import pytest
+from psycopg2 import sql
+from app.db.prepared import prepared
+
+
+def prepare_body(statement):
+    return [part.string for part in statement.prepare.seq if isinstance(part, sql.SQL)][-1]
+
+
+def test_placeholders_are_numbered_in_order():
+    statement = prepared('test_numbering', "SELECT %s, %s FROM t WHERE a LIKE 'x%%' AND b = %s;")
+    assert statement.params == 3
+    assert prepare_body(statement) == "SELECT $1, $2 FROM t WHERE a LIKE 'x%' AND b = $3"
+
+
+def test_statement_without_parameters():
+    statement = prepared('test_no_params', "SELECT 1")
+    assert statement.params == 0
+    assert prepare_body(statement) == "SELECT 1"
+
+
+def test_registry():
+    first = prepared('test_registry', "SELECT %s")
+    assert prepared('test_registry', "SELECT %s") is first
+    with pytest.raises(ValueError):
+        prepared('test_registry', "SELECT %s, %s")
+    with pytest.raises(ValueError):
+        prepared('Not-A-Name', "SELECT 1")
@@ -0,0 +1,36 @@
+from app.db.slow_queries import normalize
+
+
+def test_literals_and_placeholders_collapse():
+    assert normalize("SELECT * FROM users WHERE user_email = 'a@b.c' AND user_id = 42") == \
+        normalize("SELECT * FROM users WHERE user_email = %s AND user_id = %s")
+    assert normalize("SELECT * FROM users WHERE user_id = $1") == "SELECT * FROM users WHERE user_id = ?"
+
+
+def test_in_lists_of_any_length_collapse():
+    assert normalize("SELECT 1 FROM rooms WHERE room_id IN (1, 2, 3)") == \
+        "SELECT ? FROM rooms WHERE room_id IN (?, ...)"
+    assert normalize("SELECT 1 FROM rooms WHERE room_id IN (%s, %s)") == \
+        normalize("SELECT 1 FROM rooms WHERE room_id IN (4, 5, 6, 7)")
+
+
+def test_identifiers_and_whitespace():
+    assert normalize("SELECT  *\n  FROM bookings_p2024_01 t1\nWHERE t1.x = 'it''s';") == \
+        "SELECT * FROM bookings_p2024_01 t1 WHERE t1.x = ?"
+
+
+def test_reset_reaches_running_workers(tmp_path, monkeypatch):
+    from app.db import slow_queries
+
+    monkeypatch.setattr(slow_queries, '_settings', dict(slow_queries._settings, snapshot_dir=str(tmp_path),
+                                                        generation=0))
+    monkeypatch.setattr(slow_queries, '_aggregates', {'abc': {
+        'fingerprint': 'abc', 'query': 'SELECT ?', 'count': 1, 'total_ms': 250.0, 'max_ms': 250.0,
+        'samples': [250.0], 'plan': None, 'first_seen': 0.0}})
+    slow_queries.write_snapshot()
+    assert [row['fingerprint'] for row in slow_queries.top_offenders(str(tmp_path))] == ['abc']
+
+    # The CLI runs in another process: all this worker sees is the marker
+    (tmp_path / slow_queries.RESET_MARKER).write_text('1')
+    slow_queries.write_snapshot()
+    assert slow_queries.top_offenders(str(tmp_path)) == []
@@ -0,0 +1,24 @@
+import pytest
+from app.services.storage import LocalStorageBackend, StorageBackend
+
+
+def test_backend_missing_a_method_fails_when_created():
+    class NoDelete(StorageBackend):
+        def exists(self, key):
+            return False
+
+        def put_file(self, key, src_path, content_type=None):
+            pass
+
+        def open(self, key):
+            pass
+
+        def url_for(self, key):
+            return key
+
+    with pytest.raises(TypeError, match='delete'):
+        NoDelete()
+
+
+def test_local_backend_implements_the_interface(tmp_path):
+    assert isinstance(LocalStorageBackend(str(tmp_path), 'uploads/blobs'), StorageBackend)
@@ -0,0 +1,89 @@
+import pytest
+import app as app_package
+from app import create_app
+from app.db.instrumentation import notify_query_listeners
+from app.routes import student
+
+ROOMS = 15
+IMAGES_PER_ROOM = 2
+
+
+class FakeCursor:
+    """Answers the statements of load_user and available_rooms, reporting each one like the
+    instrumented cursors do"""
+
+    def __init__(self, connection, dicts):
+        self.connection = connection
+        self.dicts = dicts
+        self.rows = []
+
+    def execute(self, query, params=None):
+        statement = str(query)
+        notify_query_listeners(self, statement, 0.001)
+        if statement.startswith('PREPARE'):
+            self.rows = []
+        elif 'FROM users' in statement:
+            self.rows = [(5, 'student@example.com', 'Test', 'Student', 'Female', '0700000000')]
+        elif 'user_role_names' in statement:
+            self.rows = [('Student',)]
+        elif 'available_rooms' in statement:
+            self.rows = [{
+                'room_id': room, 'room_number': f"R{room:03d}", 'room_type': 'Double', 'room_capacity': 2,
+                'room_price_per_sem': 30000, 'hostel_id': 1, 'hostel_name': 'Hostel 001',
+                'hostel_location': 'Nairobi', 'hostel_description': '', 'spots_left': 1,
+            } for room in range(1, ROOMS + 1)]
+        elif 'FROM room_images' in statement:
+            self.rows = [{'image_room_id': room, 'image_url': f"room{room}_{n}.jpg"}
+                         for room in params[0] for n in range(IMAGES_PER_ROOM)]
+        elif 'FROM hostels' in statement:
+            self.rows = [{'hostel_id': 1, 'hostel_name': 'Hostel 001'}]
+        else:
+            raise AssertionError(f"Unexpected statement: {statement}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self, cursor_factory is not None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_package, 'get_db_connection', FakeConnection)
+    monkeypatch.setattr(app_package, 'release_db_connection', lambda conn: None)
+    monkeypatch.setattr(student, 'get_db_connection', FakeConnection)
+    monkeypatch.setattr(student, 'release_db_connection', lambda conn: None)
+    app = create_app()
+    app.config['SQL_STRICT_BUDGET'] = True
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '5'
+        session['_fresh'] = True
+    return client
+
+
+def test_rooms_page_fits_its_query_budget(client):
+    # Fresh connections for the user and the view: both PREPARE their statements
+    response = client.get('/student/rooms')
+    assert response.status_code == 200
+    assert 'desc="7 queries"' in response.headers['Server-Timing']
+    body = response.get_data(as_text=True)
+    assert 'room1_0.jpg' in body
+    assert 'room13_0.jpg' not in body
+
+
+def test_rooms_page_fetches_images_for_its_own_rooms(client):
+    response = client.get('/student/rooms?page=2')
+    assert response.status_code == 200
+    assert 'desc="7 queries"' in response.headers['Server-Timing']
+    body = response.get_data(as_text=True)
+    assert 'room13_0.jpg' in body
+    assert 'room1_0.jpg' not in body
@@ -0,0 +1,22 @@
+import os
+from app.services.storage import LocalStorageBackend, is_blob_key
+from app.services.uploads import process_receipt, receipt_keys, thumbnail_key_for
+
+CONTENT_HASH = 'ab' * 32
+
+
+def test_receipt_that_cannot_be_reencoded_is_kept_as_uploaded(tmp_path):
+    storage = LocalStorageBackend(str(tmp_path / 'blobs'), 'uploads/blobs')
+    upload = tmp_path / 'upload.part'
+    upload.write_bytes(b'\x89PNG\r\n\x1a\n' + b'not really a png')
+    storage_key, thumbnail_key = receipt_keys(CONTENT_HASH, 'image/png')
+
+    stored = process_receipt(storage, str(upload), 'image/png', storage_key, thumbnail_key)
+
+    assert stored == (f"{CONTENT_HASH}_original.png", None)
+    assert is_blob_key(stored[0])
+    assert thumbnail_key_for(stored[0]) is None
+    assert storage.exists(stored[0])
+    assert not storage.exists(storage_key)
+    assert not storage.exists(thumbnail_key)
+    assert not os.path.exists(upload)